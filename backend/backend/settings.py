@@ -143,4 +143,109 @@ REST_FRAMEWORK = {
 
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",
-]
\ No newline at end of file
+]
+# Inteligencia Artificial
+# Segundos durante los que el modelo en memoria se usa sin volver a comprobar
+# si hay una versión nueva (último ModeloIA y mtime del fichero).
+ML_MODELO_REVALIDACION_SEGUNDOS = 5
+
+# Número máximo de elementos aceptados por /api/ia/predecir-lote/
+ML_LOTE_MAXIMO = 5000
+
+# Entrenamientos en segundo plano: lanzar automáticamente un worker local
+# (manage.py procesar_entrenamientos --una-vez) al encolar un trabajo, cada
+# cuántos segundos registra el worker que sigue vivo, y segundos sin esa señal
+# tras los que un trabajo "en_curso" se considera abandonado.
+ML_ENTRENAMIENTO_LANZAR_WORKER = True
+ML_ENTRENAMIENTO_LATIDO_SEGUNDOS = 30
+ML_ENTRENAMIENTO_TIMEOUT_SEGUNDOS = 300
+
+# Filas de CaracteristicasResultado (una por resultado) leídas por bloque del
+# cursor de servidor al extraer el dataset de entrenamiento.
+ML_EXTRACCION_TAMAÑO_BLOQUE = 5000
+
+# Entrenamiento incremental: árboles añadidos por actualización y máximo de
+# árboles del bosque (se descartan los más antiguos).
+ML_INCREMENTAL_ARBOLES = 20
+ML_INCREMENTAL_MAX_ARBOLES = 500
+
+# Modo de apertura de los artefactos del modelo con joblib ('r' = memoria
+# compartida entre procesos vía mmap; None = copia privada en cada proceso).
+ML_MODELO_MMAP_MODE = 'r'
+
+# Búsqueda de hiperparámetros (opcional): presupuesto de tiempo por defecto,
+# presupuesto máximo que se puede pedir y latencia máxima por fila (ms) que
+# debe cumplir el modelo elegido (None = sin SLO).
+ML_BUSQUEDA_PRESUPUESTO_SEGUNDOS = 60
+ML_BUSQUEDA_PRESUPUESTO_MAX_SEGUNDOS = 900
+ML_LATENCIA_MAXIMA_MS = None
+
+# Usar el bosque aplanado en arrays de numpy para predecir (mismas salidas
+# que scikit-learn, sin su sobrecoste por llamada). En lotes grandes el
+# predict_proba compilado de scikit-learn vuelve a ser más rápido.
+ML_INFERENCIA_PLANA = True
+ML_INFERENCIA_PLANA_MAX_FILAS = 256
+
+# Caché de predicciones individuales por huella del vector de características
+# (entradas máximas por proceso y caducidad en segundos; 0 entradas = desactivada).
+ML_CACHE_PREDICCIONES_TAMAÑO = 10000
+ML_CACHE_PREDICCIONES_TTL = 3600
+
+# Escritura diferida de predicciones: se guardan por lotes al llegar a este
+# número de elementos o tras este intervalo (segundos). Si la BD falla, se
+# vuelcan a ficheros JSONL en ML_PREDICCIONES_PENDIENTES_DIR (por defecto
+# ml_models/predicciones_pendientes) y se reintentan.
+ML_PREDICCIONES_BUFFER_TAMAÑO = 500
+ML_PREDICCIONES_BUFFER_INTERVALO = 2
+
+# Snapshots Parquet del conjunto de entrenamiento (manage.py snapshot_entrenamiento).
+# Por defecto en ml_models/snapshots; requiere pyarrow.
+# ML_SNAPSHOTS_DIR = BASE_DIR / 'ml_models' / 'snapshots'
+
+# Precargar el modelo de IA en segundo plano al arrancar cada worker web
+# (wsgi.py / asgi.py). Estado de la precarga en /api/ia/listo/.
+ML_PRECARGA_MODELO = False
+
+# Servidor de inferencia local (manage.py servidor_inferencia). Con una ruta de
+# socket Unix, las predicciones se envían a ese proceso, que agrupa las
+# peticiones recibidas en VENTANA_MS milisegundos (hasta MAX_FILAS filas) en
+# una sola pasada. None = inferencia en cada proceso web.
+ML_SERVIDOR_INFERENCIA_SOCKET = None
+ML_SERVIDOR_INFERENCIA_VENTANA_MS = 2
+ML_SERVIDOR_INFERENCIA_MAX_FILAS = 256
+ML_SERVIDOR_INFERENCIA_TIMEOUT = 2.0
+
+# Modelos por segmento de instituciones (modo de entrenamiento "segmentos").
+# Campos de Institucion que definen el segmento, resultados mínimos para que un
+# segmento tenga modelo propio (si no, se usa el global), procesos del
+# entrenamiento en paralelo (-1 = todos los núcleos) y límites del registro en
+# memoria (modelos y MB de artefactos; se descartan los menos usados).
+ML_SEGMENTOS_CAMPOS = ('nivel_educativo', 'pais')
+ML_SEGMENTOS_MIN_MUESTRAS = 200
+ML_SEGMENTOS_PROCESOS = -1
+ML_SEGMENTOS_MAX_MODELOS = 20
+ML_SEGMENTOS_MEMORIA_MAX_MB = 512
+
+# Segundos que se guardan en caché las estadísticas de datos de entrenamiento
+# de estado_modelo_ia (se invalidan al escribir resultados o indicadores).
+ML_ESTADISTICAS_DATOS_TTL = 60
+
+# Presupuesto de los reportes agregados (encuestas.reportes): consultas SQL y
+# milisegundos por reporte. Si se supera se registra un aviso en el log.
+REPORTES_PRESUPUESTO_CONSULTAS = 6
+REPORTES_PRESUPUESTO_MS = 500
+
+# Segundos que se guarda cada reporte en la caché (encuestas.cache_reportes).
+# Las escrituras ya invalidan los reportes al cambiar la versión de datos
+# (guardada en la BD, común a todos los procesos); el TTL solo libera la
+# memoria de las entradas que han dejado de usarse.
+REPORTES_CACHE_TTL = 3600
+
+# Paginación del reporte comparativo de instituciones (por defecto y máximo
+# de instituciones por página, también límite de ?top=)
+REPORTES_COMPARATIVO_POR_PAGINA = 50
+REPORTES_COMPARATIVO_MAX_POR_PAGINA = 200
+
+# Filas que se leen de la BD en cada bloque al exportar datos en streaming
+# (encuestas.exportaciones); en PostgreSQL, con cursor de servidor
+EXPORTACION_CHUNK_SIZE = 2000
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 
 application = get_wsgi_application()
+
+# Precarga opcional del modelo de IA en segundo plano (ML_PRECARGA_MODELO)
+from encuestas.precarga import iniciar_precarga  # noqa: E402
+
+iniciar_precarga()
@@ -3,7 +3,9 @@ from .models import (
     Institucion, Rol, UsuarioPerfil,
     Encuesta, Pregunta, OpcionRespuesta, Respuesta,
     ResultadoEncuesta, Indicador, ResultadoIndicador,
-    ModeloIA, PrediccionIA, RecursoColaborativo
+    ModeloIA, PrediccionIA, RecursoColaborativo, TrabajoEntrenamiento,
+    TendenciaMensual, MomentosIndicadores, CaracteristicasResultado,
+    ContadoresDashboard, ContadorNivelMadurez, VersionDatos
 )
 
 admin.site.register(Institucion)
@@ -18,4 +20,11 @@ admin.site.register(Indicador)
 admin.site.register(ResultadoIndicador)
 admin.site.register(ModeloIA)
 admin.site.register(PrediccionIA)
-admin.site.register(RecursoColaborativo)
\ No newline at end of file
+admin.site.register(RecursoColaborativo)
+admin.site.register(TrabajoEntrenamiento)
+admin.site.register(TendenciaMensual)
+admin.site.register(MomentosIndicadores)
+admin.site.register(CaracteristicasResultado)
+admin.site.register(ContadoresDashboard)
+admin.site.register(ContadorNivelMadurez)
+admin.site.register(VersionDatos)
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class EncuestasConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'encuestas'
+
+    def ready(self):
+        # Registrar las señales que mantienen los agregados precalculados
+        from . import signals  # noqa: F401
@@ -0,0 +1,125 @@
+"""
+Caché versionada de los reportes (RF-004).
+
+Los reportes solo cambian cuando se puntúan encuestas, así que su respuesta
+se guarda en la caché de Django con la clave
+(endpoint, alcance, parámetros, versión de datos). Las señales incrementan
+la versión al escribir los modelos de los que dependen los reportes: las
+claves antiguas dejan de usarse sin tener que borrarlas una a una y caducan
+solas (REPORTES_CACHE_TTL).
+
+La versión se guarda en la base de datos (VersionDatos), no en la caché:
+con la caché local por defecto cada proceso tiene sus propias entradas, pero
+todos ven la misma versión y ninguno sirve un reporte anterior a una
+escritura hecha en otro proceso. Leerla cuesta una consulta por clave
+primaria. Es una fila propia y no un campo de ContadoresDashboard: el
+incremento (tras el commit) no hace cola tras las transacciones que tienen
+bloqueada la fila de contadores.
+
+Las métricas de aciertos y fallos son por proceso.
+"""
+
+import hashlib
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import VersionDatos
+
+FILA = 1
+
+
+def version_datos():
+    """Versión actual de los datos de los reportes."""
+    version = VersionDatos.objects.filter(pk=FILA).values_list('version', flat=True).first()
+    if version is None:
+        # BD sin la fila: se crea con una versión nueva
+        version = VersionDatos.objects.get_or_create(pk=FILA)[0].version
+    return version
+
+
+def incrementar_version():
+    """Invalidar todos los reportes cacheados, en todos los procesos."""
+    if not VersionDatos.objects.filter(pk=FILA).update(version=F('version') + 1):
+        # La fila nueva ya empieza en una versión distinta
+        VersionDatos.objects.get_or_create(pk=FILA)
+
+
+def _huella_parametros(parametros):
+    texto = '&'.join(
+        f"{clave}={','.join(parametros.getlist(clave))}" for clave in sorted(parametros)
+    )
+    return hashlib.sha1(texto.encode()).hexdigest()[:16]
+
+
+def clave_reporte(endpoint, alcance, parametros, version):
+    return f"encuestas:reporte:{endpoint}:{alcance}:{_huella_parametros(parametros)}:{version}"
+
+
+class MetricasCacheReportes:
+    """Aciertos y fallos de la caché por endpoint (del proceso actual)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._contadores = {}
+
+    def registrar(self, endpoint, acierto):
+        with self._lock:
+            contador = self._contadores.setdefault(endpoint, {"aciertos": 0, "fallos": 0})
+            contador["aciertos" if acierto else "fallos"] += 1
+
+    def estadisticas(self):
+        with self._lock:
+            por_endpoint = {
+                endpoint: dict(
+                    contador,
+                    tasa_aciertos=round(
+                        contador["aciertos"] / (contador["aciertos"] + contador["fallos"]), 4
+                    ),
+                )
+                for endpoint, contador in self._contadores.items()
+            }
+        aciertos = sum(c["aciertos"] for c in por_endpoint.values())
+        fallos = sum(c["fallos"] for c in por_endpoint.values())
+        return {
+            "version_datos": version_datos(),
+            "aciertos": aciertos,
+            "fallos": fallos,
+            "tasa_aciertos": round(aciertos / (aciertos + fallos), 4) if aciertos + fallos else 0.0,
+            "por_endpoint": por_endpoint,
+        }
+
+    def reiniciar(self):
+        with self._lock:
+            self._contadores.clear()
+
+
+metricas_cache_reportes = MetricasCacheReportes()
+
+
+def respuesta_cacheada(request, endpoint, alcance, calcular):
+    """
+    Response de un reporte desde la caché o, si no está, calculada con
+    calcular() y guardada. Solo se cachean las respuestas 200; los errores
+    (parámetros inválidos, 404...) se devuelven sin guardar.
+
+    La cabecera X-Cache indica HIT o MISS.
+    """
+    # La versión se lee antes de calcular: si los datos cambian mientras se
+    # calcula, el resultado queda bajo la versión vieja y no se vuelve a servir
+    clave = clave_reporte(endpoint, alcance, request.query_params, version_datos())
+    datos = cache.get(clave)
+    if datos is not None:
+        metricas_cache_reportes.registrar(endpoint, acierto=True)
+        return Response(datos, headers={'X-Cache': 'HIT'})
+
+    metricas_cache_reportes.registrar(endpoint, acierto=False)
+    respuesta = calcular()
+    if respuesta.status_code == status.HTTP_200_OK:
+        cache.set(clave, respuesta.data, getattr(settings, 'REPORTES_CACHE_TTL', 3600))
+    respuesta['X-Cache'] = 'MISS'
+    return respuesta
@@ -0,0 +1,94 @@
+"""
+Mantenimiento de la tabla desnormalizada CaracteristicasResultado.
+
+Cada fila se recalcula a partir de los ResultadoIndicador de su resultado
+(una consulta de k filas) cada vez que se escribe alguno de ellos, dentro de
+la misma transacción. Recalcular desde el origen, en lugar de aplicar
+deltas, hace que también los borrados en bloque dejen la fila correcta.
+"""
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import CaracteristicasResultado, ResultadoEncuesta, ResultadoIndicador
+
+
+def _valores(resultado_id):
+    return {
+        str(indicador_id): valor
+        for indicador_id, valor in ResultadoIndicador.objects.filter(
+            resultado_id=resultado_id
+        ).values_list('indicador_id', 'valor')
+    }
+
+
+def actualizar_caracteristicas(resultado_id, crear=True):
+    """
+    Recalcular la fila de un resultado. Con crear=False solo se actualiza si
+    ya existe (en un borrado en cascada no debe volver a crearse).
+    """
+    datos = ResultadoEncuesta.objects.filter(pk=resultado_id).values(
+        'institucion_id', 'fecha_calculo', 'puntuacion_global', 'nivel_madurez'
+    ).first()
+    if datos is None:
+        return
+
+    valores = _valores(resultado_id)
+    datos.update(valores=valores, num_indicadores=len(valores))
+
+    with transaction.atomic():
+        if crear:
+            CaracteristicasResultado.objects.update_or_create(resultado_id=resultado_id, defaults=datos)
+        else:
+            CaracteristicasResultado.objects.filter(resultado_id=resultado_id).update(
+                fecha_actualizacion=timezone.now(), **datos
+            )
+
+
+def actualizar_datos_resultado(resultado):
+    """Copiar los campos del resultado (sin tocar los valores de indicadores)."""
+    datos = {
+        'institucion_id': resultado.institucion_id,
+        'fecha_calculo': resultado.fecha_calculo,
+        'puntuacion_global': resultado.puntuacion_global,
+        'nivel_madurez': resultado.nivel_madurez,
+        # update() no aplica auto_now; la huella de datos usa esta fecha
+        'fecha_actualizacion': timezone.now(),
+    }
+    if not CaracteristicasResultado.objects.filter(resultado_id=resultado.pk).update(**datos):
+        actualizar_caracteristicas(resultado.pk)
+
+
+def reconstruir_caracteristicas(tamaño_bloque=5000):
+    """Recalcular toda la tabla desde ResultadoEncuesta y ResultadoIndicador."""
+    return _reconstruir(ResultadoEncuesta, ResultadoIndicador, CaracteristicasResultado, tamaño_bloque)
+
+
+def _reconstruir(ResultadoEncuesta, ResultadoIndicador, CaracteristicasResultado, tamaño_bloque=5000):
+    # Recibe los modelos para poder usarse también desde las migraciones
+    valores = {}
+    for resultado_id, indicador_id, valor in ResultadoIndicador.objects.order_by().values_list(
+        'resultado_id', 'indicador_id', 'valor'
+    ).iterator(chunk_size=tamaño_bloque):
+        valores.setdefault(resultado_id, {})[str(indicador_id)] = valor
+
+    filas = [
+        CaracteristicasResultado(
+            resultado_id=resultado_id,
+            institucion_id=institucion_id,
+            fecha_calculo=fecha_calculo,
+            puntuacion_global=puntuacion_global,
+            nivel_madurez=nivel_madurez,
+            valores=valores.get(resultado_id, {}),
+            num_indicadores=len(valores.get(resultado_id, {})),
+        )
+        for resultado_id, institucion_id, fecha_calculo, puntuacion_global, nivel_madurez
+        in ResultadoEncuesta.objects.order_by().values_list(
+            'id', 'institucion_id', 'fecha_calculo', 'puntuacion_global', 'nivel_madurez'
+        ).iterator(chunk_size=tamaño_bloque)
+    ]
+
+    with transaction.atomic():
+        CaracteristicasResultado.objects.all().delete()
+        CaracteristicasResultado.objects.bulk_create(filas, batch_size=tamaño_bloque)
+    return len(filas)
@@ -0,0 +1,132 @@
+"""
+Mantenimiento de los contadores del dashboard (ContadoresDashboard).
+
+Las señales suman o restan a la fila única con expresiones F(), en la misma
+transacción que la escritura que las provoca. Todas las actualizaciones
+empiezan por la fila de ContadoresDashboard, que queda bloqueada hasta el
+commit: las escrituras concurrentes se serializan ahí y el nivel
+predominante se recalcula viendo los contadores por nivel ya confirmados.
+
+Si la fila todavía no existe (BD recién creada sin migrar datos) se
+reconstruye desde cero, lo que ya incluye la escritura en curso.
+"""
+
+from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.utils import timezone
+
+from .models import (
+    ContadoresDashboard, ContadorNivelMadurez, Encuesta, Institucion, Respuesta,
+    ResultadoEncuesta,
+)
+
+FILA = 1
+
+
+def sumar(**incrementos):
+    """
+    Sumar (o restar, con valores negativos) a los contadores.
+    Devuelve False si la fila no existía y se ha reconstruido.
+    """
+    cambios = {campo: F(campo) + delta for campo, delta in incrementos.items() if delta}
+    if ContadoresDashboard.objects.filter(pk=FILA).update(
+        fecha_actualizacion=timezone.now(), **cambios
+    ):
+        return True
+    reconstruir_contadores()
+    return False
+
+
+def _sumar_nivel(institucion_id, nivel, delta):
+    filtro = ContadorNivelMadurez.objects.filter(institucion_id=institucion_id, nivel_madurez=nivel)
+    if filtro.update(cantidad=F('cantidad') + delta) or delta < 0:
+        # Con delta < 0 y sin fila: borrada en cascada con su institución
+        return
+    try:
+        with transaction.atomic():
+            ContadorNivelMadurez.objects.create(
+                institucion_id=institucion_id, nivel_madurez=nivel, cantidad=delta
+            )
+    except IntegrityError:
+        # Otra petición creó la fila a la vez
+        filtro.update(cantidad=F('cantidad') + delta)
+
+
+def registrar_evaluacion(anterior, actual):
+    """
+    Aplicar el alta, cambio o baja de una evaluación.
+
+    Args:
+        anterior, actual: (institucion_id, nivel_madurez, puntuacion_global),
+            o None si la evaluación no existía (alta) o ya no existe (baja)
+    """
+    if anterior == actual:
+        return
+    recalculado = not sumar(
+        total_evaluaciones=(actual is not None) - (anterior is not None),
+        suma_puntuaciones=(actual[2] if actual else 0) - (anterior[2] if anterior else 0),
+    )
+    nivel_anterior = anterior[:2] if anterior else None
+    nivel_actual = actual[:2] if actual else None
+    if recalculado or nivel_anterior == nivel_actual:
+        return
+
+    if nivel_anterior is not None:
+        _sumar_nivel(*nivel_anterior, -1)
+    if nivel_actual is not None:
+        _sumar_nivel(*nivel_actual, 1)
+    ContadoresDashboard.objects.filter(pk=FILA).update(nivel_predominante=_nivel_predominante())
+
+
+def _nivel_predominante(ContadorNivelMadurez=ContadorNivelMadurez):
+    return ContadorNivelMadurez.objects.values('nivel_madurez').annotate(
+        total=Sum('cantidad')
+    ).filter(total__gt=0).order_by(
+        '-total', 'nivel_madurez'
+    ).values_list('nivel_madurez', flat=True).first() or ''
+
+
+def reconstruir_contadores():
+    """
+    Recalcular los contadores desde cero. Necesario tras cargas masivas
+    (bulk_create, update) que no disparan señales, y para corregir la deriva
+    de la suma en coma flotante. Devuelve los valores recalculados.
+    """
+    return _reconstruir(
+        Encuesta, Respuesta, Institucion, User, ResultadoEncuesta,
+        ContadoresDashboard, ContadorNivelMadurez,
+    )
+
+
+def _reconstruir(Encuesta, Respuesta, Institucion, User, ResultadoEncuesta,
+                 ContadoresDashboard, ContadorNivelMadurez):
+    # Recibe los modelos para poder usarse también desde las migraciones
+    with transaction.atomic():
+        # Esperar a que terminen las escrituras que ya han sumado: las que
+        # lleguen después sumarán sobre los valores recalculados
+        list(ContadoresDashboard.objects.select_for_update().filter(pk=FILA))
+
+        evaluaciones = ResultadoEncuesta.objects.aggregate(
+            total=Count('id'), suma=Sum('puntuacion_global')
+        )
+        niveles = ResultadoEncuesta.objects.order_by().values_list(
+            'institucion_id', 'nivel_madurez'
+        ).annotate(n=Count('id'))
+
+        ContadorNivelMadurez.objects.all().delete()
+        ContadorNivelMadurez.objects.bulk_create(
+            ContadorNivelMadurez(institucion_id=institucion_id, nivel_madurez=nivel, cantidad=n)
+            for institucion_id, nivel, n in niveles
+        )
+        valores = {
+            'total_encuestas': Encuesta.objects.count(),
+            'total_respuestas': Respuesta.objects.count(),
+            'total_evaluaciones': evaluaciones['total'],
+            'total_instituciones': Institucion.objects.count(),
+            'usuarios_activos': User.objects.filter(is_active=True).count(),
+            'suma_puntuaciones': evaluaciones['suma'] or 0.0,
+            'nivel_predominante': _nivel_predominante(ContadorNivelMadurez),
+        }
+        ContadoresDashboard.objects.update_or_create(pk=FILA, defaults=valores)
+    return valores
@@ -0,0 +1,229 @@
+"""
+Escritura diferida (write-behind) de las predicciones del modelo de IA.
+
+predecir_madurez ya no escribe en la base de datos: deja la predicción en un
+buffer en memoria y un hilo de fondo la inserta con bulk_create cuando el
+buffer alcanza ML_PREDICCIONES_BUFFER_TAMAÑO elementos o han pasado
+ML_PREDICCIONES_BUFFER_INTERVALO segundos.
+
+Si la base de datos no está disponible al vaciar el buffer (o al cerrar el
+proceso), las predicciones se vuelcan a un fichero JSONL en
+ML_PREDICCIONES_PENDIENTES_DIR y se reintentan en el siguiente vaciado. Un
+fichero que falla por otro motivo se aparta con la extensión .erroneo para
+que no bloquee la recuperación de los siguientes.
+"""
+
+import atexit
+import json
+import logging
+import os
+import threading
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+from django.conf import settings
+from django.db import InterfaceError, OperationalError, connections
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+class BufferPredicciones:
+    """Buffer de predicciones pendientes de guardar, compartido por el proceso."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._lock_vaciado = threading.Lock()
+        self._pendientes = []
+        self._despertar = threading.Event()
+        self._hilo = None
+        self._pid = None
+        self.guardadas = 0
+        self.volcadas_a_disco = 0
+        self.descartadas = 0
+
+    def _tamaño(self):
+        return getattr(settings, 'ML_PREDICCIONES_BUFFER_TAMAÑO', 500)
+
+    def _intervalo(self):
+        return getattr(settings, 'ML_PREDICCIONES_BUFFER_INTERVALO', 2)
+
+    def _directorio(self):
+        return Path(getattr(
+            settings, 'ML_PREDICCIONES_PENDIENTES_DIR',
+            os.path.join(settings.BASE_DIR, 'ml_models', 'predicciones_pendientes')
+        ))
+
+    def agregar(self, modelo_id, resultado_id, nivel_pred, probabilidad):
+        """Encolar una predicción; no toca la base de datos."""
+        with self._lock:
+            self._asegurar_hilo()
+            self._pendientes.append({
+                'modelo_id': modelo_id,
+                'resultado_id': resultado_id,
+                'nivel_pred': nivel_pred,
+                'probabilidad': probabilidad,
+                'fecha_prediccion': timezone.now().isoformat(),
+            })
+            lleno = len(self._pendientes) >= self._tamaño()
+        if lleno:
+            self._despertar.set()
+
+    def _asegurar_hilo(self):
+        # Llamar con el lock adquirido. Tras un fork el hilo no existe en el
+        # proceso hijo, por eso se comprueba también el pid.
+        if self._hilo is not None and self._hilo.is_alive() and self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._hilo = threading.Thread(
+            target=self._bucle, name='buffer-predicciones', daemon=True
+        )
+        self._hilo.start()
+
+    def _bucle(self):
+        while True:
+            self._despertar.wait(self._intervalo())
+            self._despertar.clear()
+            try:
+                self.vaciar()
+            except Exception as e:
+                logger.error(f"Error vaciando el buffer de predicciones: {e}")
+            finally:
+                # Cada hilo tiene su propia conexión; no dejarla abierta
+                connections.close_all()
+
+    def vaciar(self):
+        """
+        Guardar en la base de datos lo que haya en el buffer y en los ficheros
+        de predicciones pendientes. Devuelve cuántas predicciones se guardaron.
+        """
+        with self._lock_vaciado:
+            with self._lock:
+                lote, self._pendientes = self._pendientes, []
+
+            guardadas = 0
+            if lote:
+                try:
+                    guardadas += self._guardar(lote)
+                except Exception as e:
+                    logger.error(f"No se pudieron guardar {len(lote)} predicciones: {e}")
+                    self._volcar(lote)
+                    return guardadas
+
+            guardadas += self._recuperar_volcados()
+            return guardadas
+
+    def _guardar(self, lote, conservar_fecha=False):
+        from .models import ModeloIA, PrediccionIA, ResultadoEncuesta
+
+        # Descartar predicciones de resultados que no existen (antes se
+        # comprobaba con un get por petición) o de modelos ya borrados (p. ej.
+        # al volver a la versión anterior borrando el último ModeloIA)
+        resultados = set(ResultadoEncuesta.objects.filter(
+            id__in={p['resultado_id'] for p in lote}
+        ).values_list('id', flat=True))
+        modelos = set(ModeloIA.objects.filter(
+            id__in={p['modelo_id'] for p in lote}
+        ).values_list('id', flat=True))
+        validas = [
+            p for p in lote if p['resultado_id'] in resultados and p['modelo_id'] in modelos
+        ]
+        self.descartadas += len(lote) - len(validas)
+
+        objetos = PrediccionIA.objects.bulk_create([
+            PrediccionIA(
+                modelo_id=p['modelo_id'],
+                resultado_id=p['resultado_id'],
+                nivel_pred=p['nivel_pred'],
+                probabilidad=p['probabilidad'],
+            )
+            for p in validas
+        ])
+
+        # auto_now_add pone la hora del guardado; para lo recuperado de disco
+        # se restaura la hora real de la predicción
+        if conservar_fecha and objetos and all(o.pk for o in objetos):
+            for objeto, p in zip(objetos, validas):
+                objeto.fecha_prediccion = datetime.fromisoformat(p['fecha_prediccion'])
+            PrediccionIA.objects.bulk_update(objetos, ['fecha_prediccion'])
+
+        self.guardadas += len(objetos)
+        return len(objetos)
+
+    def _volcar(self, lote):
+        """Escribir predicciones no guardadas a un fichero JSONL propio."""
+        directorio = self._directorio()
+        try:
+            directorio.mkdir(parents=True, exist_ok=True)
+            ruta = directorio / f"predicciones_{os.getpid()}_{uuid.uuid4().hex[:8]}.jsonl"
+            with open(ruta, 'w', encoding='utf-8') as f:
+                for prediccion in lote:
+                    f.write(json.dumps(prediccion) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            self.volcadas_a_disco += len(lote)
+            logger.warning(f"{len(lote)} predicciones volcadas a {ruta}")
+        except OSError as e:
+            logger.error(f"Se pierden {len(lote)} predicciones: {e}")
+            self.descartadas += len(lote)
+
+    def _recuperar_volcados(self):
+        directorio = self._directorio()
+        if not directorio.is_dir():
+            return 0
+
+        guardadas = 0
+        for ruta in sorted(directorio.glob('predicciones_*.jsonl')):
+            # Renombrar primero para que dos procesos no recuperen el mismo fichero
+            reclamado = ruta.with_suffix(f'.{os.getpid()}.procesando')
+            try:
+                os.replace(ruta, reclamado)
+            except OSError:
+                continue
+            try:
+                with open(reclamado, encoding='utf-8') as f:
+                    lote = [json.loads(linea) for linea in f if linea.strip()]
+                guardadas += self._guardar(lote, conservar_fecha=True)
+            except (OperationalError, InterfaceError) as e:
+                # La BD sigue sin estar disponible: se reintenta en el siguiente vaciado
+                logger.error(f"No se pudieron recuperar las predicciones de {ruta}: {e}")
+                os.replace(reclamado, ruta)
+                break
+            except Exception as e:
+                # Fichero que nunca se podrá guardar: se aparta para revisarlo a mano
+                apartado = ruta.with_suffix('.erroneo')
+                logger.error(f"Predicciones de {ruta} no recuperables ({e}); se apartan a {apartado}")
+                os.replace(reclamado, apartado)
+                continue
+            os.remove(reclamado)
+        return guardadas
+
+    def cerrar(self):
+        """Vaciar el buffer al terminar el proceso (o volcarlo a disco)."""
+        with self._lock:
+            pendientes = bool(self._pendientes)
+        if not pendientes:
+            return
+        try:
+            self.vaciar()
+        except Exception as e:
+            logger.error(f"Error vaciando el buffer de predicciones al cerrar: {e}")
+            with self._lock:
+                lote, self._pendientes = self._pendientes, []
+            if lote:
+                self._volcar(lote)
+
+    def estadisticas(self):
+        return {
+            "pendientes": len(self._pendientes),
+            "guardadas": self.guardadas,
+            "volcadas_a_disco": self.volcadas_a_disco,
+            "descartadas": self.descartadas,
+            "tamaño_buffer": self._tamaño(),
+            "intervalo_segundos": self._intervalo(),
+        }
+
+
+buffer_predicciones = BufferPredicciones()
+atexit.register(buffer_predicciones.cerrar)
@@ -0,0 +1,78 @@
+"""
+Estadísticas de preparación de los datos de entrenamiento.
+
+estado_modelo_ia solo necesita contar: muestras válidas (resultados con
+todos los indicadores), muestras por nivel de madurez y cobertura de cada
+indicador. Se calculan con agregados SQL sobre CaracteristicasResultado y
+ResultadoIndicador, sin extraer el conjunto de entrenamiento, y se guardan
+en la caché de Django durante ML_ESTADISTICAS_DATOS_TTL segundos.
+
+Las señales invalidan la caché al escribir resultados, valores o
+indicadores. Con una caché compartida (Redis, Memcached) la invalidación
+llega a todos los procesos; con la caché local por defecto, cada proceso
+ve los cambios de los demás como mucho tras el TTL.
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count
+from django.utils import timezone
+
+from .models import CaracteristicasResultado, Indicador, ResultadoEncuesta
+
+CLAVE_CACHE = 'encuestas:estadisticas_entrenamiento'
+
+# Mínimo de muestras para recomendar un entrenamiento
+MUESTRAS_MINIMAS = 10
+
+
+def calcular_estadisticas_entrenamiento():
+    total_resultados = ResultadoEncuesta.objects.count()
+    indicadores = list(
+        Indicador.objects.order_by('id').annotate(resultados=Count('resultadoindicador'))
+        .values_list('id', 'nombre', 'resultados')
+    )
+
+    # Una fila es válida para entrenar si tiene valor en todos los indicadores
+    muestras_por_nivel = {}
+    if indicadores:
+        muestras_por_nivel = dict(
+            CaracteristicasResultado.objects.filter(num_indicadores__gte=len(indicadores))
+            .order_by().values_list('nivel_madurez').annotate(n=Count('pk'))
+        )
+    muestras_validas = sum(muestras_por_nivel.values())
+
+    return {
+        "total_resultados": total_resultados,
+        "total_indicadores": len(indicadores),
+        "muestras_validas": muestras_validas,
+        "suficientes_datos": muestras_validas >= MUESTRAS_MINIMAS,
+        "muestras_por_nivel": muestras_por_nivel,
+        "muestras_clase_minoritaria": min(muestras_por_nivel.values()) if muestras_por_nivel else 0,
+        # train_test_split estratificado necesita al menos 2 muestras por nivel
+        "estratificable": bool(muestras_por_nivel) and min(muestras_por_nivel.values()) >= 2,
+        "cobertura_indicadores": [
+            {
+                "id": indicador_id,
+                "nombre": nombre,
+                "resultados": resultados,
+                "cobertura": round(resultados / total_resultados, 4) if total_resultados else 0.0,
+            }
+            for indicador_id, nombre, resultados in indicadores
+        ],
+        "calculado_en": timezone.now().isoformat(),
+    }
+
+
+def estadisticas_entrenamiento():
+    """Estadísticas desde la caché, o calculadas y guardadas en ella."""
+    datos = cache.get(CLAVE_CACHE)
+    if datos is not None:
+        return dict(datos, en_cache=True)
+    datos = calcular_estadisticas_entrenamiento()
+    cache.set(CLAVE_CACHE, datos, getattr(settings, 'ML_ESTADISTICAS_DATOS_TTL', 60))
+    return dict(datos, en_cache=False)
+
+
+def invalidar_estadisticas():
+    cache.delete(CLAVE_CACHE)
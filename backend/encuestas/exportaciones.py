@@ -0,0 +1,193 @@
+"""
+Exportación en streaming de respuestas, resultados y valores de indicadores.
+
+Las filas se leen con values_list().iterator(chunk_size=...) (cursor de
+servidor en PostgreSQL) y se escriben en CSV o NDJSON por bloques, con
+compresión gzip o zstd opcional. En memoria solo hay un bloque de filas y
+el búfer del compresor, exporte mil filas o diez millones.
+
+zstd requiere el paquete zstandard.
+"""
+
+import csv
+import io
+import json
+import zlib
+from datetime import date, datetime, time, timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import Respuesta, ResultadoEncuesta, ResultadoIndicador
+from .reportes import _filtrar
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - dependencia opcional
+    zstandard = None
+
+
+def _inicio_dia(dia):
+    return timezone.make_aware(datetime.combine(dia, time.min))
+
+
+class Conjunto:
+    """Conjunto exportable: modelo, columnas y campos por los que se filtra."""
+
+    def __init__(self, modelo, columnas, campo_encuesta, campo_institucion, campo_fecha):
+        self.modelo = modelo
+        # {nombre de columna: ruta del campo en values_list}
+        self.columnas = columnas
+        self.campo_encuesta = campo_encuesta
+        self.campo_institucion = campo_institucion
+        self.campo_fecha = campo_fecha
+
+    def filas(self, alcance, encuesta_id=None, institucion_id=None, desde=None, hasta=None):
+        """Iterador de tuplas, leídas de la BD por bloques."""
+        # Sin institución (alcance None) no se exporta nada, como en los reportes
+        queryset = _filtrar(self.modelo.objects.all(), alcance, self.campo_institucion)
+        if encuesta_id is not None:
+            queryset = queryset.filter(**{self.campo_encuesta: encuesta_id})
+        if institucion_id is not None:
+            queryset = queryset.filter(**{self.campo_institucion: institucion_id})
+        # Rango de fechas como rango de instantes, para poder usar índices
+        if desde is not None:
+            queryset = queryset.filter(**{f"{self.campo_fecha}__gte": _inicio_dia(desde)})
+        if hasta is not None:
+            queryset = queryset.filter(**{f"{self.campo_fecha}__lt": _inicio_dia(hasta + timedelta(days=1))})
+        return queryset.order_by('pk').values_list(*self.columnas.values()).iterator(
+            chunk_size=getattr(settings, 'EXPORTACION_CHUNK_SIZE', 2000)
+        )
+
+
+CONJUNTOS = {
+    'respuestas': Conjunto(
+        Respuesta,
+        {
+            'id': 'id',
+            'encuesta_id': 'encuesta_id',
+            'institucion_id': 'encuesta__institucion_id',
+            'pregunta_id': 'pregunta_id',
+            'pregunta': 'pregunta__texto',
+            'usuario_id': 'usuario_id',
+            'opcion_id': 'opcion_id',
+            'opcion': 'opcion__etiqueta',
+            'valor_numerico': 'opcion__valor_numerico',
+            'valor_abierto': 'valor_abierto',
+            'fecha_respuesta': 'fecha_respuesta',
+        },
+        'encuesta_id', 'encuesta__institucion_id', 'fecha_respuesta',
+    ),
+    'resultados': Conjunto(
+        ResultadoEncuesta,
+        {
+            'id': 'id',
+            'encuesta_id': 'encuesta_id',
+            'institucion_id': 'institucion_id',
+            'nivel_madurez': 'nivel_madurez',
+            'puntuacion_global': 'puntuacion_global',
+            'fecha_calculo': 'fecha_calculo',
+        },
+        'encuesta_id', 'institucion_id', 'fecha_calculo',
+    ),
+    'indicadores': Conjunto(
+        ResultadoIndicador,
+        {
+            'id': 'id',
+            'resultado_id': 'resultado_id',
+            'encuesta_id': 'resultado__encuesta_id',
+            'institucion_id': 'resultado__institucion_id',
+            'indicador_id': 'indicador_id',
+            'indicador': 'indicador__nombre',
+            'valor': 'valor',
+            'nivel_indicador': 'nivel_indicador',
+            'fecha_calculo': 'resultado__fecha_calculo',
+        },
+        'resultado__encuesta_id', 'resultado__institucion_id', 'resultado__fecha_calculo',
+    ),
+}
+
+FORMATOS = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+
+COMPRESIONES = {'gzip': ('gz', 'application/gzip'), 'zstd': ('zst', 'application/zstd')}
+
+# Tamaño a partir del cual se entrega un bloque de texto al compresor / al cliente
+TAMANO_BLOQUE = 64 * 1024
+
+
+def _valor_json(valor):
+    if isinstance(valor, (datetime, date)):
+        return valor.isoformat()
+    return str(valor)
+
+
+def _texto_csv(columnas, filas):
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    escritor.writerow(columnas)
+    for fila in filas:
+        escritor.writerow(fila)
+        if buffer.tell() >= TAMANO_BLOQUE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def _texto_ndjson(columnas, filas):
+    lineas = []
+    tamano = 0
+    for fila in filas:
+        linea = json.dumps(dict(zip(columnas, fila)), ensure_ascii=False, default=_valor_json)
+        lineas.append(linea)
+        tamano += len(linea) + 1
+        if tamano >= TAMANO_BLOQUE:
+            yield '\n'.join(lineas) + '\n'
+            lineas, tamano = [], 0
+    if lineas:
+        yield '\n'.join(lineas) + '\n'
+
+
+def _comprimir(bloques, compresion):
+    if compresion == 'gzip':
+        compresor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31: formato gzip
+    else:
+        compresor = zstandard.ZstdCompressor().compressobj()
+    for bloque in bloques:
+        datos = compresor.compress(bloque)
+        if datos:
+            yield datos
+    yield compresor.flush()
+
+
+def comprobar_compresion(compresion):
+    """Mensaje de error si la compresión no es válida o no está disponible."""
+    if compresion and compresion not in COMPRESIONES:
+        return f"'compresion' debe ser {' o '.join(COMPRESIONES)}"
+    if compresion == 'zstd' and zstandard is None:
+        return "La compresión zstd requiere el paquete zstandard (pip install zstandard)"
+    return None
+
+
+def exportar(nombre, formato, compresion=None, **filtros):
+    """
+    Generador de bytes con la exportación y (content_type, nombre de fichero).
+
+    Args:
+        nombre: clave de CONJUNTOS
+        formato: 'csv' o 'ndjson'
+        compresion: None, 'gzip' o 'zstd'
+        filtros: alcance, encuesta_id, institucion_id, desde, hasta
+    """
+    conjunto = CONJUNTOS[nombre]
+    columnas = list(conjunto.columnas)
+    escribir = _texto_csv if formato == 'csv' else _texto_ndjson
+    bloques = (texto.encode('utf-8') for texto in escribir(columnas, conjunto.filas(**filtros)))
+
+    fichero = f"{nombre}.{formato}"
+    content_type = FORMATOS[formato]
+    if compresion:
+        extension, content_type = COMPRESIONES[compresion]
+        fichero = f"{fichero}.{extension}"
+        bloques = _comprimir(bloques, compresion)
+    return bloques, content_type, fichero
@@ -0,0 +1,78 @@
+import json
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from encuestas.ml import registro_modelos
+from encuestas.ml_inferencia import BosquePlano
+
+
+def _mediana_ms(funcion, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append(time.perf_counter() - inicio)
+    return float(np.median(tiempos) * 1000)
+
+
+class Command(BaseCommand):
+    help = 'Compara la inferencia de scikit-learn con la del bosque plano (resultados y latencia)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--filas-lote', type=int, default=1000, help='Tamaño del lote de prueba')
+        parser.add_argument('--repeticiones', type=int, default=200, help='Repeticiones por medición')
+        parser.add_argument('--json', action='store_true', help='Salida en JSON')
+
+    def handle(self, *args, **options):
+        entrada = registro_modelos.obtener()
+        if entrada is None:
+            self.stderr.write('No hay modelo entrenado')
+            return
+
+        modelo, scaler = entrada['modelo'], entrada['scaler']
+        bosque = entrada['bosque'] or BosquePlano.desde_sklearn(modelo)
+
+        # Filas sintéticas en el espacio normalizado de las características
+        rng = np.random.RandomState(0)
+        X = rng.normal(size=(options['filas_lote'], scaler.n_features_in_))
+        fila = X[:1]
+        repeticiones = options['repeticiones']
+
+        proba_sklearn = modelo.predict_proba(X)
+        proba_plano = bosque.predict_proba(X)
+
+        resultados = {
+            'arboles': len(bosque.raices),
+            'nodos': int(len(bosque.umbral)),
+            'profundidad': bosque.profundidad,
+            'diferencia_maxima_probabilidad': float(np.abs(proba_sklearn - proba_plano).max()),
+            'mismas_clases': bool(
+                (proba_sklearn.argmax(axis=1) == proba_plano.argmax(axis=1)).all()
+            ),
+            'fila_ms_sklearn': _mediana_ms(
+                lambda: (modelo.predict(fila), modelo.predict_proba(fila)), repeticiones
+            ),
+            'fila_ms_plano': _mediana_ms(lambda: bosque.predict_proba(fila), repeticiones),
+            'lote_ms_sklearn': _mediana_ms(
+                lambda: modelo.predict_proba(X), max(1, repeticiones // 20)
+            ),
+            'lote_ms_plano': _mediana_ms(
+                lambda: bosque.predict_proba(X), max(1, repeticiones // 20)
+            ),
+            'filas_lote': len(X),
+        }
+        resultados['aceleracion_fila'] = round(
+            resultados['fila_ms_sklearn'] / resultados['fila_ms_plano'], 2
+        )
+        resultados['aceleracion_lote'] = round(
+            resultados['lote_ms_sklearn'] / resultados['lote_ms_plano'], 2
+        )
+
+        if options['json']:
+            self.stdout.write(json.dumps(resultados, indent=2))
+            return
+
+        for clave, valor in resultados.items():
+            self.stdout.write(f'{clave:32} {valor}')
@@ -0,0 +1,266 @@
+import json
+import os
+import platform
+import shutil
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import joblib
+import numpy as np
+import sklearn
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from sklearn.preprocessing import StandardScaler
+
+from encuestas.ml import AnalizadorMadurezDigital
+from encuestas.ml_inferencia import BosquePlano
+from encuestas.models import (
+    CaracteristicasResultado, Encuesta, Indicador, Institucion,
+    ResultadoEncuesta, ResultadoIndicador,
+)
+
+NIVELES = [(2.0, 'Inicial'), (2.8, 'En desarrollo'), (3.6, 'Competente'), (4.2, 'Avanzado')]
+
+# Métricas en las que un valor mayor es peor (se comparan con --referencia)
+METRICAS_COMPARABLES = (
+    'extraccion_segundos', 'ajuste_segundos', 'memoria_pico_extraccion_mb',
+    'memoria_pico_ajuste_mb', 'artefacto_mb', 'carga_artefacto_ms',
+    'fila_p50_ms', 'fila_p99_ms', 'lote_p50_ms', 'lote_p99_ms',
+)
+
+
+def _percentiles_ms(funcion, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append(time.perf_counter() - inicio)
+    tiempos = np.array(tiempos) * 1000
+    return round(float(np.percentile(tiempos, 50)), 4), round(float(np.percentile(tiempos, 99)), 4)
+
+
+def _medir(funcion):
+    """Ejecutar funcion() midiendo tiempo y pico de memoria (tracemalloc)."""
+    tracemalloc.start()
+    inicio = time.perf_counter()
+    try:
+        resultado = funcion()
+        duracion = time.perf_counter() - inicio
+        _, pico = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return resultado, round(duracion, 4), round(pico / 2**20, 2)
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark offline del pipeline de IA con datos sintéticos de varios tamaños: '
+        'extracción, ajuste, memoria, tamaño del artefacto y latencia de inferencia. '
+        'Los datos se crean dentro de una transacción que se deshace al terminar.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--tamaños', default='1000,10000,100000',
+            help='Número de resultados sintéticos por ejecución, separados por comas'
+        )
+        parser.add_argument(
+            '--indicadores', type=int, default=5,
+            help='Indicadores sintéticos a crear si la BD no tiene ninguno'
+        )
+        parser.add_argument('--repeticiones', type=int, default=200, help='Repeticiones por medición de latencia')
+        parser.add_argument('--filas-lote', type=int, default=1000, help='Filas del lote de inferencia')
+        parser.add_argument('--semilla', type=int, default=42)
+        parser.add_argument('--salida', help='Fichero JSON de resultados (por defecto, la salida estándar)')
+        parser.add_argument('--referencia', help='JSON de una ejecución anterior con el que comparar')
+        parser.add_argument(
+            '--tolerancia', type=float, default=0.25,
+            help='Empeoramiento relativo a partir del cual se marca una regresión (0.25 = 25%%)'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            tamaños = [int(t) for t in options['tamaños'].split(',') if t.strip()]
+        except ValueError:
+            raise CommandError('--tamaños debe ser una lista de enteros separados por comas')
+
+        informe = {
+            'fecha': datetime.now().isoformat(timespec='seconds'),
+            'entorno': {
+                'python': platform.python_version(),
+                'numpy': np.__version__,
+                'scikit_learn': sklearn.__version__,
+                'base_datos': connection.vendor,
+                'cpus': os.cpu_count(),
+                'inferencia_plana': getattr(settings, 'ML_INFERENCIA_PLANA', True),
+                'inferencia_plana_max_filas': getattr(settings, 'ML_INFERENCIA_PLANA_MAX_FILAS', 256),
+            },
+            'ejecuciones': [],
+        }
+
+        for tamaño in tamaños:
+            self.stderr.write(f'Midiendo {tamaño} resultados...')
+            informe['ejecuciones'].append(self._ejecutar(tamaño, options))
+
+        if options['referencia']:
+            informe['regresiones'] = self._comparar(informe, options['referencia'], options['tolerancia'])
+
+        salida = json.dumps(informe, indent=2, ensure_ascii=False)
+        if options['salida']:
+            with open(options['salida'], 'w', encoding='utf-8') as f:
+                f.write(salida)
+            self.stderr.write(self.style.SUCCESS(f'✓ Resultados guardados en {options["salida"]}'))
+        else:
+            self.stdout.write(salida)
+
+        for regresion in informe.get('regresiones', []):
+            self.stderr.write(self.style.WARNING(
+                f"Regresión en {regresion['tamaño']} resultados: {regresion['metrica']} "
+                f"{regresion['referencia']} -> {regresion['actual']}"
+            ))
+
+    def _ejecutar(self, tamaño, options):
+        rng = np.random.RandomState(options['semilla'])
+        directorio = tempfile.mkdtemp(prefix='benchmark_ml_')
+        try:
+            with transaction.atomic():
+                inicio = time.perf_counter()
+                self._generar(tamaño, options['indicadores'], rng)
+                generacion = time.perf_counter() - inicio
+
+                metricas = self._medir_pipeline(directorio, options, rng)
+                metricas.update(tamaño=tamaño, generacion_segundos=round(generacion, 2))
+
+                # Deshacer los datos sintéticos
+                transaction.set_rollback(True)
+        finally:
+            shutil.rmtree(directorio, ignore_errors=True)
+        return metricas
+
+    def _generar(self, tamaño, num_indicadores, rng):
+        """Crear resultados sintéticos con bulk_create (sin señales)."""
+        indicadores = list(Indicador.objects.order_by('id'))
+        if not indicadores:
+            indicadores = Indicador.objects.bulk_create([
+                Indicador(nombre=f'Indicador sintético {i + 1}', categoria='Benchmark')
+                for i in range(num_indicadores)
+            ])
+
+        institucion = Institucion.objects.create(
+            nombre='Institución benchmark', nivel_educativo='Benchmark', ciudad='-', pais='-'
+        )
+        encuesta = Encuesta.objects.create(institucion=institucion, titulo='Encuesta benchmark')
+
+        puntuaciones = np.round(rng.uniform(1.5, 4.8, tamaño), 2)
+        valores = np.clip(
+            np.round(puntuaciones[:, None] + rng.uniform(-0.5, 0.5, (tamaño, len(indicadores))), 2),
+            1.0, 5.0
+        )
+        niveles = np.full(tamaño, 'Experto', dtype=object)
+        for umbral, nivel in reversed(NIVELES):
+            niveles[puntuaciones < umbral] = nivel
+
+        bloque = 5000
+        for inicio in range(0, tamaño, bloque):
+            fin = min(inicio + bloque, tamaño)
+            resultados = ResultadoEncuesta.objects.bulk_create([
+                ResultadoEncuesta(
+                    encuesta=encuesta, institucion=institucion,
+                    nivel_madurez=niveles[i], puntuacion_global=float(puntuaciones[i])
+                )
+                for i in range(inicio, fin)
+            ])
+            ResultadoIndicador.objects.bulk_create([
+                ResultadoIndicador(
+                    resultado_id=resultado.id, indicador_id=indicador.id,
+                    valor=float(valores[i, j]), nivel_indicador='-'
+                )
+                for i, resultado in zip(range(inicio, fin), resultados)
+                for j, indicador in enumerate(indicadores)
+            ])
+            CaracteristicasResultado.objects.bulk_create([
+                CaracteristicasResultado(
+                    resultado_id=resultado.id, institucion=institucion,
+                    fecha_calculo=resultado.fecha_calculo,
+                    puntuacion_global=resultado.puntuacion_global,
+                    nivel_madurez=resultado.nivel_madurez,
+                    valores={str(indicador.id): float(valores[i, j]) for j, indicador in enumerate(indicadores)},
+                    num_indicadores=len(indicadores),
+                )
+                for i, resultado in zip(range(inicio, fin), resultados)
+            ])
+
+    def _medir_pipeline(self, directorio, options, rng):
+        analizador = AnalizadorMadurezDigital()
+        analizador.model_path = directorio
+
+        (X, y), extraccion, memoria_extraccion = _medir(analizador.extraer_datos_entrenamiento)
+        if X is None:
+            raise CommandError('No se pudieron extraer datos de entrenamiento')
+
+        def ajustar():
+            analizador.scaler = StandardScaler()
+            X_scaled = analizador.scaler.fit_transform(X)
+            analizador.modelo = analizador._nuevo_clasificador()
+            analizador.modelo.fit(X_scaled, y)
+
+        _, ajuste, memoria_ajuste = _medir(ajustar)
+
+        # Artefacto con el mismo formato que un entrenamiento real
+        _, ruta, _ = analizador.guardar_modelo('benchmark')
+        inicio = time.perf_counter()
+        joblib.load(ruta, mmap_mode=getattr(settings, 'ML_MODELO_MMAP_MODE', 'r'))
+        carga = (time.perf_counter() - inicio) * 1000
+        analizador.bosque_plano = BosquePlano.desde_sklearn(analizador.modelo)
+
+        # Inferencia por el mismo camino que predecir_madurez / predecir_lote
+        repeticiones = options['repeticiones']
+        filas = X.sample(n=min(options['filas_lote'], len(X)), replace=len(X) < options['filas_lote'],
+                         random_state=rng)
+        valores = [fila[analizador.indicadores_orden].to_dict() for _, fila in filas.iterrows()]
+        fila_p50, fila_p99 = _percentiles_ms(
+            lambda: analizador._predecir_matriz(analizador._matriz_caracteristicas(valores[:1])),
+            repeticiones
+        )
+        lote_p50, lote_p99 = _percentiles_ms(
+            lambda: analizador._predecir_matriz(analizador._matriz_caracteristicas(valores)),
+            max(5, repeticiones // 20)
+        )
+
+        return {
+            'filas_extraidas': len(X),
+            'caracteristicas': X.shape[1],
+            'extraccion_segundos': extraccion,
+            'memoria_pico_extraccion_mb': memoria_extraccion,
+            'ajuste_segundos': ajuste,
+            'memoria_pico_ajuste_mb': memoria_ajuste,
+            'artefacto_mb': round(os.path.getsize(ruta) / 2**20, 3),
+            'carga_artefacto_ms': round(carga, 2),
+            'fila_p50_ms': fila_p50,
+            'fila_p99_ms': fila_p99,
+            'filas_lote': len(valores),
+            'lote_p50_ms': lote_p50,
+            'lote_p99_ms': lote_p99,
+        }
+
+    def _comparar(self, informe, ruta_referencia, tolerancia):
+        with open(ruta_referencia, encoding='utf-8') as f:
+            referencia = {e['tamaño']: e for e in json.load(f).get('ejecuciones', [])}
+
+        regresiones = []
+        for ejecucion in informe['ejecuciones']:
+            anterior = referencia.get(ejecucion['tamaño'])
+            if not anterior:
+                continue
+            for metrica in METRICAS_COMPARABLES:
+                antes, ahora = anterior.get(metrica), ejecucion.get(metrica)
+                if antes and ahora is not None and ahora > antes * (1 + tolerancia):
+                    regresiones.append({
+                        'tamaño': ejecucion['tamaño'], 'metrica': metrica,
+                        'referencia': antes, 'actual': ahora,
+                        'cambio_relativo': round(ahora / antes - 1, 3),
+                    })
+        return regresiones
@@ -0,0 +1,163 @@
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test.utils import override_settings
+
+import encuestas
+from encuestas.ml import AnalizadorMadurezDigital
+from encuestas.servidor_inferencia import ErrorServidorInferencia, cliente_inferencia
+
+
+class Command(BaseCommand):
+    help = (
+        'Compara el rendimiento (predicciones/s y latencia) de la inferencia en el '
+        'propio proceso frente al servidor de inferencia con micro-lotes, con '
+        'varios hilos concurrentes. Usa el modelo activo y lanza un servidor temporal.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hilos', default='1,4,16', help='Niveles de concurrencia, separados por comas')
+        parser.add_argument('--segundos', type=float, default=5.0, help='Duración de cada medición')
+        parser.add_argument('--ventana-ms', type=float, help='Ventana de agrupación del servidor')
+        parser.add_argument('--semilla', type=int, default=42)
+        parser.add_argument('--salida', help='Fichero JSON de resultados (por defecto, la salida estándar)')
+
+    def handle(self, *args, **options):
+        if not hasattr(socket, 'AF_UNIX'):
+            raise CommandError('El servidor de inferencia requiere sockets Unix (no disponible en este sistema)')
+        try:
+            niveles_hilos = [int(h) for h in options['hilos'].split(',') if h.strip()]
+        except ValueError:
+            raise CommandError('--hilos debe ser una lista de enteros separados por comas')
+
+        local = AnalizadorMadurezDigital()
+        local.usar_servidor = False
+        if not local.cargar_modelo():
+            raise CommandError('No hay un modelo entrenado con el que medir')
+
+        rng = np.random.RandomState(options['semilla'])
+        filas = [
+            dict(zip(local.indicadores_orden, np.round(rng.uniform(1, 5, len(local.indicadores_orden)), 2)))
+            for _ in range(1000)
+        ]
+
+        directorio = tempfile.mkdtemp(prefix='servidor_inferencia_')
+        ruta = os.path.join(directorio, 'inferencia.sock')
+        proceso = self._lanzar_servidor(ruta, options['ventana_ms'])
+        informe = {
+            'modelo_id': local.clave_modelo[0],
+            'cpus': os.cpu_count(),
+            'segundos': options['segundos'],
+            'mediciones': [],
+        }
+        try:
+            with override_settings(ML_SERVIDOR_INFERENCIA_SOCKET=ruta):
+                self._esperar_servidor(proceso)
+                for hilos in niveles_hilos:
+                    self.stderr.write(f'Midiendo con {hilos} hilos...')
+                    en_proceso = self._medir(hilos, filas, options['segundos'], remoto=False)
+                    servidor = self._medir(hilos, filas, options['segundos'], remoto=True)
+                    informe['mediciones'].append({
+                        'hilos': hilos,
+                        'en_proceso': en_proceso,
+                        'servidor': servidor,
+                        'aceleracion': round(
+                            servidor['predicciones_segundo'] / en_proceso['predicciones_segundo'], 3
+                        ) if en_proceso['predicciones_segundo'] else None,
+                    })
+                informe['servidor'] = cliente_inferencia.info(forzar=True).get('estadisticas')
+        finally:
+            proceso.terminate()
+            proceso.wait(timeout=10)
+            if os.path.exists(ruta):
+                os.remove(ruta)
+            os.rmdir(directorio)
+
+        salida = json.dumps(informe, indent=2, ensure_ascii=False)
+        if options['salida']:
+            with open(options['salida'], 'w', encoding='utf-8') as f:
+                f.write(salida)
+            self.stderr.write(self.style.SUCCESS(f'✓ Resultados guardados en {options["salida"]}'))
+        else:
+            self.stdout.write(salida)
+
+    def _lanzar_servidor(self, ruta, ventana_ms):
+        # Mismos ajustes que este proceso (DJANGO_SETTINGS_MODULE se hereda)
+        comando = [sys.executable, '-m', 'django', 'servidor_inferencia', '--socket', ruta]
+        if ventana_ms is not None:
+            comando += ['--ventana-ms', str(ventana_ms)]
+        raiz = os.path.dirname(os.path.dirname(os.path.abspath(encuestas.__file__)))
+        entorno = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [raiz, os.environ.get('PYTHONPATH')])))
+        return subprocess.Popen(comando, stdout=subprocess.DEVNULL, env=entorno)
+
+    def _esperar_servidor(self, proceso, limite=60):
+        inicio = time.monotonic()
+        while time.monotonic() - inicio < limite:
+            if proceso.poll() is not None:
+                raise CommandError('El servidor de inferencia terminó al arrancar')
+            try:
+                if cliente_inferencia.info(forzar=True).get('clave') is not None:
+                    return
+            except ErrorServidorInferencia:
+                pass
+            time.sleep(0.2)
+        raise CommandError('El servidor de inferencia no respondió a tiempo')
+
+    def _medir(self, hilos, filas, segundos, remoto):
+        latencias = [[] for _ in range(hilos)]
+        errores = []
+        fin = [0.0]
+        # Todos los hilos empiezan a la vez, con las matrices ya preparadas
+        barrera = threading.Barrier(
+            hilos + 1, action=lambda: fin.__setitem__(0, time.perf_counter() + segundos)
+        )
+
+        def trabajar(i):
+            analizador = AnalizadorMadurezDigital()
+            analizador.usar_servidor = remoto
+            try:
+                if not analizador.cargar_modelo() or analizador.remoto != remoto:
+                    raise RuntimeError('No se pudo cargar el modelo por el camino a medir')
+                matrices = [analizador._matriz_caracteristicas([fila]) for fila in filas]
+                barrera.wait()
+                j = i
+                while time.perf_counter() < fin[0]:
+                    inicio = time.perf_counter()
+                    analizador._predecir_matriz(matrices[j % len(matrices)])
+                    latencias[i].append(time.perf_counter() - inicio)
+                    j += 1
+            except Exception as e:
+                errores.append(str(e))
+                if not barrera.broken:
+                    barrera.abort()
+            finally:
+                connections.close_all()
+
+        trabajadores = [threading.Thread(target=trabajar, args=(i,)) for i in range(hilos)]
+        for trabajador in trabajadores:
+            trabajador.start()
+        try:
+            barrera.wait()
+        except threading.BrokenBarrierError:
+            pass
+        for trabajador in trabajadores:
+            trabajador.join()
+        if errores:
+            raise CommandError(f'Error durante la medición: {errores[0]}')
+
+        todas = np.concatenate([np.array(l) for l in latencias]) * 1000
+        return {
+            'predicciones': int(len(todas)),
+            'predicciones_segundo': round(len(todas) / segundos, 1),
+            'latencia_p50_ms': round(float(np.percentile(todas, 50)), 4) if len(todas) else None,
+            'latencia_p99_ms': round(float(np.percentile(todas, 99)), 4) if len(todas) else None,
+        }
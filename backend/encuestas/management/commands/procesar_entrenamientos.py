@@ -0,0 +1,91 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from encuestas.trabajos import MODOS_ENTRENAMIENTO, encolar_entrenamiento, procesar_pendientes
+
+
+class Command(BaseCommand):
+    help = 'Worker local que ejecuta los trabajos de entrenamiento del modelo de IA'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--una-vez',
+            action='store_true',
+            help='Procesar los trabajos pendientes y terminar',
+        )
+        parser.add_argument(
+            '--encolar',
+            choices=MODOS_ENTRENAMIENTO,
+            help='Encolar un entrenamiento de este modo antes de procesar la cola '
+                 '(p. ej. actualización incremental nocturna desde cron)',
+        )
+        parser.add_argument(
+            '--comparar',
+            action='store_true',
+            help='Con --encolar incremental: comparar con un entrenamiento completo',
+        )
+        parser.add_argument(
+            '--ajustar-hiperparametros',
+            action='store_true',
+            help='Con --encolar completo: buscar hiperparámetros en paralelo',
+        )
+        parser.add_argument(
+            '--presupuesto',
+            type=int,
+            help='Segundos máximos de la búsqueda de hiperparámetros',
+        )
+        parser.add_argument(
+            '--snapshot',
+            help='Con --encolar completo: entrenar desde este snapshot Parquet',
+        )
+        parser.add_argument(
+            '--forzar',
+            action='store_true',
+            help='Con --encolar completo: entrenar aunque los datos no hayan cambiado',
+        )
+        parser.add_argument(
+            '--min-muestras',
+            type=int,
+            help='Con --encolar segmentos: resultados mínimos para que un segmento tenga modelo propio',
+        )
+        parser.add_argument(
+            '--intervalo',
+            type=float,
+            default=5.0,
+            help='Segundos entre consultas a la cola en modo continuo',
+        )
+
+    def handle(self, *args, **options):
+        if options['encolar']:
+            try:
+                trabajo, creado = encolar_entrenamiento(parametros={
+                    'modo': options['encolar'],
+                    'comparar': options['comparar'],
+                    'ajustar_hiperparametros': options['ajustar_hiperparametros'],
+                    'presupuesto_segundos': options['presupuesto'],
+                    'snapshot': options['snapshot'],
+                    'min_muestras': options['min_muestras'],
+                    'forzar': options['forzar'],
+                })
+            except ValueError as e:
+                raise CommandError(str(e))
+            if creado:
+                self.stdout.write(f'✓ Trabajo encolado: #{trabajo.id} ({options["encolar"]})')
+            else:
+                self.stdout.write(f'- Ya hay un trabajo en cola o en curso: #{trabajo.id}')
+
+        if options['una_vez']:
+            procesados = procesar_pendientes()
+            self.stdout.write(f'✓ Trabajos procesados: {procesados}')
+            return
+
+        self.stdout.write('Worker de entrenamiento iniciado (Ctrl+C para salir)...')
+        try:
+            while True:
+                procesados = procesar_pendientes()
+                if procesados:
+                    self.stdout.write(f'✓ Trabajos procesados: {procesados}')
+                time.sleep(options['intervalo'])
+        except KeyboardInterrupt:
+            self.stdout.write('Worker detenido')
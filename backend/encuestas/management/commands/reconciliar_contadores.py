@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from encuestas.contadores import FILA, reconstruir_contadores
+from encuestas.models import ContadoresDashboard
+
+
+class Command(BaseCommand):
+    help = (
+        'Recalcula desde cero los contadores del dashboard '
+        '(tablas contadores_dashboard y contador_nivel_madurez)'
+    )
+
+    def handle(self, *args, **options):
+        antes = ContadoresDashboard.objects.filter(pk=FILA).values().first() or {}
+        valores = reconstruir_contadores()
+        for campo, valor in valores.items():
+            anterior = antes.get(campo)
+            if anterior != valor:
+                self.stdout.write(f'  {campo}: {anterior} -> {valor}')
+        self.stdout.write(self.style.SUCCESS('✓ Contadores del dashboard recalculados'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from encuestas.caracteristicas import reconstruir_caracteristicas
+
+
+class Command(BaseCommand):
+    help = 'Recalcula desde cero la tabla de características por resultado (caracteristicas_resultado)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tamaño-bloque', type=int, default=5000, help='Filas por bloque de lectura/escritura')
+
+    def handle(self, *args, **options):
+        filas = reconstruir_caracteristicas(options['tamaño_bloque'])
+        self.stdout.write(self.style.SUCCESS(f'✓ {filas} resultados recalculados'))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from encuestas.momentos import reconstruir_momentos
+from encuestas.tendencias import reconstruir_tendencias
+
+
+class Command(BaseCommand):
+    help = (
+        'Recalcula desde cero los agregados del análisis de tendencias '
+        '(tablas tendencia_mensual y momentos_indicadores)'
+    )
+
+    def handle(self, *args, **options):
+        filas = reconstruir_tendencias()
+        self.stdout.write(self.style.SUCCESS(f'✓ {filas} filas de tendencias recalculadas'))
+        acumuladores = reconstruir_momentos()
+        self.stdout.write(self.style.SUCCESS(f'✓ {acumuladores} acumuladores de correlaciones recalculados'))
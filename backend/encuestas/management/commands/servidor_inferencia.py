@@ -0,0 +1,46 @@
+import asyncio
+import socket
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from encuestas.servidor_inferencia import ServidorInferencia
+
+
+class Command(BaseCommand):
+    help = (
+        'Servidor de inferencia local: mantiene el modelo de IA cargado una vez y '
+        'atiende predicciones por un socket Unix agrupándolas en micro-lotes'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--socket',
+            help='Ruta del socket Unix (por defecto ML_SERVIDOR_INFERENCIA_SOCKET)',
+        )
+        parser.add_argument(
+            '--ventana-ms',
+            type=float,
+            help='Milisegundos que se esperan para juntar peticiones en un lote',
+        )
+        parser.add_argument(
+            '--max-filas',
+            type=int,
+            help='Filas máximas por lote',
+        )
+
+    def handle(self, *args, **options):
+        if not hasattr(socket, 'AF_UNIX'):
+            raise CommandError('El servidor de inferencia requiere sockets Unix (no disponible en este sistema)')
+
+        ruta = options['socket'] or getattr(settings, 'ML_SERVIDOR_INFERENCIA_SOCKET', None)
+        if not ruta:
+            raise CommandError('Indique --socket o configure ML_SERVIDOR_INFERENCIA_SOCKET')
+
+        servidor = ServidorInferencia(ruta, options['ventana_ms'], options['max_filas'])
+        self.stdout.write(
+            f'Servidor de inferencia escuchando en {ruta} '
+            f'(ventana {servidor.ventana * 1000:g} ms, hasta {servidor.max_filas} filas)...'
+        )
+        asyncio.run(servidor.servir())
+        self.stdout.write(f'Servidor detenido: {servidor.estadisticas()}')
@@ -0,0 +1,30 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from encuestas.snapshots import crear_snapshot, listar_snapshots
+
+
+class Command(BaseCommand):
+    help = 'Exporta el conjunto de entrenamiento a un snapshot Parquet (o lista los existentes)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--nombre', help='Nombre del snapshot (por defecto snapshot_<fecha>)')
+        parser.add_argument('--listar', action='store_true', help='Listar los snapshots existentes')
+
+    def handle(self, *args, **options):
+        try:
+            if options['listar']:
+                for info in listar_snapshots():
+                    self.stdout.write(
+                        f"{info.get('nombre', '?'):32} {info.get('filas', '?'):>8} filas  "
+                        f"{info.get('fecha_creacion', '')}  {info.get('huella', '')[:16]}"
+                    )
+                return
+
+            info = crear_snapshot(options['nombre'])
+        except (ValueError, RuntimeError) as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(f"✓ Snapshot {info['nombre']} creado ({info['filas']} filas)"))
+        self.stdout.write(json.dumps({k: info[k] for k in ('huella', 'ruta', 'tamaño_bytes')}, indent=2, ensure_ascii=False))
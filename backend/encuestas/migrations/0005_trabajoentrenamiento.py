@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:40
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('encuestas', '0004_indicador_institucion_modeloia_rol_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrabajoEntrenamiento',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('estado', models.CharField(db_index=True, default='pendiente', max_length=20)),
+                ('progreso', models.IntegerField(default=0)),
+                ('etapa', models.CharField(blank=True, max_length=100)),
+                ('parametros', models.JSONField(blank=True, default=dict)),
+                ('resultado', models.JSONField(blank=True, null=True)),
+                ('error', models.TextField(blank=True)),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('fecha_inicio', models.DateTimeField(blank=True, null=True)),
+                ('fecha_fin', models.DateTimeField(blank=True, null=True)),
+                ('modelo', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='encuestas.modeloia')),
+                ('solicitado_por', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'trabajo_entrenamiento',
+                'constraints': [models.UniqueConstraint(condition=models.Q(('estado', 'en_curso')), fields=('estado',), name='un_entrenamiento_en_curso')],
+            },
+        ),
+    ]
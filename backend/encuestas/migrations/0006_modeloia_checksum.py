@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('encuestas', '0005_trabajoentrenamiento'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='modeloia',
+            name='checksum',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def calcular_tendencias(apps, schema_editor):
+    from encuestas.tendencias import _reconstruir
+
+    _reconstruir(
+        apps.get_model('encuestas', 'ResultadoEncuesta'),
+        apps.get_model('encuestas', 'ResultadoIndicador'),
+        apps.get_model('encuestas', 'TendenciaMensual'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('encuestas', '0006_modeloia_checksum'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TendenciaMensual',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mes', models.DateField()),
+                ('cantidad', models.IntegerField(default=0)),
+                ('suma', models.FloatField(default=0)),
+                ('suma_cuadrados', models.FloatField(default=0)),
+                ('indicador', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='encuestas.indicador')),
+                ('institucion', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='encuestas.institucion')),
+            ],
+            options={
+                'db_table': 'tendencia_mensual',
+                'constraints': [models.UniqueConstraint(condition=models.Q(('indicador__isnull', False)), fields=('institucion', 'mes', 'indicador'), name='tendencia_mensual_indicador_unica'), models.UniqueConstraint(condition=models.Q(('indicador__isnull', True)), fields=('institucion', 'mes'), name='tendencia_mensual_global_unica')],
+            },
+        ),
+        migrations.RunPython(calcular_tendencias, migrations.RunPython.noop),
+    ]
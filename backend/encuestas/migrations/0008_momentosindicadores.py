@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def calcular_momentos(apps, schema_editor):
+    from encuestas.momentos import _reconstruir
+
+    _reconstruir(
+        apps.get_model('encuestas', 'Indicador'),
+        apps.get_model('encuestas', 'ResultadoIndicador'),
+        apps.get_model('encuestas', 'MomentosIndicadores'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('encuestas', '0007_tendenciamensual'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MomentosIndicadores',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('indicadores', models.JSONField(default=list)),
+                ('n', models.IntegerField(default=0)),
+                ('medias', models.JSONField(default=list)),
+                ('comomentos', models.JSONField(default=list)),
+                ('fecha_actualizacion', models.DateTimeField(auto_now=True)),
+                ('institucion', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to='encuestas.institucion')),
+            ],
+            options={
+                'db_table': 'momentos_indicadores',
+            },
+        ),
+        migrations.RunPython(calcular_momentos, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('encuestas', '0008_momentosindicadores'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='modeloia',
+            name='snapshot',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+    ]
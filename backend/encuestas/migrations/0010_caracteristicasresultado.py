@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:56
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def calcular_caracteristicas(apps, schema_editor):
+    from encuestas.caracteristicas import _reconstruir
+
+    _reconstruir(
+        apps.get_model('encuestas', 'ResultadoEncuesta'),
+        apps.get_model('encuestas', 'ResultadoIndicador'),
+        apps.get_model('encuestas', 'CaracteristicasResultado'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('encuestas', '0009_modeloia_snapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CaracteristicasResultado',
+            fields=[
+                ('resultado', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='caracteristicas', serialize=False, to='encuestas.resultadoencuesta')),
+                ('fecha_calculo', models.DateTimeField(db_index=True)),
+                ('puntuacion_global', models.FloatField()),
+                ('nivel_madurez', models.CharField(max_length=50)),
+                ('valores', models.JSONField(default=dict)),
+                ('num_indicadores', models.IntegerField(default=0)),
+                ('fecha_actualizacion', models.DateTimeField(auto_now=True)),
+                ('institucion', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='encuestas.institucion')),
+            ],
+            options={
+                'db_table': 'caracteristicas_resultado',
+            },
+        ),
+        migrations.RunPython(calcular_caracteristicas, migrations.RunPython.noop),
+    ]
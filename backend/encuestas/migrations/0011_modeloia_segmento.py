@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 21:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('encuestas', '0010_caracteristicasresultado'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='modeloia',
+            name='segmento',
+            field=models.CharField(blank=True, db_index=True, max_length=255),
+        ),
+    ]
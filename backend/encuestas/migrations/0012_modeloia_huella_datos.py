@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 21:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('encuestas', '0011_modeloia_segmento'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='modeloia',
+            name='huella_datos',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+    ]
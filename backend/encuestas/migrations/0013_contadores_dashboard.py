@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-17 21:15
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('encuestas', '0012_modeloia_huella_datos'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContadoresDashboard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_encuestas', models.IntegerField(default=0)),
+                ('total_respuestas', models.IntegerField(default=0)),
+                ('total_evaluaciones', models.IntegerField(default=0)),
+                ('total_instituciones', models.IntegerField(default=0)),
+                ('usuarios_activos', models.IntegerField(default=0)),
+                ('suma_puntuaciones', models.FloatField(default=0)),
+                ('nivel_predominante', models.CharField(blank=True, max_length=50)),
+                ('fecha_actualizacion', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'contadores_dashboard',
+            },
+        ),
+        migrations.CreateModel(
+            name='ContadorNivelMadurez',
+            fields=[
+                ('nivel_madurez', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('cantidad', models.IntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'contador_nivel_madurez',
+            },
+        ),
+        # Los contadores se calculan en 0017, con la forma actual de
+        # ContadorNivelMadurez (encuestas.contadores._reconstruir)
+    ]
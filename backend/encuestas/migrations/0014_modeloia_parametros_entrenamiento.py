@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 21:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('encuestas', '0013_contadores_dashboard'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='modeloia',
+            name='parametros_entrenamiento',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
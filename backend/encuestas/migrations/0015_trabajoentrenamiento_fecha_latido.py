@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 21:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('encuestas', '0014_modeloia_parametros_entrenamiento'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trabajoentrenamiento',
+            name='fecha_latido',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
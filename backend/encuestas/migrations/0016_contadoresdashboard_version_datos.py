@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-17 21:29
+
+import time
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('encuestas', '0015_trabajoentrenamiento_fecha_latido'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='contadoresdashboard',
+            name='version_datos',
+            field=models.BigIntegerField(default=time.time_ns),
+        ),
+    ]
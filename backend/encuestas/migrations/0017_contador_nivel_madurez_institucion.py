@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-17 21:55
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def calcular_contadores(apps, schema_editor):
+    from encuestas.contadores import _reconstruir
+
+    _reconstruir(
+        apps.get_model('encuestas', 'Encuesta'),
+        apps.get_model('encuestas', 'Respuesta'),
+        apps.get_model('encuestas', 'Institucion'),
+        apps.get_model(settings.AUTH_USER_MODEL),
+        apps.get_model('encuestas', 'ResultadoEncuesta'),
+        apps.get_model('encuestas', 'ContadoresDashboard'),
+        apps.get_model('encuestas', 'ContadorNivelMadurez'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('encuestas', '0016_contadoresdashboard_version_datos'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    # Los contadores por nivel son datos derivados: se recrea la tabla con la
+    # institución en la clave y se vuelven a calcular
+    operations = [
+        migrations.DeleteModel(
+            name='ContadorNivelMadurez',
+        ),
+        migrations.CreateModel(
+            name='ContadorNivelMadurez',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nivel_madurez', models.CharField(max_length=50)),
+                ('cantidad', models.IntegerField(default=0)),
+                ('institucion', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='encuestas.institucion')),
+            ],
+            options={
+                'db_table': 'contador_nivel_madurez',
+                'constraints': [models.UniqueConstraint(fields=('institucion', 'nivel_madurez'), name='contador_nivel_madurez_unico')],
+            },
+        ),
+        migrations.RunPython(calcular_contadores, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-17 21:57
+
+import time
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('encuestas', '0017_contador_nivel_madurez_institucion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VersionDatos',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.BigIntegerField(default=time.time_ns)),
+            ],
+            options={
+                'db_table': 'version_datos',
+            },
+        ),
+        migrations.RemoveField(
+            model_name='contadoresdashboard',
+            name='version_datos',
+        ),
+    ]
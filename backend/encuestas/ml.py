@@ -8,20 +8,382 @@ import numpy as np
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.preprocessing import StandardScaler
 from sklearn.model_selection import train_test_split
-from sklearn.metrics import classification_report, accuracy_score
+from sklearn.metrics import classification_report, accuracy_score, f1_score
 import joblib
 import os
+import copy
+import tempfile
+import uuid
+import hashlib
+import json
+import threading
+import time
 from datetime import datetime
+from collections import OrderedDict
+from itertools import islice
 import logging
 
 from django.conf import settings
+from django.db.models import Count, Max, Sum
+from .escritura_diferida import buffer_predicciones
+from .ml_busqueda import busqueda_sucesiva, crear_estimador, medir_latencia
+from .ml_inferencia import BosquePlano
+from .ml_segmentos import clave_segmento, entrenar_segmentos, motivo_descarte
+from .momentos import combinar_momentos
+from .servidor_inferencia import ErrorServidorInferencia, cliente_inferencia
+from .snapshots import cargar_snapshot
 from .models import (
-    ResultadoEncuesta, ResultadoIndicador, Indicador, 
-    ModeloIA, PrediccionIA, Respuesta
+    ResultadoEncuesta, ResultadoIndicador, Indicador, Institucion,
+    ModeloIA, PrediccionIA, TendenciaMensual, CaracteristicasResultado, ContadorNivelMadurez
 )
 
 logger = logging.getLogger(__name__)
 
+ERROR_SIN_MODELO = "No hay un modelo de IA disponible. Entrénelo primero con ia/entrenar-modelo/"
+
+
+class RegistroModelos:
+    """
+    Registro de modelos a nivel de proceso.
+    Carga el artefacto una sola vez y lo mantiene en memoria, identificado por
+    el último ModeloIA y el mtime/tamaño de su fichero. Cuando cambia alguno de
+    ellos se recarga y se sustituye la entrada completa de forma atómica.
+    
+    Los artefactos versionados se abren con joblib mmap_mode, de modo que los
+    arrays de los árboles se comparten entre procesos a través de la caché de
+    páginas del sistema operativo.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entrada = None
+        self._ultima_validacion = 0.0
+    
+    def _intervalo_revalidacion(self):
+        return getattr(settings, 'ML_MODELO_REVALIDACION_SEGUNDOS', 5)
+    
+    @staticmethod
+    def ruta_legacy():
+        """Fichero único usado antes de versionar los artefactos."""
+        return os.path.join(settings.BASE_DIR, 'ml_models', 'modelo_madurez.pkl')
+    
+    def _localizar(self):
+        """
+        Devuelve (clave, checksum esperado) del artefacto activo o (None, None).
+        Clave barata: (id del último ModeloIA, ruta, mtime, tamaño).
+        """
+        modelo_bd = ModeloIA.objects.filter(segmento='').order_by('-fecha_entrenamiento').values_list(
+            'id', 'ruta_fichero', 'checksum'
+        ).first()
+        
+        candidatos = []
+        if modelo_bd:
+            candidatos.append((modelo_bd[1], modelo_bd[2] or None))
+        # Compatibilidad con modelos guardados antes del versionado
+        candidatos.append((self.ruta_legacy(), None))
+        
+        for ruta, checksum in candidatos:
+            try:
+                info = os.stat(ruta)
+            except (OSError, ValueError):
+                continue
+            modelo_bd_id = modelo_bd[0] if modelo_bd else None
+            return (modelo_bd_id, str(ruta), info.st_mtime_ns, info.st_size), checksum
+        
+        return None, None
+    
+    @staticmethod
+    def checksum(ruta_modelo):
+        sha = hashlib.sha256()
+        with open(ruta_modelo, 'rb') as f:
+            for bloque in iter(lambda: f.read(1024 * 1024), b''):
+                sha.update(bloque)
+        return sha.hexdigest()
+    
+    def obtener(self):
+        """
+        Devuelve la entrada activa (dict con modelo, scaler, ...) o None
+        si no hay artefacto en disco.
+        """
+        entrada = self._entrada
+        ahora = time.monotonic()
+        if entrada and ahora - self._ultima_validacion < self._intervalo_revalidacion():
+            return entrada
+        
+        clave, checksum_esperado = self._localizar()
+        if clave is None:
+            return None
+        if entrada and entrada['clave'] == clave:
+            self._ultima_validacion = ahora
+            return entrada
+        
+        with self._lock:
+            # Otro hilo pudo haber recargado mientras esperábamos el lock
+            entrada = self._entrada
+            if entrada and entrada['clave'] == clave:
+                return entrada
+            
+            ruta_modelo = clave[1]
+            checksum = self.checksum(ruta_modelo)
+            if checksum_esperado and checksum != checksum_esperado:
+                logger.error(f"Checksum incorrecto en {ruta_modelo}; se mantiene el modelo anterior")
+                return entrada
+            
+            modelo_data = joblib.load(
+                ruta_modelo, mmap_mode=getattr(settings, 'ML_MODELO_MMAP_MODE', 'r')
+            )
+            anterior = self._entrada
+            entrada = self._preparar_entrada(modelo_data, clave, checksum)
+            self._entrada = entrada
+            self._ultima_validacion = time.monotonic()
+            logger.info(f"Modelo cargado en el registro: {ruta_modelo}")
+        if anterior is not None:
+            # Nuevo modelo en producción: lo cacheado con el anterior ya no sirve
+            cache_predicciones.vaciar()
+        return entrada
+    
+    def publicar(self, modelo_data, modelo_bd):
+        """Sustituir la entrada activa por un modelo recién entrenado en este proceso."""
+        info = os.stat(modelo_bd.ruta_fichero)
+        entrada = self._preparar_entrada(
+            modelo_data,
+            (modelo_bd.id, modelo_bd.ruta_fichero, info.st_mtime_ns, info.st_size),
+            modelo_bd.checksum
+        )
+        with self._lock:
+            self._entrada = entrada
+            self._ultima_validacion = time.monotonic()
+        cache_predicciones.vaciar()
+        return entrada
+    
+    @staticmethod
+    def _preparar_entrada(modelo_data, clave, checksum):
+        """Entrada del registro: artefacto + bosque plano para la inferencia rápida."""
+        bosque = None
+        if modelo_data.get('bosque_plano') is not None:
+            bosque = BosquePlano.desde_dict(modelo_data['bosque_plano'])
+        elif hasattr(modelo_data['modelo'], 'estimators_'):
+            # Artefactos anteriores al bosque plano: se aplana al cargar
+            bosque = BosquePlano.desde_sklearn(modelo_data['modelo'])
+        
+        return dict(
+            modelo_data,
+            bosque=bosque,
+            clave=clave,
+            checksum=checksum,
+            cargado_en=datetime.now(),
+        )
+    
+
+
+registro_modelos = RegistroModelos()
+
+
+class RegistroSegmentos:
+    """
+    Registro de los modelos por segmento (ml_segmentos) a nivel de proceso.
+    Solo mantiene en memoria los ML_SEGMENTOS_MAX_MODELOS usados más
+    recientemente y, como mucho, ML_SEGMENTOS_MEMORIA_MAX_MB de artefactos;
+    al superarse se descarta el menos usado (LRU). El índice segmento ->
+    último ModeloIA se relee con la misma frecuencia que el modelo global.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._modelos = OrderedDict()
+        self._indice = {}
+        self._indice_validado = 0.0
+        self.aciertos = 0
+        self.cargas = 0
+        self.descartes = 0
+    
+    def _max_modelos(self):
+        return getattr(settings, 'ML_SEGMENTOS_MAX_MODELOS', 20)
+    
+    def _max_bytes(self):
+        return getattr(settings, 'ML_SEGMENTOS_MEMORIA_MAX_MB', 512) * 2**20
+    
+    def _actualizar_indice(self):
+        ahora = time.monotonic()
+        if ahora - self._indice_validado < getattr(settings, 'ML_MODELO_REVALIDACION_SEGUNDOS', 5):
+            return
+        indice = {}
+        for segmento, modelo_id, ruta, checksum in ModeloIA.objects.exclude(segmento='').order_by(
+            'segmento', '-fecha_entrenamiento'
+        ).values_list('segmento', 'id', 'ruta_fichero', 'checksum'):
+            indice.setdefault(segmento, (modelo_id, ruta, checksum))
+        self._indice = indice
+        self._indice_validado = ahora
+    
+    def hay_modelos(self):
+        self._actualizar_indice()
+        return bool(self._indice)
+    
+    def segmentos_de(self, institucion_ids):
+        """{institucion_id: segmento} de las instituciones indicadas (una consulta)."""
+        campos = list(getattr(settings, 'ML_SEGMENTOS_CAMPOS', ('nivel_educativo', 'pais')))
+        return {
+            datos['id']: clave_segmento(campos, datos)
+            for datos in Institucion.objects.filter(id__in=set(institucion_ids)).values('id', *campos)
+        }
+    
+    def obtener(self, segmento):
+        """Entrada del modelo del segmento, o None si el segmento no tiene modelo."""
+        self._actualizar_indice()
+        info = self._indice.get(segmento)
+        if info is None:
+            return None
+        modelo_id, ruta, checksum_esperado = info
+    
+        with self._lock:
+            entrada = self._modelos.get(segmento)
+            if entrada is not None and entrada['clave'][0] == modelo_id:
+                self._modelos.move_to_end(segmento)
+                self.aciertos += 1
+                return entrada
+    
+            try:
+                estado = os.stat(ruta)
+                checksum = RegistroModelos.checksum(ruta)
+            except OSError as e:
+                logger.error(f"No se pudo leer el modelo del segmento {segmento}: {e}")
+                return None
+            if checksum_esperado and checksum != checksum_esperado:
+                logger.error(f"Checksum incorrecto en {ruta}; se usa el modelo global")
+                return None
+    
+            modelo_data = joblib.load(ruta, mmap_mode=getattr(settings, 'ML_MODELO_MMAP_MODE', 'r'))
+            entrada = RegistroModelos._preparar_entrada(
+                modelo_data, (modelo_id, ruta, estado.st_mtime_ns, estado.st_size), checksum
+            )
+            entrada['segmento'] = segmento
+            reemplaza = segmento in self._modelos
+            self._modelos[segmento] = entrada
+            self._modelos.move_to_end(segmento)
+            self.cargas += 1
+            self._recortar()
+        if reemplaza:
+            # Reentrenado el segmento: se descartan sus predicciones cacheadas
+            cache_predicciones.vaciar()
+        return entrada
+    
+    def _recortar(self):
+        # Llamar con el lock adquirido; el último cargado nunca se descarta
+        while len(self._modelos) > 1 and (
+            len(self._modelos) > self._max_modelos() or self._bytes() > self._max_bytes()
+        ):
+            segmento, _ = self._modelos.popitem(last=False)
+            self.descartes += 1
+            logger.info(f"Modelo del segmento {segmento} descartado de memoria (LRU)")
+    
+    def _bytes(self):
+        return sum(entrada['clave'][3] for entrada in self._modelos.values())
+    
+    def estadisticas(self):
+        self._actualizar_indice()
+        with self._lock:
+            en_memoria = [
+                {"segmento": segmento, "modelo_id": entrada['clave'][0],
+                 "tamaño_mb": round(entrada['clave'][3] / 2**20, 3)}
+                for segmento, entrada in reversed(self._modelos.items())
+            ]
+            memoria = self._bytes()
+        return {
+            "segmentos_con_modelo": len(self._indice),
+            "en_memoria": len(en_memoria),
+            "max_modelos": self._max_modelos(),
+            "memoria_mb": round(memoria / 2**20, 3),
+            "memoria_max_mb": round(self._max_bytes() / 2**20, 3),
+            "aciertos": self.aciertos,
+            "cargas": self.cargas,
+            "descartes": self.descartes,
+            "modelos": en_memoria,
+        }
+
+
+registro_segmentos = RegistroSegmentos()
+
+
+class CachePredicciones:
+    """
+    Caché LRU con caducidad (TTL) de predicciones individuales.
+    La clave es la huella del vector de características junto con la clave
+    del modelo que predice (global o de segmento). Cuando los registros ponen
+    en uso un modelo nuevo la caché se vacía (vaciar), para no ocupar el
+    tamaño máximo con entradas que ya no se van a acertar.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._datos = OrderedDict()
+        self.aciertos = 0
+        self.fallos = 0
+        self.expirados = 0
+        self.invalidaciones = 0
+    
+    def _tamaño_maximo(self):
+        return getattr(settings, 'ML_CACHE_PREDICCIONES_TAMAÑO', 10000)
+    
+    def _ttl(self):
+        return getattr(settings, 'ML_CACHE_PREDICCIONES_TTL', 3600)
+    
+    @staticmethod
+    def huella(X):
+        """Huella del vector de características ordenado."""
+        return hashlib.blake2b(np.ascontiguousarray(X, dtype=np.float64).tobytes(), digest_size=16).hexdigest()
+    
+    def obtener(self, clave_modelo, huella):
+        if self._tamaño_maximo() <= 0:
+            return None
+        clave = (clave_modelo, huella)
+        with self._lock:
+            elemento = self._datos.get(clave)
+            if elemento is None:
+                self.fallos += 1
+                return None
+            caduca, prediccion = elemento
+            if caduca < time.monotonic():
+                del self._datos[clave]
+                self.expirados += 1
+                self.fallos += 1
+                return None
+            self._datos.move_to_end(clave)
+            self.aciertos += 1
+            return dict(prediccion)
+    
+    def guardar(self, clave_modelo, huella, prediccion):
+        tamaño_maximo = self._tamaño_maximo()
+        if tamaño_maximo <= 0:
+            return
+        clave = (clave_modelo, huella)
+        with self._lock:
+            self._datos[clave] = (time.monotonic() + self._ttl(), dict(prediccion))
+            self._datos.move_to_end(clave)
+            while len(self._datos) > tamaño_maximo:
+                self._datos.popitem(last=False)
+    
+    def vaciar(self):
+        with self._lock:
+            self._datos.clear()
+            self.invalidaciones += 1
+    
+    def estadisticas(self):
+        consultas = self.aciertos + self.fallos
+        return {
+            "entradas": len(self._datos),
+            "tamaño_maximo": self._tamaño_maximo(),
+            "ttl_segundos": self._ttl(),
+            "aciertos": self.aciertos,
+            "fallos": self.fallos,
+            "expirados": self.expirados,
+            "invalidaciones": self.invalidaciones,
+            "tasa_aciertos": round(self.aciertos / consultas, 4) if consultas else 0.0,
+        }
+
+
+cache_predicciones = CachePredicciones()
+
+
 class AnalizadorMadurezDigital:
     """
     Analizador de madurez digital con ML.
@@ -30,6 +392,14 @@ class AnalizadorMadurezDigital:
     
     def __init__(self):
         self.modelo = None
+        self.bosque_plano = None
+        self.clave_modelo = None
+        # Con ML_SERVIDOR_INFERENCIA_SOCKET se predice en el servidor de inferencia
+        self.usar_servidor = True
+        self.remoto = False
+        self.clases_remotas = None
+        # Segmento cuyo modelo se cargó (None = modelo global)
+        self.segmento = None
         self.scaler = StandardScaler()
         self.indicadores_orden = []
         self.niveles_madurez = ['Inicial', 'En desarrollo', 'Competente', 'Avanzado', 'Experto']
@@ -38,300 +408,980 @@ class AnalizadorMadurezDigital:
         # Crear directorio de modelos si no existe
         os.makedirs(self.model_path, exist_ok=True)
     
-    def extraer_datos_entrenamiento(self):
+    def extraer_datos_entrenamiento(self, tamaño_bloque=None, desde=None):
         """
         Extrae datos de la BD para entrenamiento del modelo.
-        Convierte ResultadoIndicador en un dataset de Pandas.
+        Lee la tabla desnormalizada CaracteristicasResultado (una fila por
+        resultado con todos sus valores) como tuplas planas, por bloques
+        mediante un cursor de servidor: un solo recorrido, sin pivotar
+        ResultadoIndicador.
+        
+        Args:
+            desde: si se indica, solo resultados calculados después de esa fecha
         """
-        # Obtener todos los resultados con sus indicadores
-        resultados = ResultadoEncuesta.objects.prefetch_related(
-            'valores_indicadores__indicador'
-        ).filter(
-            valores_indicadores__isnull=False
-        ).distinct()
+        tamaño_bloque = tamaño_bloque or getattr(settings, 'ML_EXTRACCION_TAMAÑO_BLOQUE', 5000)
+        
+        # Obtener lista ordenada de indicadores
+        indicadores = list(Indicador.objects.order_by('id').values_list('id', 'nombre'))
+        self.indicadores_orden = [nombre for _, nombre in indicadores]
+        claves = [str(ind_id) for ind_id, _ in indicadores]
+        
+        filas = CaracteristicasResultado.objects.order_by('resultado_id')
+        if desde is not None:
+            filas = filas.filter(fecha_calculo__gt=desde)
+        filas = filas.values_list(
+            'resultado_id', 'valores', 'puntuacion_global', 'nivel_madurez', 'num_indicadores'
+        ).iterator(chunk_size=tamaño_bloque)
+        
+        # Convertir cada bloque a matriz densa resultado x indicador
+        bloques = []
+        while True:
+            bloque = list(islice(filas, tamaño_bloque))
+            if not bloque:
+                break
+            ids, valores, puntuaciones, niveles, num_indicadores = zip(*bloque)
+            matriz = pd.DataFrame.from_records(valores, columns=claves).to_numpy(dtype=float)
+            bloques.append((np.asarray(ids), matriz, np.asarray(puntuaciones, dtype=float),
+                            np.asarray(niveles), np.asarray(num_indicadores)))
         
-        if not resultados.exists():
+        if not bloques or not indicadores:
             logger.warning("No hay datos suficientes para entrenamiento")
             return None, None
         
-        # Crear lista de datos
-        datos = []
-        labels = []
-        
-        # Obtener lista ordenada de indicadores
-        self.indicadores_orden = list(
-            Indicador.objects.values_list('nombre', flat=True).order_by('id')
+        ids_resultado, matriz, puntuaciones, niveles, num_indicadores = (
+            np.concatenate(columna) for columna in zip(*bloques)
         )
         
-        for resultado in resultados:
-            # Crear vector de características por indicador
-            caracteristicas = {}
-            
-            for valor_ind in resultado.valores_indicadores.all():
-                caracteristicas[valor_ind.indicador.nombre] = valor_ind.valor
-            
-            # Solo incluir si tiene todos los indicadores
-            if len(caracteristicas) == len(self.indicadores_orden):
-                # Crear fila de datos en orden consistente
-                fila = [caracteristicas.get(ind, 0) for ind in self.indicadores_orden]
-                
-                # Añadir características adicionales
-                fila.extend([
-                    resultado.puntuacion_global,
-                    len(resultado.valores_indicadores.all()),  # cantidad de indicadores evaluados
-                ])
-                
-                datos.append(fila)
-                labels.append(resultado.nivel_madurez)
-        
-        if not datos:
+        # Solo incluir resultados que tienen todos los indicadores
+        completos = ~np.isnan(matriz).any(axis=1)
+        if not completos.any():
             logger.warning("No se pudieron extraer datos válidos para entrenamiento")
             return None, None
         
-        # Crear DataFrame
+        # Crear DataFrame con las características adicionales
         columnas = self.indicadores_orden + ['puntuacion_global', 'num_indicadores']
-        df = pd.DataFrame(datos, columns=columnas)
+        df = pd.DataFrame(
+            matriz[completos],
+            columns=self.indicadores_orden,
+            index=pd.Index(ids_resultado[completos], name='resultado_id')
+        )
+        df['puntuacion_global'] = puntuaciones[completos]
+        df['num_indicadores'] = num_indicadores[completos]  # cantidad de indicadores evaluados
+        labels = niveles[completos].tolist()
         
         logger.info(f"Datos extraídos: {len(df)} muestras, {len(columnas)} características")
         
         return df, labels
     
-    def entrenar_modelo(self, test_size=0.2, random_state=42):
+    def calcular_huella_datos(self):
+        """
+        Huella barata del conjunto de entrenamiento, calculada con agregados en
+        la BD sin extraer los datos: número de filas, ids y fecha de
+        actualización máximos, sumas del contenido (puntuaciones, valores de
+        indicadores), reparto de niveles e indicadores existentes.
+        """
+        caracteristicas = CaracteristicasResultado.objects.aggregate(
+            filas=Count('pk'),
+            max_id=Max('resultado_id'),
+            max_fecha=Max('fecha_actualizacion'),
+            suma_puntuacion=Sum('puntuacion_global'),
+            suma_indicadores=Sum('num_indicadores'),
+        )
+        valores = ResultadoIndicador.objects.aggregate(
+            filas=Count('pk'), max_id=Max('id'), suma=Sum('valor')
+        )
+        niveles = sorted(
+            CaracteristicasResultado.objects.order_by().values_list('nivel_madurez')
+            .annotate(n=Count('pk')).values_list('nivel_madurez', 'n')
+        )
+        indicadores = list(Indicador.objects.order_by('id').values_list('id', 'nombre'))
+        
+        # Las sumas en coma flotante pueden variar en los últimos dígitos
+        # según el orden en que la BD las acumule
+        for agregados, clave in ((caracteristicas, 'suma_puntuacion'), (valores, 'suma')):
+            if agregados[clave] is not None:
+                agregados[clave] = round(agregados[clave], 6)
+        
+        contenido = json.dumps(
+            [caracteristicas, valores, niveles, indicadores], default=str, sort_keys=True
+        )
+        return hashlib.sha256(contenido.encode('utf-8')).hexdigest()
+    
+    def _modelo_sin_cambios(self, huella, parametros):
+        """
+        Último modelo global entrenado con los mismos datos y los mismos
+        parámetros de entrenamiento (y con artefacto en disco), o None.
+        """
+        ultimo = ModeloIA.objects.filter(segmento='').order_by('-fecha_entrenamiento').first()
+        if (ultimo and ultimo.huella_datos == huella
+                and ultimo.parametros_entrenamiento == parametros
+                and os.path.exists(ultimo.ruta_fichero)):
+            return ultimo
+        return None
+    
+    def entrenar_modelo(self, test_size=0.2, random_state=42, progreso=None,
+                        ajustar_hiperparametros=False, presupuesto_segundos=None,
+                        snapshot=None, forzar=False):
         """
         Entrena el modelo de clasificación de madurez digital.
+        Si la huella de los datos y los parámetros de entrenamiento coinciden
+        con los del último modelo no se entrena (salvo forzar=True) y se
+        devuelve ese modelo.
+        
+        Args:
+            progreso: callable opcional progreso(porcentaje, etapa) que se
+                invoca al terminar cada fase (lo usan los trabajos en segundo plano)
+            ajustar_hiperparametros: buscar familia e hiperparámetros en paralelo
+                (successive halving) en lugar de usar los valores por defecto
+            presupuesto_segundos: tiempo máximo de la búsqueda
+                (por defecto ML_BUSQUEDA_PRESUPUESTO_SEGUNDOS, como mucho
+                ML_BUSQUEDA_PRESUPUESTO_MAX_SEGUNDOS)
+            snapshot: nombre de un snapshot Parquet (encuestas.snapshots) del
+                que leer los datos en lugar de la BD
+            forzar: entrenar aunque los datos no hayan cambiado
         """
         logger.info("Iniciando entrenamiento del modelo...")
+        notificar = progreso or (lambda porcentaje, etapa: None)
         
         # Extraer datos
-        X, y = self.extraer_datos_entrenamiento()
-        if X is None:
-            return {"error": "No hay datos suficientes para entrenar el modelo"}
+        if snapshot:
+            notificar(5, f"Leyendo snapshot {snapshot}")
+            try:
+                X, y, info_snapshot = cargar_snapshot(snapshot)
+            except (ValueError, RuntimeError) as e:
+                return {"error": str(e)}
+            self.indicadores_orden = info_snapshot['indicadores_orden']
+            # La huella de contenido del snapshot identifica sus datos
+            huella = info_snapshot['huella']
+        else:
+            # Antes de extraer: si nada cambió no hace falta ni leer los datos
+            huella = self.calcular_huella_datos()
+        
+        if ajustar_hiperparametros:
+            presupuesto_segundos = min(
+                presupuesto_segundos or getattr(settings, 'ML_BUSQUEDA_PRESUPUESTO_SEGUNDOS', 60),
+                getattr(settings, 'ML_BUSQUEDA_PRESUPUESTO_MAX_SEGUNDOS', 900)
+            )
+        # Con otros parámetros el modelo resultante sería distinto aunque los
+        # datos no hayan cambiado
+        parametros = {
+            "test_size": test_size,
+            "random_state": random_state,
+            "ajustar_hiperparametros": bool(ajustar_hiperparametros),
+            "presupuesto_segundos": presupuesto_segundos if ajustar_hiperparametros else None,
+            "snapshot": snapshot or '',
+        }
+        
+        modelo_previo = None if forzar else self._modelo_sin_cambios(huella, parametros)
+        if modelo_previo:
+            logger.info(f"Datos y parámetros sin cambios desde el modelo #{modelo_previo.id}; no se reentrena")
+            return {
+                "omitido": True,
+                "mensaje": "Los datos y parámetros de entrenamiento no han cambiado desde el "
+                           "último modelo; use forzar para reentrenar",
+                "modelo_id": modelo_previo.id,
+                "precision": modelo_previo.metrica_precision,
+                "huella_datos": huella,
+            }
+        
+        if not snapshot:
+            notificar(5, "Extrayendo datos de entrenamiento")
+            X, y = self.extraer_datos_entrenamiento()
+            if X is None:
+                return {"error": "No hay datos suficientes para entrenar el modelo"}
         
         # Dividir en entrenamiento y prueba
+        notificar(30, "Preparando conjuntos de entrenamiento y prueba")
         X_train, X_test, y_train, y_test = train_test_split(
             X, y, test_size=test_size, random_state=random_state, stratify=y
         )
         
-        # Normalizar características
+        # Normalizar características (scaler nuevo: el anterior puede estar
+        # compartido con el registro de modelos)
+        self.scaler = StandardScaler()
         X_train_scaled = self.scaler.fit_transform(X_train)
         X_test_scaled = self.scaler.transform(X_test)
         
-        # Entrenar RandomForest
-        self.modelo = RandomForestClassifier(
-            n_estimators=100,
-            max_depth=10,
-            min_samples_split=5,
-            min_samples_leaf=2,
-            random_state=random_state,
-            class_weight='balanced'  # Balancear clases automáticamente
-        )
+        nombre_modelo = "RandomForest_MadurezDigital"
+        busqueda = None
         
+        if ajustar_hiperparametros:
+            notificar(35, "Buscando hiperparámetros")
+            busqueda = busqueda_sucesiva(
+                X_train_scaled, y_train,
+                presupuesto_segundos=presupuesto_segundos,
+                latencia_maxima_ms=getattr(settings, 'ML_LATENCIA_MAXIMA_MS', None),
+                random_state=random_state
+            )
+            if "error" in busqueda:
+                return busqueda
+            elegido = busqueda["elegido"]
+            self.modelo = crear_estimador(elegido["familia"], elegido["parametros"], random_state)
+            nombre_modelo = f"{elegido['familia']}_MadurezDigital"
+        else:
+            # Entrenar RandomForest
+            self.modelo = self._nuevo_clasificador(random_state)
+        
+        notificar(60, f"Ajustando {type(self.modelo).__name__}")
         self.modelo.fit(X_train_scaled, y_train)
         
         # Evaluar modelo
+        notificar(80, "Evaluando modelo")
         y_pred = self.modelo.predict(X_test_scaled)
         accuracy = accuracy_score(y_test, y_pred)
         reporte_clasificacion = classification_report(y_test, y_pred, output_dict=True)
         
         # Guardar modelo entrenado
-        self.guardar_modelo()
-        
-        # Guardar info del modelo en BD
-        modelo_bd = ModeloIA.objects.create(
-            nombre_modelo="RandomForest_MadurezDigital",
-            version=f"v{datetime.now().strftime('%Y%m%d_%H%M')}",
-            metrica_precision=round(accuracy, 4),
-            ruta_fichero=os.path.join(self.model_path, 'modelo_madurez.pkl')
+        notificar(90, "Guardando modelo")
+        modelo_bd = self._registrar_modelo(
+            nombre_modelo, accuracy, snapshot=snapshot or '', huella_datos=huella,
+            parametros=parametros
         )
         
         logger.info(f"Modelo entrenado con precisión: {accuracy:.4f}")
         
-        return {
+        resultado = {
             "modelo_id": modelo_bd.id,
             "precision": accuracy,
+            "huella_datos": huella,
             "num_muestras_entrenamiento": len(X_train),
             "num_muestras_prueba": len(X_test),
+            "snapshot": modelo_bd.snapshot or None,
             "reporte_detallado": reporte_clasificacion,
             "importancia_caracteristicas": dict(
                 zip(X.columns, self.modelo.feature_importances_)
             )
         }
+        if busqueda:
+            resultado["busqueda_hiperparametros"] = busqueda
+            resultado["latencia_ms_fila"] = round(
+                medir_latencia(self.bosque_plano or self.modelo, X_test_scaled), 4
+            )
+        return resultado
+    
+    def _nuevo_clasificador(self, random_state=42):
+        """RandomForest con los hiperparámetros por defecto del proyecto."""
+        return RandomForestClassifier(
+            n_estimators=100,
+            max_depth=10,
+            min_samples_split=5,
+            min_samples_leaf=2,
+            random_state=random_state,
+            class_weight='balanced'  # Balancear clases automáticamente
+        )
     
-    def guardar_modelo(self):
-        """Guardar modelo entrenado en disco."""
+    def _registrar_modelo(self, nombre_modelo, precision, snapshot='', segmento='', huella_datos='',
+                          parametros=None):
+        """
+        Guardar el modelo actual en disco, crear su fila ModeloIA y
+        publicarlo en el registro del proceso (los modelos de segmento los
+        carga registro_segmentos cuando se piden).
+        """
+        version = f"v{datetime.now().strftime('%Y%m%d_%H%M')}"
+        modelo_data, ruta_modelo, checksum = self.guardar_modelo(version)
+        
+        # Guardar info del modelo en BD
+        modelo_bd = ModeloIA.objects.create(
+            nombre_modelo=nombre_modelo,
+            version=version,
+            metrica_precision=round(precision, 4),
+            ruta_fichero=ruta_modelo,
+            checksum=checksum,
+            snapshot=snapshot,
+            segmento=segmento,
+            huella_datos=huella_datos,
+            parametros_entrenamiento=parametros or {}
+        )
+        if segmento:
+            return modelo_bd
+        
+        # Publicar el nuevo modelo en el registro del proceso
+        entrada = registro_modelos.publicar(modelo_data, modelo_bd)
+        self.bosque_plano = entrada['bosque']
+        self.clave_modelo = entrada['clave']
+        return modelo_bd
+    
+    def entrenar_segmentos(self, min_muestras=None, test_size=0.2, random_state=42,
+                           progreso=None):
+        """
+        Entrenar en paralelo un modelo por segmento de instituciones
+        (ML_SEGMENTOS_CAMPOS). Los segmentos con menos de min_muestras
+        resultados completos, o con un solo nivel de madurez, no tienen
+        modelo propio y siguen usando el global.
+        
+        Args:
+            min_muestras: mínimo por segmento (por defecto ML_SEGMENTOS_MIN_MUESTRAS)
+        """
+        notificar = progreso or (lambda porcentaje, etapa: None)
+        min_muestras = min_muestras or getattr(settings, 'ML_SEGMENTOS_MIN_MUESTRAS', 200)
+        
+        notificar(5, "Extrayendo datos de entrenamiento")
+        X, y = self.extraer_datos_entrenamiento()
+        if X is None:
+            return {"error": "No hay datos suficientes para entrenar el modelo"}
+        
+        # Segmento de cada resultado a partir de su institución
+        institucion_por_resultado = dict(
+            CaracteristicasResultado.objects.filter(resultado_id__in=X.index.tolist())
+            .values_list('resultado_id', 'institucion_id')
+        )
+        segmento_por_institucion = registro_segmentos.segmentos_de(
+            [i for i in institucion_por_resultado.values() if i is not None]
+        )
+        segmentos = np.array([
+            segmento_por_institucion.get(institucion_por_resultado.get(resultado_id))
+            for resultado_id in X.index
+        ], dtype=object)
+        
+        notificar(20, "Agrupando resultados por segmento")
+        y = np.asarray(y)
+        matriz = X.to_numpy(dtype=float)
+        grupos, omitidos = {}, []
+        for segmento in sorted({s for s in segmentos if s is not None}):
+            filas = segmentos == segmento
+            motivo = motivo_descarte(y[filas], min_muestras)
+            if motivo:
+                omitidos.append({"segmento": segmento, "muestras": int(filas.sum()), "motivo": motivo})
+            else:
+                grupos[segmento] = (matriz[filas], y[filas])
+        
+        notificar(30, f"Entrenando {len(grupos)} modelos de segmento en paralelo")
+        inicio = time.perf_counter()
+        ajustados = entrenar_segmentos(
+            grupos, self._nuevo_clasificador(random_state),
+            n_jobs=getattr(settings, 'ML_SEGMENTOS_PROCESOS', -1),
+            test_size=test_size, random_state=random_state
+        )
+        tiempo = time.perf_counter() - inicio
+        
+        notificar(85, "Guardando modelos de segmento")
+        entrenados = []
+        for ajuste in ajustados:
+            self.modelo, self.scaler = ajuste['modelo'], ajuste['scaler']
+            modelo_bd = self._registrar_modelo(
+                "RandomForest_MadurezDigital_Segmento", ajuste['precision'], segmento=ajuste['segmento']
+            )
+            entrenados.append({
+                "segmento": ajuste['segmento'],
+                "modelo_id": modelo_bd.id,
+                "precision": ajuste['precision'],
+                "muestras": ajuste['muestras'],
+                "segundos": ajuste['segundos'],
+            })
+        
+        logger.info(f"Modelos de segmento entrenados: {len(entrenados)}, omitidos: {len(omitidos)}")
+        return {
+            "modo": "segmentos",
+            "min_muestras": min_muestras,
+            "segmentos_entrenados": entrenados,
+            "segmentos_omitidos": omitidos,
+            "tiempo_entrenamiento": round(tiempo, 3),
+        }
+    
+    def entrenar_incremental(self, arboles_nuevos=None, comparar=False,
+                             test_size=0.2, random_state=42, progreso=None):
+        """
+        Actualizar el modelo activo solo con los resultados posteriores al
+        último ModeloIA: se añaden árboles nuevos con warm_start sobre el
+        mismo scaler, y se descartan los más antiguos por encima del máximo.
+        
+        Args:
+            arboles_nuevos: árboles a añadir (por defecto ML_INCREMENTAL_ARBOLES)
+            comparar: entrenar además un modelo completo (no se guarda) y
+                comparar ambos sobre el mismo conjunto de prueba
+        """
+        notificar = progreso or (lambda porcentaje, etapa: None)
+        arboles_nuevos = arboles_nuevos or getattr(settings, 'ML_INCREMENTAL_ARBOLES', 20)
+        max_arboles = getattr(settings, 'ML_INCREMENTAL_MAX_ARBOLES', 500)
+        
+        modelo_anterior = ModeloIA.objects.filter(segmento='').order_by('-fecha_entrenamiento').first()
+        entrada = registro_modelos.obtener() if modelo_anterior else None
+        if entrada is None:
+            return {"error": "No hay modelo previo: ejecute primero un entrenamiento completo"}
+        
+        notificar(5, "Extrayendo resultados nuevos")
+        X_nuevo, y_nuevo = self.extraer_datos_entrenamiento(
+            desde=modelo_anterior.fecha_entrenamiento
+        )
+        if X_nuevo is None:
+            return {"error": "No hay resultados nuevos desde el último entrenamiento"}
+        
+        if self.indicadores_orden != entrada['indicadores_orden']:
+            return {"error": "Los indicadores han cambiado: se requiere un entrenamiento completo"}
+        
+        # Los árboles nuevos deben ver todas las clases del modelo; si no,
+        # sus probabilidades no serían combinables con las de los antiguos
+        if set(y_nuevo) != set(entrada['modelo'].classes_):
+            return {
+                "error": "Los resultados nuevos no cubren todos los niveles de madurez: "
+                         "se requiere un entrenamiento completo"
+            }
+        
+        notificar(20, "Preparando conjuntos de entrenamiento y prueba")
+        X_train, X_test, y_train, y_test = train_test_split(
+            X_nuevo, y_nuevo, test_size=test_size, random_state=random_state
+        )
+        
+        # Copia: el modelo del registro lo están usando otras peticiones
+        self.scaler = entrada['scaler']
+        self.modelo = copy.deepcopy(entrada['modelo'])
+        arboles_previos = len(self.modelo.estimators_)
+        
+        # Con warm_start, class_weight='balanced' solo vería el lote nuevo:
+        # se pasan pesos explícitos según todos los resultados acumulados
+        pesos_clases = self._pesos_acumulados(self.modelo.classes_)
+        
+        notificar(40, "Añadiendo árboles con warm_start")
+        inicio = time.perf_counter()
+        self.modelo.set_params(
+            warm_start=True, n_estimators=arboles_previos + arboles_nuevos, class_weight=pesos_clases
+        )
+        self.modelo.fit(self.scaler.transform(X_train), y_train)
+        
+        # Olvidar los árboles más antiguos para acotar tamaño y latencia
+        if len(self.modelo.estimators_) > max_arboles:
+            self.modelo.estimators_ = self.modelo.estimators_[-max_arboles:]
+        self.modelo.set_params(warm_start=False, n_estimators=len(self.modelo.estimators_))
+        tiempo_incremental = time.perf_counter() - inicio
+        
+        notificar(60, "Evaluando modelo")
+        X_test_scaled = self.scaler.transform(X_test)
+        y_pred = self.modelo.predict(X_test_scaled)
+        accuracy = accuracy_score(y_test, y_pred)
+        
+        resultado = {
+            "modo": "incremental",
+            "modelo_base_id": modelo_anterior.id,
+            "precision": accuracy,
+            "num_muestras_nuevas": len(X_nuevo),
+            "num_muestras_entrenamiento": len(X_train),
+            "num_muestras_prueba": len(X_test),
+            "arboles_previos": arboles_previos,
+            "arboles_totales": len(self.modelo.estimators_),
+            "pesos_clases": pesos_clases,
+            "tiempo_entrenamiento": round(tiempo_incremental, 3),
+        }
+        
+        if comparar:
+            notificar(70, "Entrenando modelo completo para comparar")
+            resultado["comparacion"] = self._comparar_con_completo(
+                X_test, y_test, y_pred, tiempo_incremental, random_state
+            )
+        
+        notificar(90, "Guardando modelo")
+        modelo_bd = self._registrar_modelo("RandomForest_MadurezDigital_Incremental", accuracy)
+        resultado["modelo_id"] = modelo_bd.id
+        
+        logger.info(
+            f"Modelo actualizado incrementalmente con {len(X_nuevo)} muestras nuevas, "
+            f"precisión: {accuracy:.4f}"
+        )
+        return resultado
+    
+    def _pesos_acumulados(self, clases):
+        """
+        Pesos por clase como class_weight='balanced' (n / (clases * n_clase)),
+        pero contando todos los resultados completos hasta ahora, no solo el
+        lote nuevo.
+        """
+        conteos = dict(
+            CaracteristicasResultado.objects.filter(
+                num_indicadores__gte=len(self.indicadores_orden), nivel_madurez__in=list(clases)
+            ).order_by().values_list('nivel_madurez').annotate(n=Count('resultado_id'))
+        )
+        total = sum(conteos.values())
+        return {
+            str(clase): total / (len(clases) * conteos[clase]) if conteos.get(clase) else 1.0
+            for clase in clases
+        }
+    
+    def _comparar_con_completo(self, X_test, y_test, y_pred_incremental,
+                               tiempo_incremental, random_state):
+        """
+        Entrenar un modelo completo con todo el histórico (excepto el conjunto
+        de prueba) y compararlo con el incremental sobre esas mismas muestras.
+        """
+        analizador_completo = AnalizadorMadurezDigital()
+        X_total, y_total = analizador_completo.extraer_datos_entrenamiento()
+        
+        # Excluir las muestras de prueba (el índice es el id del resultado)
+        en_prueba = X_total.index.isin(X_test.index)
+        X_train = X_total[~en_prueba]
+        y_train = [nivel for nivel, excluir in zip(y_total, en_prueba) if not excluir]
+        
+        inicio = time.perf_counter()
+        scaler = StandardScaler()
+        modelo_completo = self._nuevo_clasificador(random_state)
+        modelo_completo.fit(scaler.fit_transform(X_train), y_train)
+        tiempo_completo = time.perf_counter() - inicio
+        
+        y_pred_completo = modelo_completo.predict(scaler.transform(X_test))
+        
+        return {
+            "precision_incremental": accuracy_score(y_test, y_pred_incremental),
+            "precision_completo": accuracy_score(y_test, y_pred_completo),
+            "f1_macro_incremental": f1_score(y_test, y_pred_incremental, average='macro'),
+            "f1_macro_completo": f1_score(y_test, y_pred_completo, average='macro'),
+            "concordancia_predicciones": float(np.mean(y_pred_incremental == y_pred_completo)),
+            "tiempo_incremental": round(tiempo_incremental, 3),
+            "tiempo_completo": round(tiempo_completo, 3),
+            "muestras_entrenamiento_completo": len(X_train),
+        }
+    
+    def guardar_modelo(self, version):
+        """
+        Guardar modelo entrenado en disco en un fichero propio e inmutable.
+        Se escribe en un temporal del mismo directorio y se renombra, así
+        ningún lector ve nunca un fichero a medio escribir.
+        
+        Returns:
+            (modelo_data, ruta del fichero, checksum sha256)
+        """
         modelo_data = {
             'modelo': self.modelo,
             'scaler': self.scaler,
             'indicadores_orden': self.indicadores_orden,
-            'niveles_madurez': self.niveles_madurez
+            'niveles_madurez': self.niveles_madurez,
+            # Arrays planos del bosque: se comparten entre procesos vía mmap
+            'bosque_plano': BosquePlano.desde_sklearn(self.modelo).a_dict()
         }
         
-        ruta_modelo = os.path.join(self.model_path, 'modelo_madurez.pkl')
-        joblib.dump(modelo_data, ruta_modelo)
+        nombre_fichero = f"modelo_madurez_{version}_{uuid.uuid4().hex[:8]}.joblib"
+        ruta_modelo = os.path.join(self.model_path, nombre_fichero)
+        
+        descriptor, ruta_temporal = tempfile.mkstemp(dir=self.model_path, suffix='.tmp')
+        try:
+            with os.fdopen(descriptor, 'wb') as f:
+                # Sin compresión para poder abrirlo con mmap_mode
+                joblib.dump(modelo_data, f)
+                f.flush()
+                os.fsync(f.fileno())
+            checksum = RegistroModelos.checksum(ruta_temporal)
+            os.replace(ruta_temporal, ruta_modelo)
+        except BaseException:
+            if os.path.exists(ruta_temporal):
+                os.remove(ruta_temporal)
+            raise
+        
         logger.info(f"Modelo guardado en: {ruta_modelo}")
+        return modelo_data, ruta_modelo, checksum
     
-    def cargar_modelo(self):
-        """Cargar modelo desde disco."""
-        ruta_modelo = os.path.join(self.model_path, 'modelo_madurez.pkl')
+    def cargar_modelo(self, segmento=None):
+        """
+        Cargar modelo desde el registro del proceso.
+        Solo se lee el fichero de disco la primera vez o cuando cambia el modelo.
+        Nunca entrena: si no hay modelo devuelve False y el entrenamiento se
+        pide aparte (ia/entrenar-modelo/ o manage.py procesar_entrenamientos).
         
-        if not os.path.exists(ruta_modelo):
-            logger.warning("No existe modelo guardado, entrenando nuevo modelo...")
-            resultado_entrenamiento = self.entrenar_modelo()
-            if "error" in resultado_entrenamiento:
-                return False
+        Si hay un servidor de inferencia configurado solo se pide su
+        descripción del modelo; el artefacto no se carga en este proceso.
+        
+        Args:
+            segmento: clave de segmento (ml_segmentos); si tiene modelo propio
+                se usa ese y si no, el global
+        """
+        self.segmento = None
+        if segmento:
+            try:
+                entrada = registro_segmentos.obtener(segmento)
+            except Exception as e:
+                logger.error(f"Error cargando el modelo del segmento {segmento}: {e}")
+                entrada = None
+            if entrada is not None:
+                self.remoto = False
+                self._aplicar_entrada(entrada)
+                self.segmento = segmento
+                return True
+        
+        if self.usar_servidor and cliente_inferencia.configurado():
+            try:
+                info = cliente_inferencia.info()
+                if info.get('clave') is None:
+                    logger.warning("No existe modelo entrenado; hay que entrenar uno antes de predecir")
+                    return False
+                self._aplicar_info_remota(info)
+                return True
+            except ErrorServidorInferencia as e:
+                logger.warning(f"Servidor de inferencia no disponible ({e}); se usa el modelo local")
         
+        self.remoto = False
         try:
-            modelo_data = joblib.load(ruta_modelo)
-            self.modelo = modelo_data['modelo']
-            self.scaler = modelo_data['scaler']
-            self.indicadores_orden = modelo_data['indicadores_orden']
-            self.niveles_madurez = modelo_data['niveles_madurez']
-            logger.info("Modelo cargado exitosamente")
+            modelo_data = registro_modelos.obtener()
+            
+            if modelo_data is None:
+                logger.warning("No existe modelo entrenado; hay que entrenar uno antes de predecir")
+                return False
+            self._aplicar_entrada(modelo_data)
             return True
         except Exception as e:
             logger.error(f"Error cargando modelo: {e}")
             return False
     
-    def predecir_madurez(self, valores_indicadores, resultado_id=None):
+    def _aplicar_entrada(self, entrada):
+        """Usar una entrada de registro_modelos o registro_segmentos."""
+        self.modelo = entrada['modelo']
+        self.bosque_plano = entrada['bosque']
+        self.clave_modelo = entrada['clave']
+        self.scaler = entrada['scaler']
+        self.indicadores_orden = entrada['indicadores_orden']
+        self.niveles_madurez = entrada['niveles_madurez']
+    
+    def _aplicar_info_remota(self, info):
+        """Usar la descripción del modelo que tiene cargado el servidor de inferencia."""
+        self.remoto = True
+        self.modelo = None
+        self.bosque_plano = None
+        self.clave_modelo = tuple(info['clave'])
+        self.indicadores_orden = info['indicadores_orden']
+        self.niveles_madurez = info['niveles_madurez']
+        self.clases_remotas = np.array(info['clases'], dtype=object)
+    
+    @property
+    def clases(self):
+        return self.clases_remotas if self.remoto else self.modelo.classes_
+    
+    def _matriz_caracteristicas(self, lista_valores):
+        """
+        Construir la matriz de características (una fila por dict de valores)
+        en el mismo orden de columnas usado en el entrenamiento.
+        """
+        num_indicadores = len(self.indicadores_orden)
+        indice = {nombre: j for j, nombre in enumerate(self.indicadores_orden)}
+        X = np.zeros((len(lista_valores), num_indicadores + 2))
+        
+        for i, valores in enumerate(lista_valores):
+            for nombre, valor in valores.items():
+                j = indice.get(nombre)
+                if j is not None:
+                    X[i, j] = valor
+            # Características adicionales: puntuación media y nº de indicadores
+            X[i, num_indicadores] = np.mean(list(valores.values())) if valores else 0
+            X[i, num_indicadores + 1] = len(valores)
+        
+        return X
+    
+    def _predecir_matriz(self, X):
+        """
+        Una sola pasada de predict_proba sobre toda la matriz.
+        Devuelve (niveles predichos, matriz de probabilidades).
+        """
+        if self.remoto:
+            return self._predecir_remoto(X)
+        
+        usar_plano = (
+            self.bosque_plano is not None
+            and getattr(settings, 'ML_INFERENCIA_PLANA', True)
+            and len(X) <= getattr(settings, 'ML_INFERENCIA_PLANA_MAX_FILAS', 256)
+        )
+        if usar_plano:
+            # Camino rápido: normalización y recorrido de árboles con numpy
+            X_scaled = (X - self.scaler.mean_) / self.scaler.scale_
+            probabilidades = self.bosque_plano.predict_proba(X_scaled)
+        else:
+            X_scaled = self.scaler.transform(X)
+            probabilidades = self.modelo.predict_proba(X_scaled)
+        niveles = self.modelo.classes_[np.argmax(probabilidades, axis=1)]
+        return niveles, probabilidades
+    
+    def _predecir_remoto(self, X):
+        """Predecir en el servidor de inferencia; si falla, en este proceso."""
+        try:
+            clave, niveles, probabilidades = cliente_inferencia.predecir(X)
+            if clave == self.clave_modelo:
+                return niveles, probabilidades
+            # El servidor cambió de modelo después de cargar_modelo()
+            orden_anterior = self.indicadores_orden
+            self._aplicar_info_remota(cliente_inferencia.info(forzar=True))
+            if clave == self.clave_modelo and self.indicadores_orden == orden_anterior:
+                return niveles, probabilidades
+            raise RuntimeError("El modelo de IA cambió durante la predicción; vuelva a intentarlo")
+        except ErrorServidorInferencia as e:
+            logger.warning(f"Servidor de inferencia no disponible ({e}); se usa el modelo local")
+        
+        self.usar_servidor = False
+        if not self.cargar_modelo():
+            raise RuntimeError(ERROR_SIN_MODELO)
+        return self._predecir_matriz(X)
+    
+    def _formatear_prediccion(self, nivel_predicho, probabilidades, puntuacion_global):
+        """Convertir la salida del modelo al formato de respuesta de la API."""
+        prob_por_nivel = dict(zip(self.clases, probabilidades))
+        probabilidad_maxima = prob_por_nivel.get(nivel_predicho, 0)
+        
+        return {
+            "nivel_predicho": nivel_predicho,
+            "probabilidad": round(probabilidad_maxima, 4),
+            "probabilidades_todas": {
+                nivel: round(prob, 4) 
+                for nivel, prob in prob_por_nivel.items()
+            },
+            "puntuacion_estimada": round(puntuacion_global, 2),
+            "confianza": "alta" if probabilidad_maxima > 0.7 else "media" if probabilidad_maxima > 0.5 else "baja",
+            "segmento": self.segmento
+        }
+    
+    def _segmento_institucion(self, institucion_id=None, resultado_id=None):
+        """Segmento de la institución (o de la del resultado), solo si hay modelos por segmento."""
+        if not registro_segmentos.hay_modelos():
+            return None
+        try:
+            if institucion_id is None and resultado_id:
+                institucion_id = ResultadoEncuesta.objects.filter(pk=int(resultado_id)).values_list(
+                    'institucion_id', flat=True
+                ).first()
+            if institucion_id is None:
+                return None
+            return registro_segmentos.segmentos_de([int(institucion_id)]).get(int(institucion_id))
+        except (TypeError, ValueError):
+            return None
+    
+    def predecir_madurez(self, valores_indicadores, resultado_id=None, institucion_id=None):
         """
         Predecir nivel de madurez digital basado en valores de indicadores.
         
         Args:
             valores_indicadores: dict con {nombre_indicador: valor}
             resultado_id: ID del resultado para guardar predicción
+            institucion_id: institución cuyo modelo de segmento se usa, si lo
+                tiene (por defecto, la del resultado)
         
         Returns:
             dict con nivel predicho y probabilidades
         """
-        if not self.cargar_modelo():
-            return {"error": "No se pudo cargar el modelo de IA"}
+        if not self.cargar_modelo(self._segmento_institucion(institucion_id, resultado_id)):
+            return {"error": ERROR_SIN_MODELO}
         
         # Crear vector de características
-        caracteristicas = []
-        for indicador in self.indicadores_orden:
-            caracteristicas.append(valores_indicadores.get(indicador, 0))
-        
-        # Añadir características adicionales
-        puntuacion_global = np.mean(list(valores_indicadores.values()))
-        caracteristicas.extend([
-            puntuacion_global,
-            len(valores_indicadores)
-        ])
-        
-        # Convertir a array y normalizar
-        X = np.array(caracteristicas).reshape(1, -1)
-        X_scaled = self.scaler.transform(X)
-        
-        # Realizar predicción
-        nivel_predicho = self.modelo.predict(X_scaled)[0]
-        probabilidades = self.modelo.predict_proba(X_scaled)[0]
-        
-        # Crear diccionario de probabilidades por nivel
-        prob_por_nivel = dict(zip(self.modelo.classes_, probabilidades))
-        probabilidad_maxima = prob_por_nivel.get(nivel_predicho, 0)
+        X = self._matriz_caracteristicas([valores_indicadores])
         
-        # Guardar predicción en BD si se proporciona resultado_id
-        if resultado_id:
+        # Vectores idénticos con el mismo modelo dan la misma predicción
+        huella = cache_predicciones.huella(X)
+        prediccion = cache_predicciones.obtener(self.clave_modelo, huella)
+        if prediccion is None:
+            niveles, probabilidades = self._predecir_matriz(X)
+            prediccion = self._formatear_prediccion(
+                niveles[0], probabilidades[0], X[0, len(self.indicadores_orden)]
+            )
+            cache_predicciones.guardar(self.clave_modelo, huella, prediccion)
+        
+        # Guardar predicción si se proporciona resultado_id. Se escribe en
+        # segundo plano por lotes (escritura_diferida), fuera de la petición.
+        # El id del ModeloIA activo forma parte de la clave del registro.
+        modelo_bd_id = self.clave_modelo[0] if self.clave_modelo else None
+        if resultado_id and modelo_bd_id:
             try:
-                resultado = ResultadoEncuesta.objects.get(id=resultado_id)
-                modelo_bd = ModeloIA.objects.order_by('-fecha_entrenamiento').first()
-                
-                if modelo_bd:
-                    PrediccionIA.objects.create(
-                        modelo=modelo_bd,
-                        resultado=resultado,
-                        nivel_pred=nivel_predicho,
-                        probabilidad=probabilidad_maxima
-                    )
-            except Exception as e:
+                buffer_predicciones.agregar(
+                    modelo_id=modelo_bd_id,
+                    resultado_id=int(resultado_id),
+                    nivel_pred=prediccion["nivel_predicho"],
+                    probabilidad=prediccion["probabilidad"]
+                )
+            except (TypeError, ValueError) as e:
                 logger.error(f"Error guardando predicción: {e}")
         
+        return prediccion
+    
+    def _valores_por_resultado(self, resultado_ids):
+        """
+        Obtener {resultado_id: {nombre_indicador: valor}} y
+        {resultado_id: institucion_id} con una sola consulta a la tabla de
+        características por resultado.
+        """
+        nombres = dict(Indicador.objects.values_list('id', 'nombre'))
+        valores = {resultado_id: {} for resultado_id in resultado_ids}
+        instituciones = {}
+        filas = CaracteristicasResultado.objects.filter(
+            resultado_id__in=resultado_ids
+        ).values_list('resultado_id', 'valores', 'institucion_id')
+        
+        for resultado_id, valores_resultado, institucion_id in filas:
+            valores[resultado_id] = {
+                nombres[int(indicador_id)]: valor
+                for indicador_id, valor in valores_resultado.items()
+                if int(indicador_id) in nombres
+            }
+            instituciones[resultado_id] = institucion_id
+        
+        return valores, instituciones
+    
+    def predecir_lote(self, lista_valores=None, resultado_ids=None, guardar=True,
+                      institucion_id=None):
+        """
+        Predecir el nivel de madurez de muchas instituciones en una sola pasada
+        por modelo: las filas se agrupan por segmento y cada grupo se predice
+        con el modelo de su segmento (o con el global si no lo tiene).
+        
+        Args:
+            lista_valores: lista de dicts {nombre_indicador: valor}
+            resultado_ids: lista de IDs de ResultadoEncuesta; sus indicadores se
+                leen de la BD y las predicciones se guardan con bulk_create
+            guardar: si False no se crean filas PrediccionIA
+            institucion_id: institución de las filas de lista_valores
+        
+        Returns:
+            dict con la lista de predicciones en el mismo orden de entrada
+        """
+        if not self.cargar_modelo():
+            return {"error": ERROR_SIN_MODELO}
+        
+        lista_valores = list(lista_valores or [])
+        ids_entrada = []
+        instituciones = []
+        
+        # Resultados existentes: leer todos sus indicadores de una vez
+        if resultado_ids:
+            valores_bd, institucion_bd = self._valores_por_resultado(resultado_ids)
+            for resultado_id in resultado_ids:
+                if valores_bd.get(resultado_id):
+                    ids_entrada.append(resultado_id)
+            lista_valores = [valores_bd[r_id] for r_id in ids_entrada] + lista_valores
+            instituciones = [institucion_bd.get(r_id) for r_id in ids_entrada]
+        instituciones += [institucion_id] * (len(lista_valores) - len(instituciones))
+        
+        if not lista_valores:
+            return {"error": "No hay datos para predecir"}
+        
+        # Filas por segmento (un único grupo si no hay modelos de segmento)
+        segmentos = [None] * len(lista_valores)
+        if registro_segmentos.hay_modelos():
+            por_institucion = registro_segmentos.segmentos_de([i for i in instituciones if i is not None])
+            segmentos = [por_institucion.get(i) for i in instituciones]
+        grupos = {}
+        for i, segmento in enumerate(segmentos):
+            grupos.setdefault(segmento, []).append(i)
+        
+        predicciones = [None] * len(lista_valores)
+        modelo_por_fila = [None] * len(lista_valores)
+        for segmento, filas in grupos.items():
+            if not self.cargar_modelo(segmento):
+                return {"error": ERROR_SIN_MODELO}
+            X = self._matriz_caracteristicas([lista_valores[i] for i in filas])
+            niveles, probabilidades = self._predecir_matriz(X)
+            columna_puntuacion = len(self.indicadores_orden)
+            
+            for k, i in enumerate(filas):
+                prediccion = self._formatear_prediccion(
+                    niveles[k], probabilidades[k], X[k, columna_puntuacion]
+                )
+                if i < len(ids_entrada):
+                    prediccion["resultado_id"] = ids_entrada[i]
+                predicciones[i] = prediccion
+                modelo_por_fila[i] = self.clave_modelo[0] if self.clave_modelo else None
+        
+        # Guardar todas las predicciones de resultados en una sola inserción,
+        # cada una con el ModeloIA que la hizo
+        guardadas = 0
+        if guardar and ids_entrada:
+            filas_prediccion = [
+                PrediccionIA(
+                    modelo_id=modelo_id,
+                    resultado_id=prediccion["resultado_id"],
+                    nivel_pred=prediccion["nivel_predicho"],
+                    probabilidad=prediccion["probabilidad"]
+                )
+                for prediccion, modelo_id in zip(predicciones[:len(ids_entrada)], modelo_por_fila)
+                if modelo_id
+            ]
+            PrediccionIA.objects.bulk_create(filas_prediccion, batch_size=1000)
+            guardadas = len(filas_prediccion)
+        
+        encontrados = set(ids_entrada)
+        ids_sin_datos = [r_id for r_id in (resultado_ids or []) if r_id not in encontrados]
+        
         return {
-            "nivel_predicho": nivel_predicho,
-            "probabilidad": round(probabilidad_maxima, 4),
-            "probabilidades_todas": {
-                nivel: round(prob, 4) 
-                for nivel, prob in prob_por_nivel.items()
-            },
-            "puntuacion_estimada": round(puntuacion_global, 2),
-            "confianza": "alta" if probabilidad_maxima > 0.7 else "media" if probabilidad_maxima > 0.5 else "baja"
+            "total": len(predicciones),
+            "predicciones": predicciones,
+            "predicciones_guardadas": guardadas,
+            "resultados_sin_datos": ids_sin_datos
         }
     
     def analizar_tendencias(self, institucion_id=None):
         """
         Analizar tendencias de madurez digital usando Pandas.
+        
+        Lee los acumulados mensuales de TendenciaMensual (cantidad, suma y
+        suma de cuadrados por institución, mes e indicador) y los contadores
+        de ContadorNivelMadurez, así que el coste depende del número de meses
+        y no del número de resultados.
         """
         # Filtrar por institución si se especifica
         filtro = {}
         if institucion_id:
             filtro['institucion_id'] = institucion_id
         
-        # Obtener resultados
-        resultados = ResultadoEncuesta.objects.filter(**filtro).prefetch_related(
-            'valores_indicadores__indicador'
-        )
+        filas = TendenciaMensual.objects.filter(cantidad__gt=0, **filtro).values(
+            'mes', 'indicador__nombre'
+        ).annotate(
+            n=Sum('cantidad'), suma=Sum('suma'), suma_cuadrados=Sum('suma_cuadrados')
+        ).order_by('mes')
         
-        if not resultados.exists():
+        df = pd.DataFrame(list(filas))
+        if df.empty or df['indicador__nombre'].notna().all():
             return {"error": "No hay datos suficientes para análisis de tendencias"}
         
-        # Crear DataFrame con datos temporales
-        datos_temporales = []
-        
-        for resultado in resultados:
-            fila = {
-                'fecha': resultado.fecha_calculo,
-                'puntuacion_global': resultado.puntuacion_global,
-                'nivel_madurez': resultado.nivel_madurez,
-                'institucion': resultado.institucion.nombre if resultado.institucion else 'Sin institución'
-            }
-            
-            # Añadir valores de indicadores
-            for valor_ind in resultado.valores_indicadores.all():
-                fila[f"ind_{valor_ind.indicador.nombre}"] = valor_ind.valor
-            
-            datos_temporales.append(fila)
+        # indicador NULL = puntuación global
+        df['serie'] = np.where(
+            df['indicador__nombre'].isna(), 'puntuacion_global', 'ind_' + df['indicador__nombre'].astype(str)
+        )
+        mensual = df[df['serie'] == 'puntuacion_global'].set_index('mes')
+        media_mensual = mensual['suma'] / mensual['n']
+        media_mensual.index = [mes.strftime('%Y-%m') for mes in media_mensual.index]
         
-        df = pd.DataFrame(datos_temporales)
+        # Desde los contadores por institución y nivel que mantienen las señales
+        distribucion = ContadorNivelMadurez.objects.filter(cantidad__gt=0, **filtro).values(
+            'nivel_madurez'
+        ).annotate(total=Sum('cantidad')).order_by()
         
-        # Análisis con Pandas
         analisis = {
-            "resumen_estadistico": df.describe().to_dict(),
-            "tendencia_temporal": self._calcular_tendencia_temporal(df),
-            "correlaciones_indicadores": self._calcular_correlaciones(df),
-            "distribucion_niveles": df['nivel_madurez'].value_counts().to_dict(),
-            "evolucion_promedio": self._calcular_evolucion_promedio(df)
+            "resumen_estadistico": self._calcular_resumen_estadistico(df),
+            "tendencia_temporal": self._calcular_tendencia_temporal(media_mensual),
+            "correlaciones_indicadores": self._calcular_correlaciones(institucion_id),
+            "distribucion_niveles": {fila['nivel_madurez']: fila['total'] for fila in distribucion},
+            "evolucion_promedio": self._calcular_evolucion_promedio(media_mensual)
         }
         
         return analisis
     
-    def _calcular_tendencia_temporal(self, df):
-        """Calcular tendencia temporal de puntuaciones."""
-        if 'fecha' not in df.columns:
-            return {}
-        
-        df_temporal = df.copy()
-        df_temporal['fecha'] = pd.to_datetime(df_temporal['fecha'])
-        df_temporal = df_temporal.sort_values('fecha')
+    def _calcular_resumen_estadistico(self, df):
+        """Número, media y desviación típica por serie a partir de los acumulados."""
+        totales = df.groupby('serie')[['n', 'suma', 'suma_cuadrados']].sum()
+        n = totales['n']
+        media = totales['suma'] / n
+        # Varianza muestral (ddof=1, como describe()); se recorta a 0 por redondeo
+        varianza = ((totales['suma_cuadrados'] - n * media ** 2) / (n - 1)).clip(lower=0)
+        desviacion = np.sqrt(varianza).where(n > 1)
         
-        # Agrupar por mes
-        df_temporal['mes_año'] = df_temporal['fecha'].dt.to_period('M')
-        tendencia_mensual = df_temporal.groupby('mes_año')['puntuacion_global'].mean()
+        return {
+            serie: {
+                "count": float(n[serie]),
+                "mean": float(media[serie]),
+                "std": None if pd.isna(desviacion[serie]) else float(desviacion[serie]),
+            }
+            for serie in totales.index
+        }
+    
+    def _calcular_tendencia_temporal(self, media_mensual):
+        """Calcular tendencia temporal de puntuaciones (media por mes)."""
+        pendiente = 0.0
+        if len(media_mensual) >= 2:
+            pendiente = float(np.polyfit(range(len(media_mensual)), media_mensual.values, 1)[0])
         
         return {
-            "tendencia_mensual": tendencia_mensual.to_dict(),
-            "pendiente_general": float(
-                np.polyfit(range(len(tendencia_mensual)), tendencia_mensual.values, 1)[0]
-            )
+            "tendencia_mensual": {mes: float(valor) for mes, valor in media_mensual.items()},
+            "pendiente_general": pendiente
         }
     
-    def _calcular_correlaciones(self, df):
+    def _calcular_correlaciones(self, institucion_id=None):
         """Calcular correlaciones entre indicadores."""
-        columnas_indicadores = [col for col in df.columns if col.startswith('ind_')]
-        
-        if len(columnas_indicadores) < 2:
+        # A partir de los acumuladores de momentos por institución: O(k²)
+        # para k indicadores, independiente del número de resultados
+        indicadores, momentos = combinar_momentos(institucion_id)
+        if momentos is None or len(indicadores) < 2 or momentos.n < 2:
             return {}
         
-        correlaciones = df[columnas_indicadores + ['puntuacion_global']].corr()
+        nombres = dict(Indicador.objects.filter(id__in=indicadores).values_list('id', 'nombre'))
+        columnas = ['puntuacion_global'] + [f"ind_{nombres.get(i, i)}" for i in indicadores]
+        correlaciones = pd.DataFrame(momentos.correlaciones(), index=columnas, columns=columnas)
         
         # Correlaciones con puntuación global
         corr_con_puntuacion = correlaciones['puntuacion_global'].drop('puntuacion_global')
@@ -341,21 +1391,17 @@ class AnalizadorMadurezDigital:
             "matriz_completa": correlaciones.to_dict()
         }
     
-    def _calcular_evolucion_promedio(self, df):
-        """Calcular evolución del promedio en el tiempo."""
-        if 'fecha' not in df.columns:
-            return {}
-        
-        df_evol = df.copy()
-        df_evol['fecha'] = pd.to_datetime(df_evol['fecha'])
-        df_evol = df_evol.sort_values('fecha')
-        
-        # Promedio móvil de 30 días
-        df_evol['promedio_movil'] = df_evol['puntuacion_global'].rolling(window=3, min_periods=1).mean()
+    def _calcular_evolucion_promedio(self, media_mensual):
+        """Calcular evolución del promedio mensual en el tiempo."""
+        # Promedio móvil de 3 meses
+        promedio_movil = media_mensual.rolling(window=3, min_periods=1).mean()
         
         return {
-            "valores": df_evol[['fecha', 'promedio_movil']].to_dict('records'),
-            "promedio_inicial": float(df_evol['puntuacion_global'].iloc[0]),
-            "promedio_final": float(df_evol['puntuacion_global'].iloc[-1]),
-            "mejora_absoluta": float(df_evol['puntuacion_global'].iloc[-1] - df_evol['puntuacion_global'].iloc[0])
+            "valores": [
+                {"mes": mes, "promedio_movil": float(valor)}
+                for mes, valor in promedio_movil.items()
+            ],
+            "promedio_inicial": float(media_mensual.iloc[0]),
+            "promedio_final": float(media_mensual.iloc[-1]),
+            "mejora_absoluta": float(media_mensual.iloc[-1] - media_mensual.iloc[0])
         }
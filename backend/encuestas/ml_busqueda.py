@@ -0,0 +1,231 @@
+"""
+Búsqueda de hiperparámetros para el clasificador de madurez digital.
+
+Successive halving con presupuesto de tiempo: todos los candidatos se
+evalúan primero con pocas muestras y solo el mejor tercio pasa a la ronda
+siguiente con el triple de muestras. Cada ronda se reparte entre todos los
+núcleos con un pool de procesos (loky, el de joblib).
+
+El presupuesto es de la búsqueda completa: cada ronda se dimensiona con la
+duración de la anterior para que quepa en el tiempo restante, y si aun así
+llega el límite no se envían sus tareas pendientes y se terminan los
+procesos que siguen ajustando. Se devuelve lo evaluado en las rondas completas.
+
+Este módulo no depende de Django para que los procesos del pool solo
+necesiten numpy y scikit-learn (ml_inferencia solo usa numpy).
+"""
+
+import logging
+import math
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+
+import numpy as np
+from joblib import effective_n_jobs
+from joblib.externals.loky import get_reusable_executor
+from sklearn.ensemble import ExtraTreesClassifier, RandomForestClassifier
+from sklearn.metrics import accuracy_score
+from sklearn.model_selection import ParameterSampler, train_test_split
+
+from .ml_inferencia import BosquePlano
+
+logger = logging.getLogger(__name__)
+
+# Solo bosques: son compatibles con el entrenamiento incremental (warm_start)
+FAMILIAS = {
+    'RandomForest': RandomForestClassifier,
+    'ExtraTrees': ExtraTreesClassifier,
+}
+
+ESPACIO_BUSQUEDA = {
+    'n_estimators': [25, 50, 100, 200, 400],
+    'max_depth': [4, 6, 10, 16, None],
+    'min_samples_split': [2, 5, 10],
+    'min_samples_leaf': [1, 2, 4],
+    'max_features': ['sqrt', 'log2', 0.5, None],
+}
+
+
+def generar_candidatos(n_candidatos, random_state=42):
+    """Muestrear n_candidatos combinaciones (familia, parámetros)."""
+    familias = list(FAMILIAS)
+    parametros = ParameterSampler(ESPACIO_BUSQUEDA, n_iter=n_candidatos, random_state=random_state)
+    return [
+        (familias[i % len(familias)], dict(params))
+        for i, params in enumerate(parametros)
+    ]
+
+
+def crear_estimador(familia, parametros, random_state=42):
+    return FAMILIAS[familia](
+        random_state=random_state,
+        class_weight='balanced',
+        n_jobs=1,  # el paralelismo lo pone el pool de procesos
+        **parametros
+    )
+
+
+def medir_latencia(estimador, X, repeticiones=30):
+    """
+    Mediana en ms de predict_proba sobre una sola fila, por el mismo camino
+    que sirve las predicciones: el bosque aplanado (ml_inferencia). Acepta
+    el bosque de scikit-learn o un BosquePlano ya construido.
+    """
+    if not isinstance(estimador, BosquePlano):
+        estimador = BosquePlano.desde_sklearn(estimador)
+    fila = X[:1]
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        estimador.predict_proba(fila)
+        tiempos.append(time.perf_counter() - inicio)
+    return float(np.median(tiempos) * 1000)
+
+
+def _evaluar_candidato(indice, familia, parametros, X_train, y_train, X_val, y_val,
+                       n_muestras, random_state):
+    """Ajustar un candidato con las primeras n_muestras y puntuarlo en validación."""
+    estimador = crear_estimador(familia, parametros, random_state)
+
+    inicio = time.perf_counter()
+    estimador.fit(X_train[:n_muestras], y_train[:n_muestras])
+    tiempo_ajuste = time.perf_counter() - inicio
+
+    return {
+        'indice': indice,
+        'precision': float(accuracy_score(y_val, estimador.predict(X_val))),
+        'tiempo_ajuste': round(tiempo_ajuste, 4),
+        'latencia_ms_fila': round(medir_latencia(estimador, X_val), 4),
+        'muestras': int(n_muestras),
+    }
+
+
+def _evaluar_ronda(procesos, tareas, limite):
+    """
+    Evaluar las tareas de una ronda en el pool. Devuelve None si llega el
+    límite antes de que terminen todas.
+
+    Solo se envía una tarea por proceso libre: al llegar el límite las que
+    faltan no se llegan a enviar.
+    """
+    ejecutor = get_reusable_executor(max_workers=procesos)
+    pendientes = list(reversed(tareas))
+    en_curso = set()
+    evaluaciones = []
+    while pendientes or en_curso:
+        while pendientes and len(en_curso) < procesos:
+            en_curso.add(ejecutor.submit(_evaluar_candidato, *pendientes.pop()))
+        terminadas, en_curso = wait(
+            en_curso, timeout=max(0, limite - time.perf_counter()), return_when=FIRST_COMPLETED
+        )
+        if not terminadas:
+            # Las que se están ajustando no se pueden cancelar: se terminan
+            # los procesos (el siguiente get_reusable_executor crea otros)
+            ejecutor.shutdown(wait=False, kill_workers=True)
+            return None
+        evaluaciones.extend(futuro.result() for futuro in terminadas)
+    return evaluaciones
+
+
+def busqueda_sucesiva(X, y, presupuesto_segundos=60, n_candidatos=24, factor=3,
+                      n_jobs=-1, latencia_maxima_ms=None, random_state=42):
+    """
+    Successive halving sobre X, y (ya normalizados), sin pasar de
+    presupuesto_segundos en total.
+
+    Returns:
+        dict con la tabla de candidatos (precisión, tiempo de ajuste y
+        latencia por fila de la última ronda alcanzada por cada uno),
+        el candidato elegido y las rondas completadas.
+    """
+    inicio = time.perf_counter()
+    limite = inicio + presupuesto_segundos
+    procesos = effective_n_jobs(n_jobs)
+
+    X = np.asarray(X)
+    y = np.asarray(y)
+    _, conteos = np.unique(y, return_counts=True)
+    X_train, X_val, y_train, y_val = train_test_split(
+        X, y, test_size=0.25, random_state=random_state,
+        stratify=y if conteos.min() >= 2 else None
+    )
+    # Barajar para que cualquier prefijo sea una muestra representativa
+    orden = np.random.RandomState(random_state).permutation(len(X_train))
+    X_train, y_train = X_train[orden], y_train[orden]
+
+    candidatos = generar_candidatos(n_candidatos, random_state)
+    tabla = [
+        {'familia': familia, 'parametros': parametros, 'ronda': None}
+        for familia, parametros in candidatos
+    ]
+
+    rondas = max(1, math.ceil(math.log(n_candidatos, factor)))
+    n_muestras = max(len(np.unique(y_train)) * 5, len(X_train) // factor ** (rondas - 1))
+    vivos = list(range(len(candidatos)))
+    rondas_completadas = 0
+    # Segundos por muestra de cada "oleada" de tareas (una por proceso) de la última ronda
+    coste_muestra = None
+
+    for ronda in range(rondas):
+        restante = limite - time.perf_counter()
+        if restante <= 0:
+            logger.info("Presupuesto de búsqueda agotado antes de la ronda %s", ronda)
+            break
+
+        muestras_ronda = min(n_muestras, len(X_train))
+        oleadas = math.ceil(len(vivos) / procesos)
+        if coste_muestra is not None and coste_muestra * oleadas * muestras_ronda > restante:
+            # Reducir la ronda a lo que cabe en el tiempo restante; si no
+            # supera a la anterior ya no aporta nada
+            muestras_ronda = int(restante / (coste_muestra * oleadas))
+            if muestras_ronda <= muestras_anteriores:
+                logger.info("La ronda %s no cabe en el presupuesto restante", ronda)
+                break
+
+        inicio_ronda = time.perf_counter()
+        tareas = [
+            (i, *candidatos[i], X_train, y_train, X_val, y_val, muestras_ronda, random_state)
+            for i in vivos
+        ]
+        try:
+            evaluaciones = _evaluar_ronda(procesos, tareas, limite)
+        except Exception as e:
+            logger.warning("Ronda %s interrumpida: %s", ronda, e)
+            break
+        if evaluaciones is None:
+            logger.info("Presupuesto de búsqueda agotado durante la ronda %s", ronda)
+            break
+        coste_muestra = (time.perf_counter() - inicio_ronda) / (oleadas * muestras_ronda)
+        muestras_anteriores = muestras_ronda
+
+        for evaluacion in evaluaciones:
+            tabla[evaluacion.pop('indice')].update(evaluacion, ronda=ronda)
+        rondas_completadas = ronda + 1
+
+        # Pasan a la siguiente ronda el mejor 1/factor de los candidatos
+        vivos.sort(key=lambda i: tabla[i]['precision'], reverse=True)
+        vivos = vivos[:max(1, math.ceil(len(vivos) / factor))]
+        n_muestras *= factor
+
+    evaluados = [fila for fila in tabla if fila['ronda'] is not None]
+    if not evaluados:
+        return {"error": "El presupuesto de tiempo no permitió evaluar ningún candidato"}
+
+    # Elegir entre los que llegaron más lejos, respetando el SLO de latencia
+    ultima_ronda = max(fila['ronda'] for fila in evaluados)
+    finalistas = [fila for fila in evaluados if fila['ronda'] == ultima_ronda]
+    if latencia_maxima_ms is not None:
+        dentro_slo = [fila for fila in finalistas if fila['latencia_ms_fila'] <= latencia_maxima_ms]
+        finalistas = dentro_slo or finalistas
+    elegido = max(finalistas, key=lambda fila: (fila['precision'], -fila['latencia_ms_fila']))
+
+    evaluados.sort(key=lambda fila: (fila['ronda'], fila['precision']), reverse=True)
+    return {
+        "candidatos": evaluados,
+        "elegido": elegido,
+        "rondas_completadas": rondas_completadas,
+        "rondas_previstas": rondas,
+        "duracion_segundos": round(time.perf_counter() - inicio, 2),
+        "presupuesto_segundos": presupuesto_segundos,
+        "latencia_maxima_ms": latencia_maxima_ms,
+    }
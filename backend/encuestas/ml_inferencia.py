@@ -0,0 +1,96 @@
+"""
+Inferencia con el bosque "aplanado" en arrays contiguos de numpy.
+
+Para una sola fila, el coste de predict/predict_proba de scikit-learn está
+dominado por la validación de la entrada y por recorrer los árboles uno a
+uno desde Python. Aquí todos los nodos de todos los árboles se guardan en
+arrays planos (hijo izquierdo, hijo derecho, característica, umbral y
+probabilidades de hoja) y se recorren todos los árboles a la vez, un nivel
+por iteración, con operaciones vectorizadas.
+
+Como son arrays de numpy simples, se guardan dentro del artefacto del modelo
+y joblib los abre con mmap: todos los procesos comparten la misma copia.
+"""
+
+import numpy as np
+
+CAMPOS = ('izquierdo', 'derecho', 'caracteristica', 'umbral', 'valores', 'raices')
+
+
+class BosquePlano:
+    """Bosque de árboles de decisión en formato de arrays planos."""
+
+    def __init__(self, izquierdo, derecho, caracteristica, umbral, valores, raices, profundidad):
+        self.izquierdo = izquierdo
+        self.derecho = derecho
+        self.caracteristica = caracteristica
+        self.umbral = umbral
+        self.valores = valores
+        self.raices = raices
+        self.profundidad = int(profundidad)
+
+    @classmethod
+    def desde_sklearn(cls, bosque):
+        """Aplanar un RandomForestClassifier/ExtraTreesClassifier entrenado."""
+        izquierdos, derechos, caracteristicas, umbrales, valores, raices = [], [], [], [], [], []
+        desplazamiento = 0
+        profundidad = 0
+
+        for estimador in bosque.estimators_:
+            arbol = estimador.tree_
+            n_nodos = arbol.node_count
+            indices = np.arange(n_nodos) + desplazamiento
+            hoja = arbol.children_left == -1
+
+            # Las hojas apuntan a sí mismas: así todas las filas pueden
+            # recorrer exactamente "profundidad" niveles sin ramas especiales
+            izquierdos.append(np.where(hoja, indices, arbol.children_left + desplazamiento))
+            derechos.append(np.where(hoja, indices, arbol.children_right + desplazamiento))
+            caracteristicas.append(np.where(hoja, 0, arbol.feature))
+            umbrales.append(np.where(hoja, 0.0, arbol.threshold))
+
+            # Probabilidades por hoja normalizadas, como en predict_proba
+            valor = arbol.value[:, 0, :]
+            suma = valor.sum(axis=1, keepdims=True)
+            suma[suma == 0] = 1.0
+            valores.append(valor / suma)
+
+            raices.append(desplazamiento)
+            desplazamiento += n_nodos
+            profundidad = max(profundidad, arbol.max_depth)
+
+        return cls(
+            izquierdo=np.ascontiguousarray(np.concatenate(izquierdos), dtype=np.int32),
+            derecho=np.ascontiguousarray(np.concatenate(derechos), dtype=np.int32),
+            caracteristica=np.ascontiguousarray(np.concatenate(caracteristicas), dtype=np.int32),
+            umbral=np.ascontiguousarray(np.concatenate(umbrales), dtype=np.float64),
+            valores=np.ascontiguousarray(np.concatenate(valores), dtype=np.float64),
+            raices=np.asarray(raices, dtype=np.int32),
+            profundidad=profundidad,
+        )
+
+    def a_dict(self):
+        """Representación serializable (solo arrays) para el artefacto del modelo."""
+        datos = {campo: getattr(self, campo) for campo in CAMPOS}
+        datos['profundidad'] = self.profundidad
+        return datos
+
+    @classmethod
+    def desde_dict(cls, datos):
+        return cls(**{campo: datos[campo] for campo in CAMPOS}, profundidad=datos['profundidad'])
+
+    def predict_proba(self, X):
+        """
+        Probabilidades por clase (mismo orden que classes_ del bosque original).
+        X debe estar ya normalizado.
+        """
+        # Los árboles de scikit-learn comparan en float32
+        X = np.asarray(X, dtype=np.float32)
+        filas = np.arange(X.shape[0])[:, None]
+        nodo = np.broadcast_to(self.raices, (X.shape[0], len(self.raices)))
+
+        for _ in range(self.profundidad):
+            ir_izquierda = X[filas, self.caracteristica[nodo]] <= self.umbral[nodo]
+            nodo = np.where(ir_izquierda, self.izquierdo[nodo], self.derecho[nodo])
+
+        return self.valores[nodo].mean(axis=1)
@@ -0,0 +1,86 @@
+"""
+Entrenamiento de modelos por segmento de instituciones.
+
+Un segmento agrupa las instituciones que comparten los campos de
+ML_SEGMENTOS_CAMPOS (por defecto nivel educativo y país). Cada segmento con
+datos suficientes tiene su propio modelo; se ajustan en paralelo, uno por
+proceso del pool (joblib/loky). Los segmentos sin modelo usan el global.
+
+Como ml_busqueda, este módulo no depende de Django para que los procesos
+del pool solo necesiten numpy y scikit-learn.
+"""
+
+import logging
+import time
+
+import numpy as np
+from joblib import Parallel, delayed
+from sklearn.base import clone
+from sklearn.metrics import accuracy_score
+from sklearn.model_selection import train_test_split
+from sklearn.preprocessing import StandardScaler
+
+logger = logging.getLogger(__name__)
+
+
+def clave_segmento(campos, datos):
+    """Clave legible de un segmento: 'nivel_educativo=Secundaria|pais=Colombia'."""
+    return '|'.join(f"{campo}={datos.get(campo) or ''}" for campo in campos)
+
+
+def motivo_descarte(y, min_muestras):
+    """Motivo por el que un segmento no puede tener modelo propio, o None."""
+    if len(y) < min_muestras:
+        return f"Solo {len(y)} muestras (mínimo {min_muestras})"
+    clases, cuentas = np.unique(y, return_counts=True)
+    if len(clases) < 2:
+        return "Un único nivel de madurez en el segmento"
+    return None
+
+
+def entrenar_segmento(segmento, X, y, estimador, test_size=0.2, random_state=42):
+    """Ajustar scaler y clasificador de un segmento y medir su precisión."""
+    inicio = time.perf_counter()
+    y = np.asarray(y)
+    try:
+        X_train, X_test, y_train, y_test = train_test_split(
+            X, y, test_size=test_size, random_state=random_state, stratify=y
+        )
+    except ValueError:
+        # Niveles con una sola muestra: no se puede estratificar
+        X_train, X_test, y_train, y_test = train_test_split(
+            X, y, test_size=test_size, random_state=random_state
+        )
+
+    scaler = StandardScaler()
+    modelo = clone(estimador)
+    modelo.fit(scaler.fit_transform(X_train), y_train)
+    precision = accuracy_score(y_test, modelo.predict(scaler.transform(X_test)))
+
+    return {
+        'segmento': segmento,
+        'modelo': modelo,
+        'scaler': scaler,
+        'precision': float(precision),
+        'muestras': len(y),
+        'segundos': round(time.perf_counter() - inicio, 3),
+    }
+
+
+def entrenar_segmentos(grupos, estimador, n_jobs=-1, test_size=0.2, random_state=42):
+    """
+    Entrenar en paralelo un modelo por segmento.
+
+    Args:
+        grupos: dict {segmento: (X, y)} con X como array de numpy
+        estimador: clasificador sin ajustar que se clona en cada segmento
+
+    Returns:
+        lista de dicts (segmento, modelo, scaler, precision, muestras, segundos)
+    """
+    if not grupos:
+        return []
+    return Parallel(n_jobs=n_jobs, backend='loky')(
+        delayed(entrenar_segmento)(segmento, X, y, estimador, test_size, random_state)
+        for segmento, (X, y) in grupos.items()
+    )
@@ -1,3 +1,5 @@
+import time
+
 from django.db import models
 from django.contrib.auth.models import User
 
@@ -192,6 +194,33 @@ class ResultadoIndicador(models.Model):
 
 
 
+class CaracteristicasResultado(models.Model):
+    """
+    CARACTERISTICAS_RESULTADO
+    Tabla desnormalizada con una fila por resultado y todos sus valores de
+    indicadores, para leer las características sin pivotar ResultadoIndicador.
+    Se mantiene con señales en la misma transacción que las escrituras
+    (encuestas.caracteristicas); reconstruir con manage.py reconstruir_caracteristicas.
+    - valores: {"<indicador_id>": valor}
+    """
+    resultado = models.OneToOneField(
+        ResultadoEncuesta, on_delete=models.CASCADE, primary_key=True, related_name="caracteristicas"
+    )
+    institucion = models.ForeignKey(Institucion, on_delete=models.CASCADE)
+    fecha_calculo = models.DateTimeField(db_index=True)
+    puntuacion_global = models.FloatField()
+    nivel_madurez = models.CharField(max_length=50)
+    valores = models.JSONField(default=dict)
+    num_indicadores = models.IntegerField(default=0)
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = "caracteristicas_resultado"
+
+    def __str__(self):
+        return f"Características de {self.resultado_id} ({self.num_indicadores} indicadores)"
+
+
 #  IA: MODELO Y PREDICCIONES
 
 
@@ -203,7 +232,12 @@ class ModeloIA(models.Model):
     version = models.CharField(max_length=20)
     metrica_precision = models.FloatField()
     fecha_entrenamiento = models.DateTimeField(auto_now_add=True)
-    ruta_fichero = models.CharField(max_length=255)  # ruta al .pkl del modelo
+    ruta_fichero = models.CharField(max_length=255)  # ruta al fichero versionado del modelo
+    checksum = models.CharField(max_length=64, blank=True)  # sha256 del fichero
+    snapshot = models.CharField(max_length=100, blank=True)  # snapshot Parquet de entrenamiento, si se usó
+    segmento = models.CharField(max_length=255, blank=True, db_index=True)  # vacío = modelo global
+    huella_datos = models.CharField(max_length=64, blank=True)  # huella del conjunto de entrenamiento
+    parametros_entrenamiento = models.JSONField(default=dict, blank=True)  # test_size, búsqueda, snapshot...
 
     class Meta:
         db_table = "modelo_ia"
@@ -231,6 +265,172 @@ class PrediccionIA(models.Model):
         return f"{self.modelo} -> {self.nivel_pred} ({self.probabilidad})"
 
 
+class TrabajoEntrenamiento(models.Model):
+    """
+    TRABAJO_ENTRENAMIENTO
+    Cola de entrenamientos del modelo de IA. La petición HTTP solo encola el
+    trabajo; lo ejecuta el proceso worker (manage.py procesar_entrenamientos).
+    - 1 usuario solicita muchos trabajos
+    - 1 trabajo completado genera 1 modelo IA
+    - Como máximo 1 trabajo puede estar "en_curso" a la vez
+    """
+    estado = models.CharField(max_length=20, default="pendiente", db_index=True)  # pendiente, en_curso, completado, error
+    progreso = models.IntegerField(default=0)  # 0-100
+    etapa = models.CharField(max_length=100, blank=True)
+    parametros = models.JSONField(default=dict, blank=True)
+    resultado = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    solicitado_por = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    modelo = models.ForeignKey(ModeloIA, on_delete=models.SET_NULL, null=True, blank=True)
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    fecha_inicio = models.DateTimeField(null=True, blank=True)
+    fecha_latido = models.DateTimeField(null=True, blank=True)  # última señal de vida del worker
+    fecha_fin = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = "trabajo_entrenamiento"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["estado"],
+                condition=models.Q(estado="en_curso"),
+                name="un_entrenamiento_en_curso",
+            ),
+        ]
+
+    def __str__(self):
+        return f"Entrenamiento #{self.id} ({self.estado})"
+
+
+
+#  AGREGADOS PRECALCULADOS
+
+class TendenciaMensual(models.Model):
+    """
+    TENDENCIA_MENSUAL
+    Acumulados por (institución, mes, indicador) que alimentan el análisis de
+    tendencias sin recorrer los resultados. Se mantienen con señales al
+    guardar/borrar ResultadoEncuesta y ResultadoIndicador (encuestas.signals).
+    - indicador NULL = puntuación global del resultado
+    - media = suma / cantidad; varianza a partir de suma_cuadrados
+    """
+    institucion = models.ForeignKey(Institucion, on_delete=models.CASCADE)
+    mes = models.DateField()  # primer día del mes
+    indicador = models.ForeignKey(Indicador, on_delete=models.CASCADE, null=True, blank=True)
+    cantidad = models.IntegerField(default=0)
+    suma = models.FloatField(default=0)
+    suma_cuadrados = models.FloatField(default=0)
+
+    class Meta:
+        db_table = "tendencia_mensual"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["institucion", "mes", "indicador"],
+                condition=models.Q(indicador__isnull=False),
+                name="tendencia_mensual_indicador_unica",
+            ),
+            models.UniqueConstraint(
+                fields=["institucion", "mes"],
+                condition=models.Q(indicador__isnull=True),
+                name="tendencia_mensual_global_unica",
+            ),
+        ]
+
+    def __str__(self):
+        serie = self.indicador.nombre if self.indicador else "Puntuación global"
+        return f"{self.institucion} {self.mes:%Y-%m} - {serie} (n={self.cantidad})"
+
+
+class MomentosIndicadores(models.Model):
+    """
+    MOMENTOS_INDICADORES
+    Acumulador de momentos por institución para calcular correlaciones entre
+    indicadores sin recorrer los resultados (encuestas.momentos).
+    - Vector de cada resultado: [puntuacion_global, *indicadores]
+    - medias: k+1 valores; comomentos: matriz (k+1)x(k+1) de sumas de
+      productos de desviaciones
+    """
+    institucion = models.OneToOneField(Institucion, on_delete=models.CASCADE)
+    indicadores = models.JSONField(default=list)  # ids de Indicador, en orden
+    n = models.IntegerField(default=0)
+    medias = models.JSONField(default=list)
+    comomentos = models.JSONField(default=list)
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = "momentos_indicadores"
+
+    def __str__(self):
+        return f"Momentos {self.institucion} (n={self.n})"
+
+
+class ContadoresDashboard(models.Model):
+    """
+    CONTADORES_DASHBOARD
+    Fila única (id=1) con los totales de dashboard_metricas, para servirlo
+    con una lectura por clave primaria en vez de contar las tablas. Se
+    mantiene con señales en la misma transacción que las escrituras
+    (encuestas.contadores); reconstruir con manage.py reconciliar_contadores.
+    - promedio general = suma_puntuaciones / total_evaluaciones
+    - nivel_predominante: nivel con más evaluaciones en ContadorNivelMadurez
+      (sumando todas las instituciones)
+    """
+    total_encuestas = models.IntegerField(default=0)
+    total_respuestas = models.IntegerField(default=0)
+    total_evaluaciones = models.IntegerField(default=0)
+    total_instituciones = models.IntegerField(default=0)
+    usuarios_activos = models.IntegerField(default=0)
+    suma_puntuaciones = models.FloatField(default=0)
+    nivel_predominante = models.CharField(max_length=50, blank=True)
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = "contadores_dashboard"
+
+    def __str__(self):
+        return f"Contadores dashboard ({self.total_evaluaciones} evaluaciones)"
+
+
+class VersionDatos(models.Model):
+    """
+    VERSION_DATOS
+    Fila única (id=1) con la versión de la caché de reportes
+    (encuestas.cache_reportes), común a todos los procesos. Va aparte de
+    ContadoresDashboard para que invalidar los reportes no espere al bloqueo
+    de la fila de contadores que toman todas las escrituras.
+    - version: empieza según el reloj para no coincidir con versiones de
+      una fila anterior
+    """
+    version = models.BigIntegerField(default=time.time_ns)
+
+    class Meta:
+        db_table = "version_datos"
+
+    def __str__(self):
+        return f"Versión de datos {self.version}"
+
+
+class ContadorNivelMadurez(models.Model):
+    """
+    CONTADOR_NIVEL_MADUREZ
+    Número de evaluaciones (ResultadoEncuesta) por institución y nivel de
+    madurez. Mantiene ContadoresDashboard.nivel_predominante (sumando las
+    instituciones) y la distribución por niveles del análisis de tendencias.
+    """
+    institucion = models.ForeignKey(Institucion, on_delete=models.CASCADE)
+    nivel_madurez = models.CharField(max_length=50)
+    cantidad = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = "contador_nivel_madurez"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["institucion", "nivel_madurez"], name="contador_nivel_madurez_unico"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.institucion} - {self.nivel_madurez}: {self.cantidad}"
+
 
 #  MÓDULO COLABORATIVO
 
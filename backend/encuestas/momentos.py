@@ -0,0 +1,208 @@
+"""
+Acumulador de momentos (n, medias y matriz de co-momentos) de los
+indicadores por institución, para servir correlaciones en O(k²).
+
+Cada resultado completo (con valor para todos los indicadores del
+acumulador) aporta el vector [puntuacion_global, indicador_1, ...]. Los
+vectores se añaden y se quitan uno a uno con la actualización de Welford,
+y los acumuladores de varias instituciones se combinan con la fórmula de
+Chan et al. cuando se piden correlaciones globales.
+"""
+
+import logging
+
+import numpy as np
+import pandas as pd
+from django.db import transaction
+
+from .models import Indicador, MomentosIndicadores, ResultadoIndicador
+
+logger = logging.getLogger(__name__)
+
+
+class Momentos:
+    """Momentos de primer y segundo orden de un conjunto de vectores."""
+
+    def __init__(self, k, n=0, medias=None, comomentos=None):
+        self.n = n
+        self.medias = np.zeros(k) if medias is None else np.asarray(medias, dtype=float)
+        self.comomentos = np.zeros((k, k)) if comomentos is None else np.asarray(comomentos, dtype=float)
+
+    @classmethod
+    def desde_matriz(cls, X):
+        X = np.asarray(X, dtype=float)
+        if len(X) == 0:
+            return cls(X.shape[1])
+        medias = X.mean(axis=0)
+        centrado = X - medias
+        return cls(X.shape[1], len(X), medias, centrado.T @ centrado)
+
+    def agregar(self, x):
+        x = np.asarray(x, dtype=float)
+        self.n += 1
+        delta = x - self.medias
+        self.medias = self.medias + delta / self.n
+        self.comomentos = self.comomentos + np.outer(delta, x - self.medias)
+
+    def quitar(self, x):
+        x = np.asarray(x, dtype=float)
+        if self.n <= 1:
+            self.__init__(len(self.medias))
+            return
+        medias_anteriores = (self.n * self.medias - x) / (self.n - 1)
+        self.comomentos = self.comomentos - np.outer(x - medias_anteriores, x - self.medias)
+        self.medias = medias_anteriores
+        self.n -= 1
+
+    def combinar(self, otro):
+        if otro.n == 0:
+            return self
+        if self.n == 0:
+            return Momentos(len(otro.medias), otro.n, otro.medias.copy(), otro.comomentos.copy())
+        n = self.n + otro.n
+        delta = otro.medias - self.medias
+        return Momentos(
+            len(self.medias), n,
+            self.medias + delta * otro.n / n,
+            self.comomentos + otro.comomentos + np.outer(delta, delta) * self.n * otro.n / n,
+        )
+
+    def correlaciones(self):
+        """Matriz de correlación de Pearson (NaN si alguna varianza es 0)."""
+        desviaciones = np.sqrt(np.clip(np.diag(self.comomentos), 0, None))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return self.comomentos / np.outer(desviaciones, desviaciones)
+
+
+def _leer(acumulador):
+    return Momentos(
+        len(acumulador.indicadores) + 1, acumulador.n, acumulador.medias or None,
+        acumulador.comomentos or None
+    )
+
+
+def _escribir(acumulador, momentos):
+    acumulador.n = momentos.n
+    acumulador.medias = momentos.medias.tolist()
+    acumulador.comomentos = momentos.comomentos.tolist()
+
+
+def _vector(resultado_id, indicadores, puntuacion=None, cambios=None):
+    """
+    Vector [puntuacion_global, *indicadores] de un resultado según la BD,
+    aplicando `cambios` ({indicador_id: valor o None}). None si está incompleto.
+    """
+    valores = dict(
+        ResultadoIndicador.objects.filter(resultado_id=resultado_id).values_list('indicador_id', 'valor')
+    )
+    for indicador_id, valor in (cambios or {}).items():
+        if valor is None:
+            valores.pop(indicador_id, None)
+        else:
+            valores[indicador_id] = valor
+    if puntuacion is None or any(i not in valores for i in indicadores):
+        return None
+    return [puntuacion] + [valores[i] for i in indicadores]
+
+
+def actualizar_momentos(resultado_id, antes, despues):
+    """
+    Sustituir la aportación de un resultado al acumulador de su institución.
+
+    antes / despues: (institucion_id, puntuacion_global, cambios) que
+    describen el resultado antes y después de la escritura, o None si no
+    existía / ya no existe. `cambios` corrige los valores leídos de la BD
+    ({indicador_id: valor anterior, o None si no existía}).
+    """
+    acumuladores = {}
+    with transaction.atomic():
+        for estado, signo in ((antes, -1), (despues, 1)):
+            if estado is None or estado[0] is None:
+                continue
+            institucion_id, puntuacion, cambios = estado
+            if institucion_id not in acumuladores:
+                acumuladores[institucion_id] = MomentosIndicadores.objects.select_for_update().filter(
+                    institucion_id=institucion_id
+                ).first()
+            acumulador = acumuladores[institucion_id]
+            if acumulador is None:
+                if signo < 0:
+                    continue
+                acumulador = acumuladores[institucion_id] = MomentosIndicadores(
+                    institucion_id=institucion_id,
+                    indicadores=sorted(Indicador.objects.values_list('id', flat=True)),
+                )
+
+            x = _vector(resultado_id, acumulador.indicadores, puntuacion, cambios)
+            if x is None:
+                continue
+            momentos = _leer(acumulador)
+            if signo > 0:
+                momentos.agregar(x)
+            else:
+                momentos.quitar(x)
+            _escribir(acumulador, momentos)
+            acumulador.save()
+
+
+def combinar_momentos(institucion_id=None):
+    """
+    Combinar los acumuladores (de una institución o de todas).
+    Devuelve (indicadores, Momentos) o (None, None) si no hay datos.
+    """
+    acumuladores = MomentosIndicadores.objects.filter(n__gt=0)
+    if institucion_id:
+        acumuladores = acumuladores.filter(institucion_id=institucion_id)
+    acumuladores = list(acumuladores)
+    if not acumuladores:
+        return None, None
+
+    # Solo se combinan acumuladores con los mismos indicadores (los creados
+    # antes de añadir un indicador se igualan con reconstruir_tendencias)
+    indicadores = max(acumuladores, key=lambda a: a.n).indicadores
+    total = Momentos(len(indicadores) + 1)
+    for acumulador in acumuladores:
+        if acumulador.indicadores != indicadores:
+            logger.warning(
+                f"Momentos de la institución {acumulador.institucion_id} con indicadores "
+                f"distintos; ejecute reconstruir_tendencias"
+            )
+            continue
+        total = total.combinar(_leer(acumulador))
+    return indicadores, total
+
+
+def reconstruir_momentos():
+    """Recalcular todos los acumuladores desde cero."""
+    return _reconstruir(Indicador, ResultadoIndicador, MomentosIndicadores)
+
+
+def _reconstruir(Indicador, ResultadoIndicador, MomentosIndicadores):
+    # Recibe los modelos para poder usarse también desde las migraciones
+    indicadores = sorted(Indicador.objects.values_list('id', flat=True))
+    filas = pd.DataFrame(
+        list(ResultadoIndicador.objects.filter(indicador_id__in=indicadores).values_list(
+            'resultado_id', 'resultado__institucion_id', 'resultado__puntuacion_global',
+            'indicador_id', 'valor'
+        ).order_by()),
+        columns=['resultado_id', 'institucion_id', 'puntuacion_global', 'indicador_id', 'valor']
+    )
+
+    acumuladores = []
+    if not filas.empty and indicadores:
+        tabla = filas.pivot_table(
+            index=['institucion_id', 'resultado_id', 'puntuacion_global'],
+            columns='indicador_id', values='valor', aggfunc='first'
+        ).reindex(columns=indicadores).dropna().reset_index(level='puntuacion_global')
+
+        for institucion_id, grupo in tabla.groupby(level='institucion_id'):
+            acumulador = MomentosIndicadores(institucion_id=institucion_id, indicadores=indicadores)
+            _escribir(acumulador, Momentos.desde_matriz(
+                grupo[['puntuacion_global'] + indicadores].to_numpy()
+            ))
+            acumuladores.append(acumulador)
+
+    with transaction.atomic():
+        MomentosIndicadores.objects.all().delete()
+        MomentosIndicadores.objects.bulk_create(acumuladores)
+    return len(acumuladores)
@@ -0,0 +1,111 @@
+"""
+Precarga del modelo de IA al arrancar cada worker web.
+
+Sin precarga, la primera predicción de cada proceso paga la importación de
+pandas/scikit-learn, la lectura del artefacto y la primera pasada de
+predict_proba. Con ML_PRECARGA_MODELO = True, los puntos de entrada WSGI/ASGI
+lanzan un hilo en segundo plano que hace todo eso antes de la primera
+petición. El estado se consulta en /api/ia/listo/ y en estado_modelo_ia.
+
+Con gunicorn --preload la aplicación se importa en el proceso maestro y los
+workers se crean después con fork: el hilo de precarga no se hereda, así que
+cada worker que nace sin la precarga terminada la vuelve a lanzar
+(os.register_at_fork).
+"""
+
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+
+class EstadoPrecarga:
+    """Estado de la precarga en este proceso."""
+
+    INACTIVA = 'inactiva'      # ML_PRECARGA_MODELO desactivado
+    CARGANDO = 'cargando'
+    LISTO = 'listo'
+    SIN_MODELO = 'sin_modelo'  # no hay ningún modelo entrenado todavía
+    ERROR = 'error'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = None
+        self.estado = self.INACTIVA
+        self.modelo_id = None
+        self.duracion_segundos = None
+        self.error = None
+
+    def iniciar(self):
+        """Lanzar la precarga una vez por proceso (también tras un fork)."""
+        if not getattr(settings, 'ML_PRECARGA_MODELO', False):
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self.estado = self.CARGANDO
+        threading.Thread(target=self._precargar, name='precarga-modelo-ia', daemon=True).start()
+
+    def tras_fork(self):
+        """
+        En el hijo de un fork. Si el padre ya terminó la precarga, el modelo
+        está en la memoria heredada; si no, el hilo que la hacía no existe
+        en este proceso y el estado se quedaría en 'cargando'.
+        """
+        # El lock pudo copiarse adquirido por otro hilo del padre
+        self._lock = threading.Lock()
+        if self._pid is not None and not self.listo:
+            self.error = None
+            self.iniciar()
+
+    def _precargar(self):
+        inicio = time.perf_counter()
+        try:
+            from .ml import AnalizadorMadurezDigital
+
+            analizador = AnalizadorMadurezDigital()
+            if analizador.cargar_modelo():
+                # Primera pasada de inferencia para calentar numpy/scikit-learn
+                analizador._predecir_matriz(analizador._matriz_caracteristicas([{}]))
+                self.modelo_id = analizador.clave_modelo[0] if analizador.clave_modelo else None
+                self.estado = self.LISTO
+            else:
+                self.estado = self.SIN_MODELO
+        except Exception as e:
+            logger.error(f"Error en la precarga del modelo de IA: {e}")
+            self.error = str(e)
+            self.estado = self.ERROR
+        finally:
+            self.duracion_segundos = round(time.perf_counter() - inicio, 3)
+            connections.close_all()
+            logger.info(f"Precarga del modelo de IA: {self.estado} ({self.duracion_segundos}s)")
+
+    @property
+    def listo(self):
+        """El proceso puede atender predicciones (o no hay nada que precargar)."""
+        return self.estado in (self.INACTIVA, self.LISTO, self.SIN_MODELO)
+
+    def como_dict(self):
+        return {
+            "estado": self.estado,
+            "listo": self.listo,
+            "modelo_id": self.modelo_id,
+            "duracion_segundos": self.duracion_segundos,
+            "error": self.error,
+        }
+
+
+estado_precarga = EstadoPrecarga()
+
+if hasattr(os, 'register_at_fork'):  # No existe en Windows
+    os.register_at_fork(after_in_child=estado_precarga.tras_fork)
+
+
+def iniciar_precarga():
+    estado_precarga.iniciar()
@@ -0,0 +1,335 @@
+"""
+Reportes agregados de madurez digital (RF-004).
+
+Cada reporte se calcula con unas pocas consultas agrupadas (GROUP BY) en la
+BD, sin recorrer resultados ni valores de indicadores en Python, y registra
+cuántas consultas y cuánto tiempo ha necesitado frente al presupuesto de
+REPORTES_PRESUPUESTO_CONSULTAS y REPORTES_PRESUPUESTO_MS.
+
+El alcance de un reporte es global para admin_tic y la institución del
+usuario para el resto de roles.
+"""
+
+import logging
+import time
+from datetime import date
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Avg, Count, Max, Min, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import (
+    Encuesta, Indicador, Institucion, Respuesta, ResultadoEncuesta, ResultadoIndicador, TendenciaMensual,
+)
+
+logger = logging.getLogger(__name__)
+
+ALCANCE_GLOBAL = 'global'
+
+# Meses de la tendencia temporal del resumen (incluido el actual)
+MESES_TENDENCIA = 6
+
+
+def alcance_usuario(user):
+    """
+    'global' para admin_tic; para el resto, el id de su institución
+    (None si no tiene: el reporte sale vacío).
+    """
+    perfil = getattr(user, 'perfil', None)
+    if perfil is not None and perfil.rol and perfil.rol.nombre_rol == 'admin_tic':
+        return ALCANCE_GLOBAL
+    return perfil.institucion_id if perfil is not None else None
+
+
+def _filtrar(queryset, alcance, campo_institucion='institucion_id'):
+    if alcance == ALCANCE_GLOBAL:
+        return queryset
+    if alcance is None:
+        return queryset.none()
+    return queryset.filter(**{campo_institucion: alcance})
+
+
+class MedidorConsultas:
+    """Cuenta las consultas SQL y el tiempo de un bloque (with)."""
+
+    def __init__(self):
+        self.consultas = 0
+        self.milisegundos = 0.0
+        self._envoltorio = None
+        self._inicio = None
+
+    def __call__(self, execute, sql, params, many, context):
+        self.consultas += 1
+        return execute(sql, params, many, context)
+
+    def __enter__(self):
+        self._envoltorio = connection.execute_wrapper(self)
+        self._envoltorio.__enter__()
+        self._inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.milisegundos = (time.perf_counter() - self._inicio) * 1000
+        self._envoltorio.__exit__(*exc)
+        return False
+
+    def presupuesto(self, nombre):
+        """Comparar con el presupuesto y avisar en el log si se supera."""
+        max_consultas = getattr(settings, 'REPORTES_PRESUPUESTO_CONSULTAS', 6)
+        max_ms = getattr(settings, 'REPORTES_PRESUPUESTO_MS', 500)
+        cumplido = self.consultas <= max_consultas and self.milisegundos <= max_ms
+        if not cumplido:
+            logger.warning(
+                f"Reporte {nombre} fuera de presupuesto: {self.consultas} consultas "
+                f"(máx. {max_consultas}), {self.milisegundos:.1f} ms (máx. {max_ms})"
+            )
+        return {
+            "consultas_sql": self.consultas,
+            "tiempo_ms": round(self.milisegundos, 2),
+            "max_consultas": max_consultas,
+            "max_ms": max_ms,
+            "cumplido": cumplido,
+        }
+
+
+def _inicio_tendencia():
+    hoy = timezone.localdate()
+    indice = hoy.year * 12 + hoy.month - 1 - (MESES_TENDENCIA - 1)
+    return date(indice // 12, indice % 12 + 1, 1)
+
+
+def reporte_resumen(alcance, usuario=None):
+    """
+    Resumen de madurez digital: métricas globales, distribución por nivel,
+    detalle por indicador, todas las instituciones del alcance y tendencia
+    de los últimos meses. Cuatro consultas en total, sea cual sea el volumen.
+    """
+    encuestas = (
+        Encuesta.objects.filter(institucion=OuterRef('pk')).order_by()
+        .values('institucion').annotate(total=Count('id')).values('total')
+    )
+    with MedidorConsultas() as medidor:
+        # 1) Instituciones del alcance con sus resultados por nivel: totales,
+        #    promedios y distribución en un solo GROUP BY (institución, nivel).
+        #    Las encuestas van en una subconsulta para no multiplicar las filas.
+        grupos = list(
+            _filtrar(Institucion.objects.order_by('nombre'), alcance, 'id')
+            .values('id', 'nombre', 'estado', 'resultadoencuesta__nivel_madurez')
+            .annotate(
+                total_encuestas=Coalesce(Subquery(encuestas), 0),
+                cantidad=Count('resultadoencuesta'),
+                con_puntuacion=Count('resultadoencuesta__puntuacion_global'),
+                suma=Sum('resultadoencuesta__puntuacion_global'),
+            )
+        )
+        # 2) Estadísticas por indicador
+        indicadores = list(
+            _filtrar(ResultadoIndicador.objects.order_by(), alcance, 'resultado__institucion_id')
+            .values('indicador__nombre', 'indicador__categoria', 'indicador__descripcion')
+            .annotate(
+                promedio=Avg('valor'), maximo=Max('valor'), minimo=Min('valor'), total=Count('id')
+            )
+            .order_by('indicador__nombre')
+        )
+        # 3) Tendencia mensual desde los acumulados de TendenciaMensual
+        tendencia = list(
+            _filtrar(TendenciaMensual.objects.order_by(), alcance)
+            .filter(indicador__isnull=True, mes__gte=_inicio_tendencia())
+            .values('mes')
+            .annotate(cantidad=Sum('cantidad'), suma=Sum('suma'))
+            .order_by('mes')
+        )
+        # 4) Respuestas registradas
+        total_respuestas = _filtrar(Respuesta.objects.all(), alcance, 'encuesta__institucion_id').count()
+
+    # Combinar en Python: una fila por (institución, nivel), no por resultado
+    instituciones = {}
+    por_institucion = {}
+    por_nivel = {}
+    for grupo in grupos:
+        instituciones.setdefault(grupo['id'], grupo)
+        if not grupo['cantidad']:
+            continue  # Institución sin resultados
+        acumulado = por_institucion.setdefault(grupo['id'], [0, 0, 0.0])
+        nivel = por_nivel.setdefault(grupo['resultadoencuesta__nivel_madurez'], [0, 0, 0.0])
+        for destino in (acumulado, nivel):
+            destino[0] += grupo['cantidad']
+            destino[1] += grupo['con_puntuacion']
+            destino[2] += grupo['suma'] or 0.0
+
+    total_resultados = sum(cantidad for cantidad, _, _ in por_institucion.values())
+    con_puntuacion = sum(n for _, n, _ in por_institucion.values())
+    suma_total = sum(suma for _, _, suma in por_institucion.values())
+    distribucion = sorted(por_nivel.items(), key=lambda item: -item[1][0])
+
+    filas_instituciones = []
+    for institucion in instituciones.values():
+        cantidad, n, suma = por_institucion.get(institucion['id'], (0, 0, 0.0))
+        filas_instituciones.append({
+            "id": institucion['id'],
+            "nombre": institucion['nombre'],
+            "total_encuestas": institucion['total_encuestas'],
+            "total_resultados": cantidad,
+            "promedio": round(suma / n, 2) if n else None,
+            "activa": institucion['estado'] == 'activa',
+        })
+    ranking = sorted(
+        (fila for fila in filas_instituciones if fila['promedio'] is not None),
+        key=lambda fila: -fila['promedio']
+    )
+
+    return {
+        "resumen_ejecutivo": {
+            "total_resultados": total_resultados,
+            "promedio_global": round(suma_total / con_puntuacion, 2) if con_puntuacion else 0,
+            "nivel_predominante": distribucion[0][0] if distribucion else None,
+            "instituciones_evaluadas": len(por_institucion),
+            "total_instituciones": len(instituciones),
+        },
+        "distribucion_madurez": {
+            "por_nivel": [
+                {
+                    "nivel": nivel,
+                    "cantidad": cantidad,
+                    "porcentaje": round(cantidad / total_resultados * 100, 1),
+                    "promedio": round(suma / n, 2) if n else None,
+                }
+                for nivel, (cantidad, n, suma) in distribucion
+            ]
+        },
+        "indicadores_detalle": {
+            fila['indicador__nombre']: {
+                "categoria": fila['indicador__categoria'],
+                "descripcion": fila['indicador__descripcion'],
+                "promedio": round(fila['promedio'], 2),
+                "maximo": fila['maximo'],
+                "minimo": fila['minimo'],
+                "total_evaluaciones": fila['total'],
+            }
+            for fila in indicadores
+        },
+        "ranking_instituciones": [
+            {
+                "institucion": fila['nombre'],
+                "total_evaluaciones": fila['total_resultados'],
+                "promedio_madurez": fila['promedio'],
+            }
+            for fila in ranking
+        ],
+        "tendencia_temporal": [
+            {
+                "mes": fila['mes'].month,
+                "año": fila['mes'].year,
+                "cantidad": fila['cantidad'],
+                "promedio_mes": round(fila['suma'] / fila['cantidad'], 2) if fila['cantidad'] else None,
+            }
+            for fila in tendencia
+        ],
+        # Formato resumido anterior (total de respuestas y lista por institución)
+        "total_respuestas": total_respuestas,
+        "por_institucion": filas_instituciones,
+        "periodo": f"Últimos {MESES_TENDENCIA} meses",
+        "tiempo_consulta": round(medidor.milisegundos / 1000, 3),
+        "mensaje": None if total_resultados else "No hay resultados registrados todavía.",
+        "metadatos": {
+            "fecha_generacion": timezone.now().isoformat(),
+            "usuario_solicitud": usuario,
+            "filtros_aplicados": "Global" if alcance == ALCANCE_GLOBAL else "Por institución",
+            "rendimiento": medidor.presupuesto('resumen'),
+        },
+        "status": "ok",
+    }
+
+
+# Criterios de orden del comparativo (?orden=, con '-' para descendente)
+ORDENES_COMPARATIVO = ('promedio_general', 'total_evaluaciones', 'nombre')
+
+
+def reporte_comparativo(alcance, orden='-promedio_general', pagina=1, por_pagina=50, top=None):
+    """
+    Comparativa entre instituciones: matriz institución × indicador con el
+    valor medio de cada indicador.
+
+    Las medias salen de la BD agrupadas (GROUP BY institución, indicador)
+    y solo para la página de instituciones pedida, así que el tamaño de la
+    respuesta y de las consultas no crece con el número de evaluaciones ni
+    de instituciones. Con ``top`` se devuelven las N primeras según el orden.
+    """
+    por_institucion = (
+        _filtrar(ResultadoEncuesta.objects.order_by(), alcance)
+        .values('institucion_id')
+        .annotate(
+            nombre=Max('institucion__nombre'),
+            promedio_general=Avg('puntuacion_global'),
+            total_evaluaciones=Count('id'),
+        )
+    )
+    if top is not None:
+        pagina, por_pagina = 1, top
+    inicio = (pagina - 1) * por_pagina
+
+    with MedidorConsultas() as medidor:
+        # 1) Totales del sistema: instituciones con resultados y media de sus medias
+        totales = por_institucion.aggregate(
+            total_instituciones=Count('institucion_id'), promedio_sistema=Avg('promedio_general')
+        )
+        # 2) Página de instituciones (desempate por id: paginación estable)
+        filas = list(
+            por_institucion.order_by(orden, 'institucion_id')[inicio:inicio + por_pagina]
+        )
+        # 3) Mejor institución del alcance
+        mejor = por_institucion.order_by('-promedio_general', 'institucion_id').first()
+        # 4) Columnas de la matriz
+        indicadores = list(Indicador.objects.order_by('id').values_list('id', 'nombre'))
+        # 5) Celdas: media por (institución, indicador) de la página
+        celdas = {}
+        if filas:
+            consulta = ResultadoIndicador.objects.filter(
+                resultado__institucion_id__in=[fila['institucion_id'] for fila in filas]
+            ).order_by().values_list('resultado__institucion_id', 'indicador_id').annotate(
+                promedio=Avg('valor')
+            )
+            celdas = {
+                (institucion_id, indicador_id): promedio
+                for institucion_id, indicador_id, promedio in consulta
+            }
+
+    def _fila(fila, valores=True):
+        datos = {
+            "institucion_id": fila['institucion_id'],
+            "institucion": fila['nombre'],
+            "promedio_general": round(fila['promedio_general'], 2) if fila['promedio_general'] is not None else None,
+            "total_evaluaciones": fila['total_evaluaciones'],
+        }
+        if valores:
+            datos["valores"] = [
+                round(celdas[fila['institucion_id'], indicador_id], 2)
+                if (fila['institucion_id'], indicador_id) in celdas else None
+                for indicador_id, _ in indicadores
+            ]
+        return datos
+
+    total = totales['total_instituciones']
+    return {
+        "total_instituciones": total,
+        "indicadores": [nombre for _, nombre in indicadores],
+        # Cada fila trae "valores" alineados con "indicadores" (None: sin datos)
+        "comparativa": [_fila(fila) for fila in filas],
+        "mejor_institucion": _fila(mejor, valores=False) if mejor else None,
+        "promedio_sistema": round(totales['promedio_sistema'] or 0, 2),
+        "paginacion": {
+            "pagina": pagina,
+            "por_pagina": por_pagina,
+            "total_paginas": -(-total // por_pagina) if total else 0,
+            "orden": orden,
+            "top": top,
+        },
+        "metadatos": {
+            "fecha_generacion": timezone.now().isoformat(),
+            "filtros_aplicados": "Global" if alcance == ALCANCE_GLOBAL else "Por institución",
+            "rendimiento": medidor.presupuesto('comparativo'),
+        },
+        "status": "ok",
+    }
@@ -1,10 +1,11 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
+from django.utils import timezone
 from .models import (
     Institucion, Rol, UsuarioPerfil,
     Encuesta, Pregunta, OpcionRespuesta, Respuesta,
     ResultadoEncuesta, Indicador, ResultadoIndicador,
-    ModeloIA, PrediccionIA, RecursoColaborativo
+    ModeloIA, PrediccionIA, RecursoColaborativo, TrabajoEntrenamiento
 )
 
 class InstitucionSerializer(serializers.ModelSerializer):
@@ -95,6 +96,21 @@ class PrediccionIASerializer(serializers.ModelSerializer):
         read_only_fields = ["fecha_prediccion"]
 
 
+class TrabajoEntrenamientoSerializer(serializers.ModelSerializer):
+    """Estado de un trabajo de entrenamiento, con su duración en segundos."""
+    duracion_segundos = serializers.SerializerMethodField()
+
+    class Meta:
+        model = TrabajoEntrenamiento
+        fields = "__all__"
+
+    def get_duracion_segundos(self, obj):
+        if not obj.fecha_inicio:
+            return None
+        fin = obj.fecha_fin or timezone.now()
+        return round((fin - obj.fecha_inicio).total_seconds(), 2)
+
+
 class RecursoColaborativoSerializer(serializers.ModelSerializer):
     class Meta:
         model = RecursoColaborativo
@@ -0,0 +1,311 @@
+"""
+Servidor de inferencia local (sidecar) con micro-lotes.
+
+Un proceso aparte (manage.py servidor_inferencia) mantiene el modelo activo
+en memoria una sola vez y escucha en un socket Unix. Las peticiones que
+llegan dentro de una ventana de pocos milisegundos se apilan en una sola
+matriz y se resuelven con una única pasada de _predecir_matriz.
+
+Con ML_SERVIDOR_INFERENCIA_SOCKET configurado, AnalizadorMadurezDigital
+envía sus predicciones al servidor a través de cliente_inferencia; si el
+servidor no responde, vuelve a la inferencia en el propio proceso.
+
+Protocolo: cada mensaje es un JSON precedido de su longitud (4 bytes, big
+endian). Peticiones: {"op": "info"} o {"op": "predecir", "X": [[...]]}.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import signal
+import socket
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from django.conf import settings
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+CABECERA = struct.Struct('>I')
+TAMAÑO_MAXIMO_MENSAJE = 64 * 2**20
+
+
+class ErrorServidorInferencia(Exception):
+    """El servidor de inferencia no está disponible o devolvió un error."""
+
+
+def _codificar(mensaje):
+    datos = json.dumps(mensaje, separators=(',', ':')).encode('utf-8')
+    return CABECERA.pack(len(datos)) + datos
+
+
+def _leer_exacto(conexion, n):
+    partes = bytearray()
+    while len(partes) < n:
+        bloque = conexion.recv(n - len(partes))
+        if not bloque:
+            raise ErrorServidorInferencia("El servidor de inferencia cerró la conexión")
+        partes.extend(bloque)
+    return bytes(partes)
+
+
+class ClienteInferencia:
+    """
+    Cliente del servidor de inferencia. Mantiene una conexión por hilo y
+    guarda en caché la descripción del modelo activo (clave, orden de
+    indicadores y clases) durante ML_MODELO_REVALIDACION_SEGUNDOS.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._info = None
+        self._info_ruta = None
+        self._info_validada = 0.0
+
+    @staticmethod
+    def ruta_socket():
+        return getattr(settings, 'ML_SERVIDOR_INFERENCIA_SOCKET', None)
+
+    def configurado(self):
+        return bool(self.ruta_socket()) and hasattr(socket, 'AF_UNIX')
+
+    def _conexion(self):
+        conexion = getattr(self._local, 'conexion', None)
+        if conexion is not None and getattr(self._local, 'ruta', None) != self.ruta_socket():
+            self._cerrar()
+            conexion = None
+        if conexion is None:
+            conexion = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            conexion.settimeout(getattr(settings, 'ML_SERVIDOR_INFERENCIA_TIMEOUT', 2.0))
+            try:
+                conexion.connect(self.ruta_socket())
+            except OSError:
+                conexion.close()
+                raise
+            self._local.conexion = conexion
+            self._local.ruta = self.ruta_socket()
+        return conexion
+
+    def _cerrar(self):
+        conexion = getattr(self._local, 'conexion', None)
+        self._local.conexion = None
+        if conexion is not None:
+            conexion.close()
+
+    def _llamar(self, peticion):
+        datos = _codificar(peticion)
+        # Un reintento con conexión nueva por si el servidor se reinició
+        for intento in range(2):
+            try:
+                conexion = self._conexion()
+                conexion.sendall(datos)
+                longitud, = CABECERA.unpack(_leer_exacto(conexion, CABECERA.size))
+                respuesta = json.loads(_leer_exacto(conexion, longitud))
+                break
+            except (OSError, ErrorServidorInferencia) as e:
+                self._cerrar()
+                if intento:
+                    raise ErrorServidorInferencia(str(e)) from e
+        if respuesta.get('error'):
+            raise ErrorServidorInferencia(respuesta['error'])
+        return respuesta
+
+    def info(self, forzar=False):
+        """Descripción del modelo activo en el servidor (clave None si no hay)."""
+        ahora = time.monotonic()
+        intervalo = getattr(settings, 'ML_MODELO_REVALIDACION_SEGUNDOS', 5)
+        ruta = self.ruta_socket()
+        if (not forzar and self._info and self._info_ruta == ruta
+                and ahora - self._info_validada < intervalo):
+            return self._info
+        info = self._llamar({'op': 'info'})
+        with self._lock:
+            self._info = info
+            self._info_ruta = ruta
+            self._info_validada = ahora
+        return info
+
+    def predecir(self, X):
+        """
+        Returns:
+            (clave del modelo, niveles, matriz de probabilidades)
+        """
+        respuesta = self._llamar({'op': 'predecir', 'X': np.asarray(X, dtype=float).tolist()})
+        return (
+            tuple(respuesta['clave']),
+            np.array(respuesta['niveles'], dtype=object),
+            np.array(respuesta['probabilidades'], dtype=float),
+        )
+
+
+cliente_inferencia = ClienteInferencia()
+
+
+class ServidorInferencia:
+    """
+    Servidor asyncio: una corrutina por conexión y un único agrupador que
+    junta las peticiones pendientes en micro-lotes. La inferencia (y la
+    consulta a la BD del registro de modelos) se hace en un hilo aparte para
+    no bloquear el bucle de eventos mientras llegan más peticiones.
+    """
+
+    def __init__(self, ruta_socket, ventana_ms=None, max_filas=None):
+        from .ml import AnalizadorMadurezDigital
+
+        self.ruta_socket = ruta_socket
+        self.ventana = (ventana_ms if ventana_ms is not None else
+                        getattr(settings, 'ML_SERVIDOR_INFERENCIA_VENTANA_MS', 2)) / 1000
+        self.max_filas = max_filas or getattr(settings, 'ML_SERVIDOR_INFERENCIA_MAX_FILAS', 256)
+        self.analizador = AnalizadorMadurezDigital()
+        # El servidor siempre predice en su propio proceso
+        self.analizador.usar_servidor = False
+        # Un solo hilo: un modelo, una conexión a la BD
+        self._ejecutor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='inferencia')
+        self._cola = None
+        self.peticiones = 0
+        self.lotes = 0
+        self.filas = 0
+
+    # --- Trabajo síncrono (hilo del ejecutor) ---
+
+    def _cargar(self):
+        close_old_connections()
+        if not self.analizador.cargar_modelo():
+            return False
+        return True
+
+    def _info(self):
+        if not self._cargar():
+            return {'clave': None}
+        return {
+            'clave': list(self.analizador.clave_modelo),
+            'indicadores_orden': list(self.analizador.indicadores_orden),
+            'niveles_madurez': list(self.analizador.niveles_madurez),
+            'clases': [str(c) for c in self.analizador.clases],
+            'estadisticas': self.estadisticas(),
+        }
+
+    def _predecir(self, X):
+        from .ml import ERROR_SIN_MODELO
+
+        if not self._cargar():
+            raise ErrorServidorInferencia(ERROR_SIN_MODELO)
+        niveles, probabilidades = self.analizador._predecir_matriz(X)
+        return list(self.analizador.clave_modelo), niveles, probabilidades
+
+    # --- Bucle de eventos ---
+
+    async def _agrupar(self):
+        bucle = asyncio.get_running_loop()
+        while True:
+            lote = [await self._cola.get()]
+            filas = len(lote[0][0])
+            limite = bucle.time() + self.ventana
+            while filas < self.max_filas:
+                restante = limite - bucle.time()
+                if restante <= 0:
+                    break
+                try:
+                    elemento = await asyncio.wait_for(self._cola.get(), restante)
+                except asyncio.TimeoutError:
+                    break
+                lote.append(elemento)
+                filas += len(elemento[0])
+
+            try:
+                clave, niveles, probabilidades = await bucle.run_in_executor(
+                    self._ejecutor, self._predecir, np.vstack([X for X, _ in lote])
+                )
+            except Exception as e:
+                for _, futuro in lote:
+                    if not futuro.done():
+                        futuro.set_result({'error': str(e)})
+                continue
+
+            self.lotes += 1
+            self.filas += filas
+            inicio = 0
+            for X, futuro in lote:
+                fin = inicio + len(X)
+                if not futuro.done():
+                    futuro.set_result({
+                        'clave': clave,
+                        'niveles': [str(n) for n in niveles[inicio:fin]],
+                        'probabilidades': probabilidades[inicio:fin].tolist(),
+                    })
+                inicio = fin
+
+    async def _atender(self, lector, escritor):
+        bucle = asyncio.get_running_loop()
+        try:
+            while True:
+                longitud, = CABECERA.unpack(await lector.readexactly(CABECERA.size))
+                if longitud > TAMAÑO_MAXIMO_MENSAJE:
+                    break
+                peticion = json.loads(await lector.readexactly(longitud))
+                self.peticiones += 1
+
+                if peticion.get('op') == 'info':
+                    try:
+                        respuesta = await bucle.run_in_executor(self._ejecutor, self._info)
+                    except Exception as e:
+                        respuesta = {'error': str(e)}
+                else:
+                    X = np.asarray(peticion.get('X') or [], dtype=float)
+                    if X.ndim != 2 or not len(X):
+                        respuesta = {'error': "X debe ser una matriz con al menos una fila"}
+                    else:
+                        futuro = bucle.create_future()
+                        await self._cola.put((X, futuro))
+                        respuesta = await futuro
+
+                escritor.write(_codificar(respuesta))
+                await escritor.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            escritor.close()
+
+    async def servir(self, listo=None):
+        """Escuchar hasta que se cancele la tarea. listo: threading.Event opcional."""
+        self._cola = asyncio.Queue()
+        if os.path.exists(self.ruta_socket):
+            os.remove(self.ruta_socket)
+        servidor = await asyncio.start_unix_server(self._atender, path=self.ruta_socket)
+        os.chmod(self.ruta_socket, 0o660)
+        agrupador = asyncio.create_task(self._agrupar())
+        # SIGTERM/SIGINT detienen el servidor limpiamente (y borran el socket)
+        tarea = asyncio.current_task()
+        for señal in (signal.SIGTERM, signal.SIGINT):
+            asyncio.get_running_loop().add_signal_handler(señal, tarea.cancel)
+
+        # Cargar el modelo antes de aceptar la primera petición
+        await asyncio.get_running_loop().run_in_executor(self._ejecutor, self._cargar)
+        if listo is not None:
+            listo.set()
+        try:
+            async with servidor:
+                await servidor.serve_forever()
+        except asyncio.CancelledError:
+            pass
+        finally:
+            agrupador.cancel()
+            self._ejecutor.shutdown(wait=False)
+            if os.path.exists(self.ruta_socket):
+                os.remove(self.ruta_socket)
+
+    def estadisticas(self):
+        return {
+            "peticiones": self.peticiones,
+            "lotes": self.lotes,
+            "filas": self.filas,
+            "filas_por_lote": round(self.filas / self.lotes, 2) if self.lotes else 0.0,
+            "ventana_ms": round(self.ventana * 1000, 3),
+            "max_filas": self.max_filas,
+        }
@@ -0,0 +1,293 @@
+"""
+Señales de la app encuestas.
+
+Mantienen los agregados precalculados al guardar o borrar resultados y
+valores de indicadores:
+- TendenciaMensual: acumulados por institución, mes e indicador
+- MomentosIndicadores: medias y co-momentos por institución (correlaciones)
+- CaracteristicasResultado: vector de indicadores de cada resultado
+- ContadoresDashboard: totales del dashboard (también con encuestas,
+  respuestas, instituciones y usuarios)
+
+y además invalidan la caché de estadísticas de entrenamiento y la de
+reportes (incrementando su versión de datos).
+
+Las operaciones masivas (bulk_create, QuerySet.update) no disparan señales:
+después de ellas hay que ejecutar ``manage.py reconstruir_tendencias`` y
+``manage.py reconstruir_caracteristicas`` (y ``manage.py reconciliar_contadores``).
+"""
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .cache_reportes import incrementar_version
+from .caracteristicas import actualizar_caracteristicas, actualizar_datos_resultado
+from .contadores import registrar_evaluacion, sumar
+from .estadisticas import invalidar_estadisticas
+from .models import (
+    Encuesta, Indicador, Institucion, Respuesta, ResultadoEncuesta, ResultadoIndicador,
+)
+from .momentos import actualizar_momentos
+from .tendencias import acumular_valor, mes_de, mover_indicadores
+
+
+def _datos_resultado(resultado_id, instancia=None):
+    """(institucion_id, fecha_calculo, puntuacion_global) de un resultado."""
+    if instancia is not None and ResultadoIndicador.resultado.is_cached(instancia):
+        resultado = instancia.resultado
+        return (resultado.institucion_id, resultado.fecha_calculo, resultado.puntuacion_global)
+    return ResultadoEncuesta.objects.filter(pk=resultado_id).values_list(
+        'institucion_id', 'fecha_calculo', 'puntuacion_global'
+    ).first()
+
+
+def _descontar_momentos(resultado_id, origen, datos=None):
+    """
+    Quitar la aportación de un resultado a los momentos antes de borrarlo
+    (o de borrar alguno de sus valores).
+
+    Se hace en pre_delete porque delete() borra todas las filas antes de
+    enviar ningún post_delete. Un mismo delete() (origen) puede borrar varios
+    valores del mismo resultado: solo se descuenta una vez.
+    """
+    descontados = origen.__dict__.setdefault('_momentos_descontados', set())
+    if resultado_id in descontados:
+        return
+    descontados.add(resultado_id)
+    datos = datos or _datos_resultado(resultado_id)
+    if datos is not None:
+        actualizar_momentos(resultado_id, (datos[0], datos[2], None), None)
+
+
+def _clave(datos):
+    """(institución, mes) para TendenciaMensual."""
+    return (datos[0], mes_de(datos[1]))
+
+
+@receiver(pre_save, sender=ResultadoEncuesta)
+def guardar_estado_resultado(sender, instance, raw=False, **kwargs):
+    """
+    Estado anterior del resultado, con una sola consulta para todos los
+    receptores de post_save: _estado_anterior para los acumulados y
+    _evaluacion_anterior para los contadores del dashboard.
+    """
+    instance._estado_anterior = instance._evaluacion_anterior = None
+    if raw or instance.pk is None:
+        return
+    fila = ResultadoEncuesta.objects.filter(pk=instance.pk).values_list(
+        'institucion_id', 'fecha_calculo', 'puntuacion_global', 'nivel_madurez'
+    ).first()
+    if fila is not None:
+        institucion_id, fecha_calculo, puntuacion_global, nivel_madurez = fila
+        instance._estado_anterior = (institucion_id, fecha_calculo, puntuacion_global)
+        instance._evaluacion_anterior = (institucion_id, nivel_madurez, puntuacion_global)
+
+
+@receiver(post_save, sender=ResultadoEncuesta)
+def actualizar_agregados_resultado(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    actualizar_datos_resultado(instance)
+
+    actual = (instance.institucion_id, instance.fecha_calculo, instance.puntuacion_global)
+    clave = _clave(actual)
+    anterior = getattr(instance, '_estado_anterior', None)
+
+    if anterior is not None:
+        clave_anterior = _clave(anterior)
+        if clave_anterior == clave and anterior[2] == actual[2]:
+            return
+        acumular_valor(*clave_anterior, None, anterior[2], signo=-1)
+        if clave_anterior != clave:
+            mover_indicadores(instance.pk, clave_anterior, clave)
+        if (anterior[0], anterior[2]) != (actual[0], actual[2]):
+            actualizar_momentos(
+                instance.pk, (anterior[0], anterior[2], None), (actual[0], actual[2], None)
+            )
+
+    acumular_valor(*clave, None, instance.puntuacion_global)
+
+
+@receiver(pre_delete, sender=ResultadoEncuesta)
+def descontar_momentos_resultado(sender, instance, origin=None, **kwargs):
+    _descontar_momentos(
+        instance.pk, origin if origin is not None else instance,
+        (instance.institucion_id, instance.fecha_calculo, instance.puntuacion_global)
+    )
+
+
+@receiver(post_delete, sender=ResultadoEncuesta)
+def descontar_agregados_resultado(sender, instance, **kwargs):
+    acumular_valor(
+        instance.institucion_id, mes_de(instance.fecha_calculo), None,
+        instance.puntuacion_global, signo=-1
+    )
+
+
+@receiver(pre_save, sender=ResultadoIndicador)
+def guardar_estado_indicador(sender, instance, raw=False, **kwargs):
+    instance._estado_anterior = None
+    if raw or instance.pk is None:
+        return
+    instance._estado_anterior = ResultadoIndicador.objects.filter(pk=instance.pk).values_list(
+        'resultado_id', 'indicador_id', 'valor'
+    ).first()
+
+
+@receiver(post_save, sender=ResultadoIndicador)
+def actualizar_agregados_indicador(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    anterior = getattr(instance, '_estado_anterior', None)
+    if anterior == (instance.resultado_id, instance.indicador_id, instance.valor):
+        return
+    actualizar_caracteristicas(instance.resultado_id)
+    datos = _datos_resultado(instance.resultado_id, instance)
+
+    if anterior is not None:
+        resultado_anterior, indicador_anterior, valor_anterior = anterior
+        datos_anteriores = (
+            datos if resultado_anterior == instance.resultado_id
+            else _datos_resultado(resultado_anterior)
+        )
+        if datos_anteriores is not None:
+            acumular_valor(*_clave(datos_anteriores), indicador_anterior, valor_anterior, signo=-1)
+            if resultado_anterior != instance.resultado_id:
+                actualizar_caracteristicas(resultado_anterior)
+                actualizar_momentos(
+                    resultado_anterior,
+                    (datos_anteriores[0], datos_anteriores[2], {indicador_anterior: valor_anterior}),
+                    (datos_anteriores[0], datos_anteriores[2], None),
+                )
+
+    if datos is None:
+        return
+    acumular_valor(*_clave(datos), instance.indicador_id, instance.valor)
+
+    # Estado del resultado antes de esta escritura, a partir del actual
+    cambios = {instance.indicador_id: None}
+    if anterior is not None and anterior[0] == instance.resultado_id:
+        cambios[anterior[1]] = anterior[2]
+    actualizar_momentos(
+        instance.resultado_id, (datos[0], datos[2], cambios), (datos[0], datos[2], None)
+    )
+
+
+@receiver(pre_delete, sender=ResultadoIndicador)
+def descontar_momentos_indicador(sender, instance, origin=None, **kwargs):
+    _descontar_momentos(instance.resultado_id, origin if origin is not None else instance)
+
+
+@receiver(post_delete, sender=ResultadoIndicador)
+def descontar_agregados_indicador(sender, instance, **kwargs):
+    datos = _datos_resultado(instance.resultado_id, instance)
+    if datos is not None:
+        acumular_valor(*_clave(datos), instance.indicador_id, instance.valor, signo=-1)
+
+    # Cuando llega el post_delete ya se han borrado todas las filas del
+    # delete(): basta recalcular una vez por resultado. Sin crear la fila,
+    # porque en un borrado en cascada el resultado también va a desaparecer.
+    origen = kwargs.get('origin') or instance
+    actualizados = origen.__dict__.setdefault('_caracteristicas_actualizadas', set())
+    if instance.resultado_id not in actualizados:
+        actualizados.add(instance.resultado_id)
+        actualizar_caracteristicas(instance.resultado_id, crear=False)
+
+
+@receiver(post_save, sender=ResultadoEncuesta)
+@receiver(post_delete, sender=ResultadoEncuesta)
+@receiver(post_save, sender=ResultadoIndicador)
+@receiver(post_delete, sender=ResultadoIndicador)
+@receiver(post_save, sender=Indicador)
+@receiver(post_delete, sender=Indicador)
+def invalidar_estadisticas_entrenamiento(sender, raw=False, **kwargs):
+    # Tras el commit: antes, otra petición podría volver a cachear datos viejos
+    if not raw:
+        transaction.on_commit(invalidar_estadisticas)
+
+
+@receiver(post_save, sender=ResultadoEncuesta)
+@receiver(post_delete, sender=ResultadoEncuesta)
+@receiver(post_save, sender=ResultadoIndicador)
+@receiver(post_delete, sender=ResultadoIndicador)
+@receiver(post_save, sender=Indicador)
+@receiver(post_delete, sender=Indicador)
+@receiver(post_save, sender=Institucion)
+@receiver(post_delete, sender=Institucion)
+@receiver(post_save, sender=Encuesta)
+@receiver(post_delete, sender=Encuesta)
+@receiver(post_save, sender=Respuesta)
+@receiver(post_delete, sender=Respuesta)
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidar_reportes(sender, raw=False, update_fields=None, **kwargs):
+    # El login solo actualiza last_login, que no sale en ningún reporte
+    if raw or (sender is User and update_fields and set(update_fields) <= {'last_login'}):
+        return
+    # Tras el commit, como invalidar_estadisticas_entrenamiento
+    transaction.on_commit(incrementar_version)
+
+
+@receiver(post_save, sender=ResultadoEncuesta)
+def contar_evaluacion(sender, instance, raw=False, **kwargs):
+    # _evaluacion_anterior: de guardar_estado_resultado (pre_save)
+    if not raw:
+        registrar_evaluacion(
+            getattr(instance, '_evaluacion_anterior', None),
+            (instance.institucion_id, instance.nivel_madurez, instance.puntuacion_global),
+        )
+
+
+@receiver(post_delete, sender=ResultadoEncuesta)
+def descontar_evaluacion(sender, instance, **kwargs):
+    registrar_evaluacion(
+        (instance.institucion_id, instance.nivel_madurez, instance.puntuacion_global), None
+    )
+
+
+# Modelos que solo cuentan altas y bajas: campo de ContadoresDashboard
+_TOTALES = {
+    Encuesta: 'total_encuestas',
+    Respuesta: 'total_respuestas',
+    Institucion: 'total_instituciones',
+}
+
+
+@receiver(post_save, sender=Encuesta)
+@receiver(post_save, sender=Respuesta)
+@receiver(post_save, sender=Institucion)
+def contar_alta(sender, created, raw=False, **kwargs):
+    if created and not raw:
+        sumar(**{_TOTALES[sender]: 1})
+
+
+@receiver(post_delete, sender=Encuesta)
+@receiver(post_delete, sender=Respuesta)
+@receiver(post_delete, sender=Institucion)
+def contar_baja(sender, **kwargs):
+    sumar(**{_TOTALES[sender]: -1})
+
+
+@receiver(pre_save, sender=User)
+def guardar_usuario_activo(sender, instance, raw=False, update_fields=None, **kwargs):
+    if update_fields is not None and 'is_active' not in update_fields:
+        # p. ej. el login, que solo guarda last_login
+        instance._activo_anterior = instance.is_active
+    elif raw or instance.pk is None:
+        instance._activo_anterior = False
+    else:
+        instance._activo_anterior = User.objects.filter(pk=instance.pk, is_active=True).exists()
+
+
+@receiver(post_save, sender=User)
+def contar_usuario_activo(sender, instance, raw=False, **kwargs):
+    if not raw and instance.is_active != getattr(instance, '_activo_anterior', instance.is_active):
+        sumar(usuarios_activos=1 if instance.is_active else -1)
+
+
+@receiver(post_delete, sender=User)
+def descontar_usuario_activo(sender, instance, **kwargs):
+    if instance.is_active:
+        sumar(usuarios_activos=-1)
@@ -0,0 +1,158 @@
+"""
+Snapshots del conjunto de entrenamiento en Parquet.
+
+Un snapshot guarda la matriz de características ya pivotada (una fila por
+resultado, una columna por indicador) junto con la etiqueta y una huella
+(sha256) del contenido. Entrenar desde un snapshot no toca la base de datos
+y permite reproducir exactamente el conjunto de datos de un ModeloIA.
+
+Requiere pyarrow.
+"""
+
+import hashlib
+import json
+import os
+import re
+import tempfile
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - dependencia opcional
+    pa = pq = None
+
+CLAVE_METADATOS = b'software_educativo'
+NOMBRE_VALIDO = re.compile(r'^[\w\-]{1,100}$')
+
+
+def _comprobar_pyarrow():
+    if pa is None:
+        raise RuntimeError("Los snapshots de entrenamiento requieren pyarrow (pip install pyarrow)")
+
+
+def directorio_snapshots():
+    return Path(getattr(
+        settings, 'ML_SNAPSHOTS_DIR', os.path.join(settings.BASE_DIR, 'ml_models', 'snapshots')
+    ))
+
+
+def _ruta(nombre):
+    if not NOMBRE_VALIDO.match(nombre or ''):
+        raise ValueError(f"Nombre de snapshot no válido: {nombre!r}")
+    return directorio_snapshots() / f"{nombre}.parquet"
+
+
+def calcular_huella(X, y):
+    """
+    Huella sha256 de un conjunto de entrenamiento: columnas, ids de
+    resultado, valores y etiquetas, en el orden del DataFrame.
+    """
+    huella = hashlib.sha256()
+    huella.update(json.dumps([str(c) for c in X.columns]).encode('utf-8'))
+    huella.update(np.ascontiguousarray(X.index.to_numpy(), dtype=np.int64).tobytes())
+    huella.update(np.ascontiguousarray(X.to_numpy(), dtype=np.float64).tobytes())
+    huella.update('\n'.join(map(str, y)).encode('utf-8'))
+    return huella.hexdigest()
+
+
+def crear_snapshot(nombre=None):
+    """
+    Extraer el conjunto de entrenamiento actual y guardarlo como snapshot.
+
+    Returns:
+        dict con nombre, huella, filas, columnas y ruta
+    """
+    from .ml import AnalizadorMadurezDigital
+
+    _comprobar_pyarrow()
+    nombre = nombre or f"snapshot_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    ruta = _ruta(nombre)
+    if ruta.exists():
+        raise ValueError(f"Ya existe un snapshot llamado {nombre}")
+
+    analizador = AnalizadorMadurezDigital()
+    X, y = analizador.extraer_datos_entrenamiento()
+    if X is None:
+        raise ValueError("No hay datos suficientes para crear un snapshot")
+
+    info = {
+        'nombre': nombre,
+        'huella': calcular_huella(X, y),
+        'filas': len(X),
+        'columnas': [str(c) for c in X.columns],
+        'indicadores_orden': analizador.indicadores_orden,
+        'fecha_creacion': datetime.now().isoformat(timespec='seconds'),
+    }
+
+    tabla = pa.Table.from_pandas(X.assign(nivel_madurez=y), preserve_index=True)
+    tabla = tabla.replace_schema_metadata({
+        **(tabla.schema.metadata or {}),
+        CLAVE_METADATOS: json.dumps(info).encode('utf-8'),
+    })
+
+    # Escritura atómica: un snapshot a medias nunca es visible
+    ruta.parent.mkdir(parents=True, exist_ok=True)
+    descriptor, temporal = tempfile.mkstemp(dir=ruta.parent, suffix='.parquet.tmp')
+    os.close(descriptor)
+    try:
+        pq.write_table(tabla, temporal)
+        os.replace(temporal, ruta)
+    except BaseException:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+        raise
+
+    info['ruta'] = str(ruta)
+    info['tamaño_bytes'] = ruta.stat().st_size
+    return info
+
+
+def leer_info(ruta):
+    """Metadatos de un snapshot (sin leer los datos)."""
+    metadatos = pq.read_schema(ruta).metadata or {}
+    info = json.loads(metadatos.get(CLAVE_METADATOS, b'{}'))
+    info['ruta'] = str(ruta)
+    info['tamaño_bytes'] = Path(ruta).stat().st_size
+    return info
+
+
+def listar_snapshots():
+    _comprobar_pyarrow()
+    directorio = directorio_snapshots()
+    if not directorio.is_dir():
+        return []
+    return sorted(
+        (leer_info(ruta) for ruta in directorio.glob('*.parquet')),
+        key=lambda info: info.get('fecha_creacion', ''), reverse=True
+    )
+
+
+def cargar_snapshot(nombre):
+    """
+    Leer un snapshot con memory-mapping y comprobar su huella.
+
+    Returns:
+        (X, y, info) con X indexado por resultado_id, como
+        AnalizadorMadurezDigital.extraer_datos_entrenamiento
+    """
+    _comprobar_pyarrow()
+    ruta = _ruta(nombre)
+    if not ruta.exists():
+        raise ValueError(f"No existe el snapshot {nombre}")
+
+    tabla = pq.read_table(ruta, memory_map=True)
+    info = json.loads((tabla.schema.metadata or {}).get(CLAVE_METADATOS, b'{}'))
+    df = tabla.to_pandas()
+    y = df.pop('nivel_madurez').tolist()
+    X = df[info['columnas']]
+
+    if calcular_huella(X, y) != info.get('huella'):
+        raise ValueError(f"El snapshot {nombre} está corrupto: la huella no coincide")
+
+    info['ruta'] = str(ruta)
+    return X, y, info
@@ -0,0 +1,122 @@
+"""
+Mantenimiento de los acumulados mensuales (TendenciaMensual).
+
+Cada resultado suma su puntuación global a la fila (institución, mes, NULL)
+y cada valor de indicador a la fila (institución, mes, indicador). Las
+actualizaciones se hacen con expresiones F() para que escrituras
+concurrentes no se pisen.
+"""
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, FloatField, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from .models import ResultadoEncuesta, ResultadoIndicador, TendenciaMensual
+
+
+def mes_de(fecha):
+    """Primer día del mes (en la zona horaria activa) de una fecha."""
+    if timezone.is_naive(fecha):
+        fecha = timezone.make_aware(fecha)
+    return timezone.localtime(fecha).date().replace(day=1)
+
+
+def acumular(institucion_id, mes, indicador_id, cantidad, suma, suma_cuadrados):
+    """Sumar (o restar, con valores negativos) a la fila de acumulados."""
+    if not cantidad:
+        return
+
+    filtro = {'institucion_id': institucion_id, 'mes': mes, 'indicador_id': indicador_id}
+    incremento = {
+        'cantidad': F('cantidad') + cantidad,
+        'suma': F('suma') + suma,
+        'suma_cuadrados': F('suma_cuadrados') + suma_cuadrados,
+    }
+    if TendenciaMensual.objects.filter(**filtro).update(**incremento):
+        return
+    if cantidad < 0:
+        # La fila ya no existe (p. ej. borrada en cascada con su institución)
+        return
+
+    try:
+        with transaction.atomic():
+            TendenciaMensual.objects.create(
+                cantidad=cantidad, suma=suma, suma_cuadrados=suma_cuadrados, **filtro
+            )
+    except IntegrityError:
+        # Otra petición creó la fila a la vez
+        TendenciaMensual.objects.filter(**filtro).update(**incremento)
+
+
+def acumular_valor(institucion_id, mes, indicador_id, valor, signo=1):
+    acumular(institucion_id, mes, indicador_id, signo, signo * valor, signo * valor * valor)
+
+
+def mover_indicadores(resultado_id, origen, destino):
+    """
+    Trasladar los valores de indicadores de un resultado de un (institución,
+    mes) a otro, cuando cambia la institución o la fecha del resultado.
+    """
+    totales = ResultadoIndicador.objects.filter(resultado_id=resultado_id).values(
+        'indicador_id'
+    ).annotate(
+        n=Count('id'),
+        s=Sum('valor'),
+        sq=Sum(F('valor') * F('valor'), output_field=FloatField()),
+    )
+    for fila in totales:
+        acumular(*origen, fila['indicador_id'], -fila['n'], -fila['s'], -fila['sq'])
+        acumular(*destino, fila['indicador_id'], fila['n'], fila['s'], fila['sq'])
+
+
+def reconstruir_tendencias():
+    """
+    Recalcular todos los acumulados desde cero con dos consultas agregadas.
+    Necesario tras cargas masivas (bulk_create, update) que no disparan
+    señales, y para corregir la deriva de sumas en coma flotante.
+    """
+    return _reconstruir(ResultadoEncuesta, ResultadoIndicador, TendenciaMensual)
+
+
+def _reconstruir(ResultadoEncuesta, ResultadoIndicador, TendenciaMensual):
+    # Recibe los modelos para poder usarse también desde las migraciones
+    mes = TruncMonth('resultado__fecha_calculo')
+    por_indicador = ResultadoIndicador.objects.values(
+        'resultado__institucion_id', 'indicador_id', mes=mes
+    ).annotate(
+        n=Count('id'),
+        s=Sum('valor'),
+        sq=Sum(F('valor') * F('valor'), output_field=FloatField()),
+    ).order_by()
+
+    globales = ResultadoEncuesta.objects.values(
+        'institucion_id', mes=TruncMonth('fecha_calculo')
+    ).annotate(
+        n=Count('id'),
+        s=Sum('puntuacion_global'),
+        sq=Sum(F('puntuacion_global') * F('puntuacion_global'), output_field=FloatField()),
+    ).order_by()
+
+    def _fecha(valor):
+        return valor.date() if hasattr(valor, 'date') else valor
+
+    filas = [
+        TendenciaMensual(
+            institucion_id=fila['resultado__institucion_id'], mes=_fecha(fila['mes']),
+            indicador_id=fila['indicador_id'],
+            cantidad=fila['n'], suma=fila['s'], suma_cuadrados=fila['sq'],
+        )
+        for fila in por_indicador
+    ] + [
+        TendenciaMensual(
+            institucion_id=fila['institucion_id'], mes=_fecha(fila['mes']), indicador_id=None,
+            cantidad=fila['n'], suma=fila['s'], suma_cuadrados=fila['sq'],
+        )
+        for fila in globales
+    ]
+
+    with transaction.atomic():
+        TendenciaMensual.objects.all().delete()
+        TendenciaMensual.objects.bulk_create(filas, batch_size=1000)
+    return len(filas)
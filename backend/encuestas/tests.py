@@ -1,3 +1,1371 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import random
+import shutil
+import socket
+import tempfile
+import threading
+from datetime import timedelta
+from pathlib import Path
+from unittest import mock, skipIf
 
-# Create your tests here.
+import joblib
+import numpy as np
+import pandas as pd
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Avg
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from sklearn.ensemble import ExtraTreesClassifier, RandomForestClassifier
+from sklearn.preprocessing import StandardScaler
+
+from .cache_reportes import incrementar_version, version_datos
+from .caracteristicas import reconstruir_caracteristicas
+from .contadores import FILA, reconstruir_contadores
+from .escritura_diferida import BufferPredicciones
+from .estadisticas import estadisticas_entrenamiento
+from .ml import (
+    AnalizadorMadurezDigital, CachePredicciones, RegistroModelos, RegistroSegmentos,
+    registro_modelos, registro_segmentos,
+)
+from .ml_busqueda import medir_latencia
+from .ml_inferencia import BosquePlano
+from .models import (
+    CaracteristicasResultado, ContadoresDashboard, ContadorNivelMadurez, Encuesta, Indicador,
+    Institucion, ModeloIA, MomentosIndicadores, PrediccionIA, Pregunta, Respuesta,
+    ResultadoEncuesta, ResultadoIndicador, Rol, TendenciaMensual, TrabajoEntrenamiento,
+    UsuarioPerfil, VersionDatos,
+)
+from .momentos import combinar_momentos, reconstruir_momentos
+from .precarga import EstadoPrecarga
+from .reportes import ALCANCE_GLOBAL, reporte_comparativo, reporte_resumen
+from .servidor_inferencia import ClienteInferencia, ServidorInferencia, cliente_inferencia
+from .snapshots import cargar_snapshot, crear_snapshot, listar_snapshots, pa, pq
+from .tendencias import reconstruir_tendencias
+from .trabajos import (
+    ejecutar_trabajo, encolar_entrenamiento, recuperar_trabajos_huerfanos, tomar_siguiente_trabajo,
+)
+
+
+class DatosEncuestasMixin:
+    """
+    Crea resultados con valores de indicadores a través del ORM (disparando
+    las señales) y después los modifica: cambio de valores y puntuaciones,
+    traslado de institución, resultados incompletos y borrados.
+    """
+
+    def crear_datos(self, resultados=30, semilla=7):
+        azar = random.Random(semilla)
+        self.instituciones = [
+            Institucion.objects.create(
+                nombre=f"Institución {i}", nivel_educativo="Secundaria", ciudad="Quito", pais="Ecuador"
+            )
+            for i in range(2)
+        ]
+        self.indicadores = [
+            Indicador.objects.create(nombre=f"Indicador {i}", categoria="general") for i in range(3)
+        ]
+        encuesta = Encuesta.objects.create(titulo="Encuesta de prueba", institucion=self.instituciones[0])
+
+        self.resultados = []
+        for i in range(resultados):
+            valores = [round(azar.uniform(1, 5), 2) for _ in self.indicadores]
+            resultado = ResultadoEncuesta.objects.create(
+                encuesta=encuesta,
+                institucion=self.instituciones[i % 2],
+                nivel_madurez=azar.choice(["Inicial", "En desarrollo", "Avanzado"]),
+                puntuacion_global=round(sum(valores) / len(valores), 2),
+            )
+            # Uno de cada siete resultados queda incompleto
+            incompleto = i % 7 == 3
+            for indicador, valor in zip(self.indicadores, valores):
+                if incompleto and indicador == self.indicadores[-1]:
+                    continue
+                ResultadoIndicador.objects.create(
+                    resultado=resultado, indicador=indicador, valor=valor, nivel_indicador="medio"
+                )
+            self.resultados.append(resultado)
+
+    def modificar_datos(self):
+        valor = ResultadoIndicador.objects.filter(resultado=self.resultados[0]).first()
+        valor.valor = 4.9
+        valor.save()
+
+        resultado = self.resultados[1]
+        resultado.puntuacion_global = 1.1
+        resultado.nivel_madurez = "Inicial"
+        resultado.save()
+
+        resultado = self.resultados[2]
+        resultado.institucion = self.instituciones[1]
+        resultado.save()
+
+        ResultadoIndicador.objects.filter(resultado=self.resultados[4]).first().delete()
+        self.resultados[5].delete()
+
+    def aislar_modelos(self):
+        """
+        Artefactos de modelo en un directorio temporal y registros que
+        revalidan el modelo activo en cada uso.
+        """
+        directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directorio)
+        ajustes = override_settings(BASE_DIR=directorio, ML_MODELO_REVALIDACION_SEGUNDOS=0)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        return directorio
+
+    def cliente(self, rol, institucion=None):
+        """APIClient autenticado con un usuario del rol indicado."""
+        usuario = User.objects.create_user(f"{rol}_{User.objects.count()}")
+        UsuarioPerfil.objects.create(
+            usuario=usuario, rol=Rol.objects.get_or_create(nombre_rol=rol)[0], institucion=institucion
+        )
+        cliente = APIClient()
+        cliente.force_authenticate(usuario)
+        return cliente
+
+    def matriz_completa(self, institucion=None):
+        """[puntuacion_global, *indicadores] de cada resultado completo, leído de la BD."""
+        filas = ResultadoIndicador.objects.values_list(
+            'resultado_id', 'resultado__institucion_id', 'resultado__puntuacion_global',
+            'indicador_id', 'valor'
+        )
+        df = pd.DataFrame(
+            list(filas), columns=['resultado', 'institucion', 'puntuacion', 'indicador', 'valor']
+        )
+        if institucion is not None:
+            df = df[df['institucion'] == institucion.id]
+        tabla = df.pivot_table(
+            index=['resultado', 'puntuacion'], columns='indicador', values='valor'
+        ).reindex(columns=[i.id for i in self.indicadores]).dropna().reset_index(level='puntuacion')
+        return tabla[['puntuacion'] + [i.id for i in self.indicadores]].to_numpy()
+
+
+class MomentosIndicadoresTests(DatosEncuestasMixin, TestCase):
+    """Los acumuladores mantenidos por señales coinciden con una reconstrucción completa."""
+
+    def setUp(self):
+        self.crear_datos()
+        self.modificar_datos()
+
+    def _estado(self):
+        return {
+            acumulador.institucion_id: (acumulador.n, acumulador.medias, acumulador.comomentos)
+            for acumulador in MomentosIndicadores.objects.filter(n__gt=0)
+        }
+
+    def test_coincide_con_reconstruccion(self):
+        incremental = self._estado()
+        reconstruir_momentos()
+        completo = self._estado()
+
+        self.assertEqual(incremental.keys(), completo.keys())
+        for institucion_id, (n, medias, comomentos) in completo.items():
+            self.assertEqual(incremental[institucion_id][0], n)
+            np.testing.assert_allclose(incremental[institucion_id][1], medias, atol=1e-9)
+            np.testing.assert_allclose(incremental[institucion_id][2], comomentos, atol=1e-9)
+
+    def test_correlaciones_como_pandas(self):
+        for institucion in (None, self.instituciones[0]):
+            X = self.matriz_completa(institucion)
+            _, momentos = combinar_momentos(institucion.id if institucion else None)
+            self.assertEqual(momentos.n, len(X))
+            np.testing.assert_allclose(
+                momentos.correlaciones(), pd.DataFrame(X).corr().to_numpy(), atol=1e-9
+            )
+
+    def test_endpoint_sirve_las_correlaciones(self):
+        institucion = self.instituciones[0]
+        respuesta = self.cliente('directivo', institucion).get('/api/ia/tendencias/')
+        self.assertEqual(respuesta.status_code, 200)
+        correlaciones = respuesta.data['analisis_tendencias']['correlaciones_indicadores']
+
+        esperado = pd.DataFrame(self.matriz_completa(institucion)).corr().to_numpy()[0, 1:]
+        servido = list(correlaciones['con_puntuacion_global'].values())
+        np.testing.assert_allclose(servido, esperado, atol=1e-9)
+        self.assertTrue(respuesta.data['metadatos']['institucion_filtrada'])
+
+
+class TendenciaMensualTests(DatosEncuestasMixin, TestCase):
+    """Los acumulados mensuales mantenidos por señales coinciden con una reconstrucción completa."""
+
+    def _estado(self):
+        return {
+            (fila.institucion_id, fila.mes, fila.indicador_id): (fila.cantidad, fila.suma, fila.suma_cuadrados)
+            for fila in TendenciaMensual.objects.filter(cantidad__gt=0)
+        }
+
+    def test_coincide_con_reconstruccion(self):
+        self.crear_datos()
+        self.modificar_datos()
+        incremental = self._estado()
+        reconstruir_tendencias()
+        completo = self._estado()
+
+        self.assertEqual(incremental.keys(), completo.keys())
+        for clave, (cantidad, suma, suma_cuadrados) in completo.items():
+            self.assertEqual(incremental[clave][0], cantidad)
+            self.assertAlmostEqual(incremental[clave][1], suma, places=9)
+            self.assertAlmostEqual(incremental[clave][2], suma_cuadrados, places=9)
+
+    def test_distribucion_de_niveles_sin_recorrer_resultados(self):
+        self.crear_datos()
+        self.modificar_datos()
+        analizador = AnalizadorMadurezDigital()
+        for institucion in [None] + self.instituciones:
+            filtro = {'institucion': institucion} if institucion else {}
+            esperada = {}
+            for nivel in ResultadoEncuesta.objects.filter(**filtro).values_list('nivel_madurez', flat=True):
+                esperada[nivel] = esperada.get(nivel, 0) + 1
+
+            with CaptureQueriesContext(connection) as consultas:
+                analisis = analizador.analizar_tendencias(institucion.id if institucion else None)
+            self.assertEqual(analisis['distribucion_niveles'], esperada)
+            self.assertFalse(
+                [c['sql'] for c in consultas.captured_queries if '"resultado_encuesta"' in c['sql']]
+            )
+
+
+class CaracteristicasResultadoTests(DatosEncuestasMixin, TestCase):
+    """Las filas desnormalizadas coinciden con una reconstrucción completa."""
+
+    def _estado(self):
+        return {
+            fila[0]: fila[1:]
+            for fila in CaracteristicasResultado.objects.values_list(
+                'resultado_id', 'institucion_id', 'fecha_calculo', 'puntuacion_global',
+                'nivel_madurez', 'valores', 'num_indicadores'
+            )
+        }
+
+    def test_coincide_con_reconstruccion(self):
+        self.crear_datos()
+        self.modificar_datos()
+        incremental = self._estado()
+        reconstruir_caracteristicas()
+
+        self.assertEqual(incremental, self._estado())
+        self.assertEqual(len(incremental), ResultadoEncuesta.objects.count())
+
+
+class ContadoresDashboardTests(DatosEncuestasMixin, TestCase):
+    """Los contadores del dashboard coinciden con un recuento completo."""
+
+    CAMPOS = (
+        'total_encuestas', 'total_respuestas', 'total_evaluaciones', 'total_instituciones',
+        'usuarios_activos', 'nivel_predominante',
+    )
+
+    def _estado(self):
+        fila = ContadoresDashboard.objects.values(*self.CAMPOS, 'suma_puntuaciones').get(pk=FILA)
+        niveles = {
+            (institucion_id, nivel): cantidad
+            for institucion_id, nivel, cantidad in ContadorNivelMadurez.objects.filter(
+                cantidad__gt=0
+            ).values_list('institucion_id', 'nivel_madurez', 'cantidad')
+        }
+        return fila, niveles
+
+    def test_coincide_con_reconstruccion(self):
+        self.crear_datos()
+        self.modificar_datos()
+        usuarios = [User.objects.create_user(f"usuario_{i}") for i in range(3)]
+        usuarios[0].is_active = False
+        usuarios[0].save()
+        usuarios[1].delete()
+        self.instituciones[1].delete()
+
+        incremental, niveles_incremental = self._estado()
+        reconstruir_contadores()
+        completo, niveles_completo = self._estado()
+
+        for campo in self.CAMPOS:
+            self.assertEqual(incremental[campo], completo[campo], campo)
+        self.assertAlmostEqual(incremental['suma_puntuaciones'], completo['suma_puntuaciones'], places=9)
+        self.assertEqual(niveles_incremental, niveles_completo)
+
+    def test_una_lectura_previa_por_guardado(self):
+        self.crear_datos(resultados=3)
+        resultado = self.resultados[1]
+        resultado.puntuacion_global = 2.2
+        resultado.nivel_madurez = "Avanzado"
+        with CaptureQueriesContext(connection) as consultas:
+            resultado.save()
+        lecturas = [
+            c['sql'] for c in consultas.captured_queries
+            if c['sql'].startswith('SELECT') and 'FROM "resultado_encuesta"' in c['sql']
+        ]
+        self.assertEqual(len(lecturas), 1)
+
+    def test_dashboard_sirve_los_contadores(self):
+        self.crear_datos()
+        respuesta = self.cliente('directivo').get('/api/dashboard-metricas/')
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.data['total_evaluaciones'], ResultadoEncuesta.objects.count())
+        self.assertEqual(respuesta.data['total_instituciones'], Institucion.objects.count())
+
+
+class CacheReportesTests(DatosEncuestasMixin, TestCase):
+    """Los reportes se sirven de la caché hasta que se confirma una escritura."""
+
+    def setUp(self):
+        # La caché local sobrevive entre tests: no reutilizar sus entradas
+        cache.clear()
+
+    def test_invalidacion_al_confirmar(self):
+        self.crear_datos()
+        cliente = self.cliente('admin_tic')
+
+        primera = cliente.get('/api/reporte-resumen/')
+        self.assertEqual(primera['X-Cache'], 'MISS')
+        self.assertEqual(cliente.get('/api/reporte-resumen/')['X-Cache'], 'HIT')
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.modificar_datos()
+        # Hasta el commit se sigue sirviendo la versión anterior
+        self.assertEqual(cliente.get('/api/reporte-resumen/')['X-Cache'], 'HIT')
+
+        for callback in callbacks:
+            callback()
+        segunda = cliente.get('/api/reporte-resumen/')
+        self.assertEqual(segunda['X-Cache'], 'MISS')
+        self.assertEqual(
+            segunda.data['resumen_ejecutivo']['total_resultados'],
+            primera.data['resumen_ejecutivo']['total_resultados'] - 1
+        )
+
+    def test_version_fuera_de_la_fila_de_contadores(self):
+        version = version_datos()
+        with CaptureQueriesContext(connection) as consultas:
+            incrementar_version()
+        self.assertEqual(version_datos(), version + 1)
+        self.assertFalse([c['sql'] for c in consultas.captured_queries if 'contadores_dashboard' in c['sql']])
+
+        # Sin la fila, se crea con otra versión
+        VersionDatos.objects.all().delete()
+        incrementar_version()
+        self.assertNotEqual(version_datos(), version + 1)
+
+    def test_alcance_por_institucion(self):
+        self.crear_datos()
+        global_ = self.cliente('admin_tic').get('/api/reporte-resumen/')
+        propio = self.cliente('directivo', self.instituciones[0]).get('/api/reporte-resumen/')
+
+        self.assertEqual(propio['X-Cache'], 'MISS')
+        self.assertEqual(
+            propio.data['resumen_ejecutivo']['total_resultados'],
+            ResultadoEncuesta.objects.filter(institucion=self.instituciones[0]).count()
+        )
+        self.assertNotEqual(
+            propio.data['resumen_ejecutivo']['total_resultados'],
+            global_.data['resumen_ejecutivo']['total_resultados']
+        )
+
+
+class BosquePlanoTests(SimpleTestCase):
+    """El bosque aplanado predice exactamente lo mismo que scikit-learn."""
+
+    def setUp(self):
+        azar = np.random.RandomState(0)
+        self.X = azar.normal(size=(400, 6))
+        self.y = np.array(['Inicial', 'En desarrollo', 'Avanzado'])[
+            np.digitize(self.X[:, 0] + 0.5 * self.X[:, 1], [-0.5, 0.5])
+        ]
+
+    def test_predict_proba_como_sklearn(self):
+        for bosque in (
+            RandomForestClassifier(n_estimators=30, max_depth=8, random_state=0),
+            RandomForestClassifier(n_estimators=10, random_state=0),  # árboles sin límite de profundidad
+            ExtraTreesClassifier(n_estimators=20, min_samples_leaf=2, random_state=0),
+        ):
+            bosque.fit(self.X[:300], self.y[:300])
+            plano = BosquePlano.desde_sklearn(bosque)
+            X_prueba = self.X[300:]
+
+            np.testing.assert_allclose(plano.predict_proba(X_prueba), bosque.predict_proba(X_prueba), atol=1e-12)
+            np.testing.assert_allclose(plano.predict_proba(X_prueba[:1]), bosque.predict_proba(X_prueba[:1]), atol=1e-12)
+
+    def test_serializacion(self):
+        bosque = RandomForestClassifier(n_estimators=15, random_state=1).fit(self.X, self.y)
+        plano = BosquePlano.desde_dict(BosquePlano.desde_sklearn(bosque).a_dict())
+        np.testing.assert_allclose(plano.predict_proba(self.X), bosque.predict_proba(self.X), atol=1e-12)
+
+    def test_latencia_medida_con_el_bosque_plano(self):
+        bosque = RandomForestClassifier(n_estimators=15, random_state=1).fit(self.X, self.y)
+        with mock.patch.object(RandomForestClassifier, 'predict_proba') as sklearn, \
+                mock.patch.object(BosquePlano, 'predict_proba', autospec=True) as plano:
+            latencia = medir_latencia(bosque, self.X, repeticiones=5)
+        sklearn.assert_not_called()
+        self.assertEqual(plano.call_count, 5)
+        self.assertEqual(plano.call_args.args[1].shape, (1, self.X.shape[1]))
+        self.assertGreaterEqual(latencia, 0)
+
+
+@override_settings(ML_ENTRENAMIENTO_LANZAR_WORKER=False)
+class TrabajoEntrenamientoTests(DatosEncuestasMixin, TestCase):
+    """Transiciones de estado de la cola de entrenamientos."""
+
+    def test_encolar_reutiliza_el_trabajo_activo(self):
+        trabajo, creado = encolar_entrenamiento(parametros={'modo': 'completo', 'test_size': 0.3})
+        self.assertTrue(creado)
+        self.assertEqual(trabajo.estado, 'pendiente')
+        self.assertEqual(trabajo.parametros, {'modo': 'completo', 'test_size': 0.3})
+
+        otro, creado = encolar_entrenamiento(parametros={'modo': 'incremental'})
+        self.assertFalse(creado)
+        self.assertEqual(otro.pk, trabajo.pk)
+
+    def test_trabajo_pendiente_relanza_el_worker(self):
+        with mock.patch('encuestas.trabajos.lanzar_worker') as lanzar:
+            with self.captureOnCommitCallbacks(execute=True):
+                trabajo, _ = encolar_entrenamiento()
+            # El worker no llegó a reservarlo: volver a encolar lo relanza
+            with self.captureOnCommitCallbacks(execute=True):
+                encolar_entrenamiento()
+            self.assertEqual(lanzar.call_count, 2)
+
+            tomar_siguiente_trabajo()
+            with self.captureOnCommitCallbacks(execute=True):
+                _, creado = encolar_entrenamiento()
+            self.assertFalse(creado)
+            self.assertEqual(lanzar.call_count, 2)
+
+    def test_estado_solo_para_admin_tic(self):
+        trabajo, _ = encolar_entrenamiento()
+        url = f'/api/ia/entrenamientos/{trabajo.pk}/'
+        self.assertEqual(self.cliente('docente').get(url).status_code, 403)
+        respuesta = self.cliente('admin_tic').get(url)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.data['estado'], 'pendiente')
+
+    def test_parametros_invalidos(self):
+        for parametros in ({'modo': 'otro'}, {'test_size': 1.5}, {'random_state': 'x'},
+                           {'modo': 'incremental', 'arboles_nuevos': 0}, {'forzar': 'quizá'}):
+            with self.assertRaises(ValueError):
+                encolar_entrenamiento(parametros=parametros)
+        self.assertFalse(TrabajoEntrenamiento.objects.exists())
+
+        cliente = self.cliente('admin_tic')
+        respuesta = cliente.post('/api/ia/entrenar-modelo/', {'test_size': 2}, format='json')
+        self.assertEqual(respuesta.status_code, 400)
+        respuesta = self.cliente('docente').post('/api/ia/entrenar-modelo/', {}, format='json')
+        self.assertEqual(respuesta.status_code, 403)
+
+    def test_pendiente_en_curso_completado(self):
+        trabajo, _ = encolar_entrenamiento()
+        tomado = tomar_siguiente_trabajo()
+        self.assertEqual(tomado.pk, trabajo.pk)
+        self.assertEqual(tomado.estado, 'en_curso')
+        self.assertIsNotNone(tomado.fecha_latido)
+        # Solo un entrenamiento a la vez
+        encolar_entrenamiento()
+        self.assertIsNone(tomar_siguiente_trabajo())
+
+        resultado = {"modelo_id": None, "precision": 0.9}
+        with mock.patch.object(AnalizadorMadurezDigital, 'entrenar_modelo', return_value=resultado):
+            ejecutar_trabajo(tomado)
+
+        trabajo.refresh_from_db()
+        self.assertEqual(trabajo.estado, 'completado')
+        self.assertEqual(trabajo.progreso, 100)
+        self.assertEqual(trabajo.resultado, resultado)
+        self.assertIsNotNone(trabajo.fecha_fin)
+
+    def test_error_en_el_entrenamiento(self):
+        encolar_entrenamiento()
+        trabajo = tomar_siguiente_trabajo()
+        with mock.patch.object(AnalizadorMadurezDigital, 'entrenar_modelo', side_effect=RuntimeError("fallo")):
+            ejecutar_trabajo(trabajo)
+
+        trabajo.refresh_from_db()
+        self.assertEqual(trabajo.estado, 'error')
+        self.assertIn("fallo", trabajo.error)
+
+    def test_trabajo_huerfano_por_latido(self):
+        encolar_entrenamiento()
+        trabajo = tomar_siguiente_trabajo()
+        hace_dos_horas = timezone.now() - timedelta(hours=2)
+
+        # Un entrenamiento largo que sigue latiendo no se toca
+        TrabajoEntrenamiento.objects.filter(pk=trabajo.pk).update(fecha_inicio=hace_dos_horas)
+        self.assertEqual(recuperar_trabajos_huerfanos(), 0)
+
+        TrabajoEntrenamiento.objects.filter(pk=trabajo.pk).update(fecha_latido=hace_dos_horas)
+        self.assertEqual(recuperar_trabajos_huerfanos(), 1)
+
+        # El worker que termina tarde no pisa el estado de abandonado
+        with mock.patch.object(AnalizadorMadurezDigital, 'entrenar_modelo', return_value={"modelo_id": None}):
+            ejecutar_trabajo(trabajo)
+        trabajo.refresh_from_db()
+        self.assertEqual(trabajo.estado, 'error')
+        self.assertIsNone(trabajo.resultado)
+
+
+@override_settings(ML_MODELO_REVALIDACION_SEGUNDOS=0)
+class RegistroModelosTests(TestCase):
+    """El registro carga cada artefacto una vez y lo recarga solo cuando cambia."""
+
+    def setUp(self):
+        self.directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directorio)
+        ajustes = override_settings(BASE_DIR=self.directorio)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        self.registro = RegistroModelos()
+
+    def _artefacto(self, n_estimators, nombre='modelo.joblib'):
+        X = np.random.RandomState(n_estimators).normal(size=(60, 3))
+        y = np.where(X[:, 0] > 0, 'Avanzado', 'Inicial')
+        modelo_data = {
+            'modelo': RandomForestClassifier(n_estimators=n_estimators, random_state=0).fit(X, y),
+            'scaler': StandardScaler().fit(X),
+            'indicadores_orden': ['a', 'b', 'c'],
+            'niveles_madurez': ['Inicial', 'Avanzado'],
+        }
+        ruta = os.path.join(self.directorio, nombre)
+        joblib.dump(modelo_data, ruta)
+        modelo_bd = ModeloIA.objects.create(
+            nombre_modelo="prueba", version="v1", metrica_precision=1.0,
+            ruta_fichero=ruta, checksum=RegistroModelos.checksum(ruta)
+        )
+        return modelo_data, modelo_bd
+
+    def test_sin_modelo(self):
+        self.assertIsNone(self.registro.obtener())
+
+    def test_reutiliza_la_entrada(self):
+        self._artefacto(5)
+        with mock.patch('encuestas.ml.joblib.load', wraps=joblib.load) as carga:
+            primera = self.registro.obtener()
+            segunda = self.registro.obtener()
+        self.assertIs(primera, segunda)
+        self.assertEqual(carga.call_count, 1)
+        self.assertEqual(len(primera['modelo'].estimators_), 5)
+
+    def test_recarga_si_cambia_el_fichero(self):
+        _, modelo_bd = self._artefacto(5)
+        primera = self.registro.obtener()
+
+        # Mismo contenido con otro mtime: se vuelve a leer
+        info = os.stat(modelo_bd.ruta_fichero)
+        os.utime(modelo_bd.ruta_fichero, ns=(info.st_atime_ns, info.st_mtime_ns + 10 ** 9))
+        segunda = self.registro.obtener()
+        self.assertIsNot(segunda, primera)
+        self.assertNotEqual(segunda['clave'], primera['clave'])
+
+        # Un modelo nuevo (otra fila ModeloIA, otro tamaño) sustituye al anterior
+        self._artefacto(12, 'modelo_nuevo.joblib')
+        tercera = self.registro.obtener()
+        self.assertEqual(len(tercera['modelo'].estimators_), 12)
+
+    def test_publicar_sustituye_sin_leer_de_disco(self):
+        self._artefacto(5)
+        self.registro.obtener()
+        modelo_data, modelo_bd = self._artefacto(8, 'publicado.joblib')
+
+        with mock.patch('encuestas.ml.joblib.load') as carga:
+            self.registro.publicar(modelo_data, modelo_bd)
+            entrada = self.registro.obtener()
+        carga.assert_not_called()
+        self.assertIs(entrada['modelo'], modelo_data['modelo'])
+        self.assertEqual(entrada['clave'][0], modelo_bd.id)
+
+    def test_modelo_nuevo_vacia_la_cache_de_predicciones(self):
+        cache = CachePredicciones()
+        with mock.patch('encuestas.ml.cache_predicciones', cache):
+            _, modelo_bd = self._artefacto(5)
+            entrada = self.registro.obtener()
+            cache.guardar(entrada['clave'], 'huella', {"nivel_predicho": "Inicial"})
+            # La primera carga no invalida nada
+            self.assertEqual(cache.invalidaciones, 0)
+
+            # Recarga desde disco con otra clave
+            self._artefacto(8, 'modelo_nuevo.joblib')
+            self.registro.obtener()
+            self.assertEqual(cache.invalidaciones, 1)
+            self.assertIsNone(cache.obtener(entrada['clave'], 'huella'))
+
+            # Publicación de un modelo entrenado en este proceso
+            cache.guardar(entrada['clave'], 'huella', {"nivel_predicho": "Inicial"})
+            modelo_data, modelo_bd = self._artefacto(10, 'publicado.joblib')
+            self.registro.publicar(modelo_data, modelo_bd)
+            self.assertEqual(cache.invalidaciones, 2)
+            self.assertEqual(cache.estadisticas()['entradas'], 0)
+
+
+class CachePrediccionesTests(SimpleTestCase):
+    """Aciertos, fallos, caducidad y tamaño máximo de la caché de predicciones."""
+
+    def setUp(self):
+        self.cache = CachePredicciones()
+        self.prediccion = {"nivel_predicho": "Intermedio", "probabilidad": 0.8}
+
+    def test_aciertos_y_fallos(self):
+        huella = CachePredicciones.huella(np.array([[1.0, 2.0, 3.0]]))
+        self.assertIsNone(self.cache.obtener('modelo-1', huella))
+        self.cache.guardar('modelo-1', huella, self.prediccion)
+        self.assertEqual(self.cache.obtener('modelo-1', huella), self.prediccion)
+        # Mismo vector con otro modelo: no se acierta
+        self.assertIsNone(self.cache.obtener('modelo-2', huella))
+        # Otro vector con el mismo modelo
+        self.assertIsNone(self.cache.obtener('modelo-1', CachePredicciones.huella(np.array([[1.0, 2.0, 4.0]]))))
+
+        estadisticas = self.cache.estadisticas()
+        self.assertEqual(estadisticas['aciertos'], 1)
+        self.assertEqual(estadisticas['fallos'], 3)
+        self.assertEqual(estadisticas['tasa_aciertos'], 0.25)
+
+    def test_devuelve_copias(self):
+        self.cache.guardar('modelo-1', 'huella', self.prediccion)
+        self.cache.obtener('modelo-1', 'huella')['nivel_predicho'] = 'Avanzado'
+        self.assertEqual(self.cache.obtener('modelo-1', 'huella')['nivel_predicho'], 'Intermedio')
+
+    @override_settings(ML_CACHE_PREDICCIONES_TTL=-1)
+    def test_entradas_caducadas(self):
+        self.cache.guardar('modelo-1', 'huella', self.prediccion)
+        self.assertIsNone(self.cache.obtener('modelo-1', 'huella'))
+        self.assertEqual(self.cache.estadisticas()['expirados'], 1)
+        self.assertEqual(self.cache.estadisticas()['entradas'], 0)
+
+    @override_settings(ML_CACHE_PREDICCIONES_TAMAÑO=2)
+    def test_descarta_la_menos_usada(self):
+        for huella in ('a', 'b'):
+            self.cache.guardar('modelo-1', huella, self.prediccion)
+        self.cache.obtener('modelo-1', 'a')
+        self.cache.guardar('modelo-1', 'c', self.prediccion)
+        self.assertIsNotNone(self.cache.obtener('modelo-1', 'a'))
+        self.assertIsNone(self.cache.obtener('modelo-1', 'b'))
+        self.assertIsNotNone(self.cache.obtener('modelo-1', 'c'))
+
+
+class ExportacionesTests(DatosEncuestasMixin, TestCase):
+    """Las exportaciones respetan el alcance del usuario."""
+
+    def setUp(self):
+        self.crear_datos()
+        # Respuesta abierta de una encuesta sin institución
+        encuesta = Encuesta.objects.create(titulo="Encuesta sin institución")
+        pregunta = Pregunta.objects.create(encuesta=encuesta, texto="Comentarios", tipo="abierta", orden=1)
+        Respuesta.objects.create(
+            encuesta=encuesta, pregunta=pregunta, usuario=User.objects.create_user("encuestado"),
+            valor_abierto="texto confidencial"
+        )
+
+    def _filas(self, cliente, conjunto):
+        respuesta = cliente.get(f'/api/exportar/{conjunto}/')
+        self.assertEqual(respuesta.status_code, 200)
+        contenido = b''.join(respuesta.streaming_content).decode('utf-8')
+        return contenido.splitlines()[1:]
+
+    def test_directivo_sin_institucion_no_exporta_nada(self):
+        cliente = self.cliente('directivo')
+        for conjunto in ('respuestas', 'resultados', 'indicadores'):
+            self.assertEqual(self._filas(cliente, conjunto), [], conjunto)
+
+    def test_directivo_solo_exporta_su_institucion(self):
+        institucion = self.instituciones[0]
+        filas = self._filas(self.cliente('directivo', institucion), 'resultados')
+        self.assertEqual(len(filas), ResultadoEncuesta.objects.filter(institucion=institucion).count())
+        self.assertEqual(self._filas(self.cliente('directivo', institucion), 'respuestas'), [])
+
+    def test_admin_tic_exporta_todo(self):
+        filas = self._filas(self.cliente('admin_tic'), 'respuestas')
+        self.assertEqual(len(filas), 1)
+        self.assertIn("texto confidencial", filas[0])
+
+
+class EscrituraDiferidaTests(DatosEncuestasMixin, TestCase):
+    """El buffer de predicciones descarta lo que ya no se puede guardar sin bloquearse."""
+
+    def setUp(self):
+        self.crear_datos(resultados=3)
+        self.modelo = ModeloIA.objects.create(
+            nombre_modelo="prueba", version="v1", metrica_precision=1.0, ruta_fichero="modelo.joblib"
+        )
+        self.directorio = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.directorio)
+        ajustes = override_settings(ML_PREDICCIONES_PENDIENTES_DIR=str(self.directorio))
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        self.buffer = BufferPredicciones()
+        # Sin hilo de fondo: el test vacía el buffer explícitamente
+        parche = mock.patch.object(BufferPredicciones, '_asegurar_hilo')
+        parche.start()
+        self.addCleanup(parche.stop)
+
+    def _prediccion(self, modelo_id, resultado):
+        return {
+            'modelo_id': modelo_id, 'resultado_id': resultado.pk, 'nivel_pred': 'Inicial',
+            'probabilidad': 0.8, 'fecha_prediccion': timezone.now().isoformat(),
+        }
+
+    def test_descarta_modelos_y_resultados_borrados(self):
+        borrado = ModeloIA.objects.create(
+            nombre_modelo="prueba", version="v2", metrica_precision=1.0, ruta_fichero="modelo2.joblib"
+        )
+        borrado_id = borrado.pk
+        borrado.delete()
+
+        self.buffer.agregar(self.modelo.pk, self.resultados[0].pk, 'Inicial', 0.8)
+        self.buffer.agregar(borrado_id, self.resultados[1].pk, 'Inicial', 0.8)
+        self.buffer.agregar(self.modelo.pk, 10 ** 6, 'Inicial', 0.8)
+
+        self.assertEqual(self.buffer.vaciar(), 1)
+        self.assertEqual(self.buffer.descartadas, 2)
+        self.assertEqual(PrediccionIA.objects.get().resultado_id, self.resultados[0].pk)
+        self.assertEqual(list(self.directorio.iterdir()), [])
+
+    def test_fichero_erroneo_no_bloquea_la_recuperacion(self):
+        (self.directorio / 'predicciones_a.jsonl').write_text('{no es json\n', encoding='utf-8')
+        (self.directorio / 'predicciones_b.jsonl').write_text(
+            json.dumps(self._prediccion(self.modelo.pk, self.resultados[0])) + '\n', encoding='utf-8'
+        )
+
+        self.assertEqual(self.buffer.vaciar(), 1)
+        self.assertEqual(PrediccionIA.objects.count(), 1)
+        self.assertEqual(
+            sorted(ruta.name for ruta in self.directorio.iterdir()), ['predicciones_a.erroneo']
+        )
+
+
+@override_settings(ML_PRECARGA_MODELO=True)
+class PrecargaTests(TestCase):
+    """La sonda /api/ia/listo/ pasa de 503 a 200 al terminar la precarga, también tras un fork."""
+
+    def setUp(self):
+        self.directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directorio)
+        # Sin revalidar, el registro seguiría con el modelo de otro test
+        ajustes = override_settings(BASE_DIR=self.directorio, ML_MODELO_REVALIDACION_SEGUNDOS=0)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+        self.estado = EstadoPrecarga()
+        for objetivo, valor in (('encuestas.precarga.estado_precarga', self.estado),
+                                ('encuestas.precarga.connections', mock.MagicMock())):
+            parche = mock.patch(objetivo, valor)
+            parche.start()
+            self.addCleanup(parche.stop)
+        # Los hilos se capturan para ejecutarlos cuando convenga
+        parche = mock.patch('encuestas.precarga.threading.Thread')
+        self.hilo = parche.start()
+        self.addCleanup(parche.stop)
+
+    def _precargar(self):
+        self.hilo.call_args.kwargs['target']()
+
+    def _sonda(self):
+        return APIClient().get('/api/ia/listo/')
+
+    def test_listo_al_terminar(self):
+        self.estado.iniciar()
+        respuesta = self._sonda()
+        self.assertEqual(respuesta.status_code, 503)
+        self.assertEqual(respuesta.json()['estado'], EstadoPrecarga.CARGANDO)
+
+        self._precargar()
+        respuesta = self._sonda()
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.json()['estado'], EstadoPrecarga.SIN_MODELO)
+
+    def test_fork_durante_la_precarga_la_relanza(self):
+        self.estado.iniciar()
+        self.assertEqual(self.hilo.call_count, 1)
+
+        # Hijo creado antes de que terminase el hilo del padre
+        with mock.patch('encuestas.precarga.os.getpid', return_value=os.getpid() + 1):
+            self.estado.tras_fork()
+        self.assertEqual(self.hilo.call_count, 2)
+        self.assertEqual(self._sonda().status_code, 503)
+        self._precargar()
+        self.assertEqual(self._sonda().status_code, 200)
+
+    def test_fork_con_la_precarga_terminada(self):
+        self.estado.iniciar()
+        self._precargar()
+        with mock.patch('encuestas.precarga.os.getpid', return_value=os.getpid() + 1):
+            self.estado.tras_fork()
+        self.assertEqual(self.hilo.call_count, 1)
+        self.assertEqual(self._sonda().status_code, 200)
+
+
+class ReporteResumenTests(DatosEncuestasMixin, TestCase):
+    """El resumen sale de consultas agrupadas: su número no depende del volumen."""
+
+    def setUp(self):
+        self.crear_datos()
+        self.vacia = Institucion.objects.create(nombre="Institución sin datos", ciudad="Quito", pais="Ecuador")
+
+    def test_numero_de_consultas_fijo(self):
+        with self.assertNumQueries(4):
+            reporte = reporte_resumen(ALCANCE_GLOBAL)
+        self.crear_datos(resultados=60, semilla=3)
+        with self.assertNumQueries(4):
+            reporte_resumen(ALCANCE_GLOBAL)
+        with self.assertNumQueries(4):
+            reporte_resumen(self.instituciones[0].id)
+        self.assertTrue(reporte['metadatos']['rendimiento']['cumplido'])
+
+    def test_totales_por_institucion_y_nivel(self):
+        reporte = reporte_resumen(ALCANCE_GLOBAL)
+        resumen = reporte['resumen_ejecutivo']
+        self.assertEqual(resumen['total_resultados'], len(self.resultados))
+        self.assertEqual(resumen['instituciones_evaluadas'], 2)
+        self.assertEqual(resumen['total_instituciones'], 3)
+
+        por_nivel = {fila['nivel']: fila['cantidad'] for fila in reporte['distribucion_madurez']['por_nivel']}
+        for nivel, cantidad in por_nivel.items():
+            self.assertEqual(cantidad, ResultadoEncuesta.objects.filter(nivel_madurez=nivel).count())
+        self.assertEqual(sum(por_nivel.values()), len(self.resultados))
+
+        filas = {fila['id']: fila for fila in reporte['por_institucion']}
+        self.assertEqual(filas[self.instituciones[0].id]['total_encuestas'], 1)
+        self.assertEqual(filas[self.instituciones[1].id]['total_encuestas'], 0)
+        self.assertEqual(filas[self.vacia.id]['total_resultados'], 0)
+        self.assertIsNone(filas[self.vacia.id]['promedio'])
+        for institucion in self.instituciones:
+            puntuaciones = ResultadoEncuesta.objects.filter(institucion=institucion).values_list(
+                'puntuacion_global', flat=True
+            )
+            self.assertEqual(filas[institucion.id]['total_resultados'], len(puntuaciones))
+            self.assertEqual(filas[institucion.id]['promedio'], round(sum(puntuaciones) / len(puntuaciones), 2))
+
+
+class ReporteComparativoTests(DatosEncuestasMixin, TestCase):
+    """La paginación del comparativo es estable y sus celdas salen agrupadas de la BD."""
+
+    def setUp(self):
+        cache.clear()
+        # Tres tandas: seis instituciones con 15 evaluaciones cada una y nombres repetidos
+        for semilla in (7, 11, 13):
+            self.crear_datos(semilla=semilla)
+        self.ids = list(
+            ResultadoEncuesta.objects.order_by('institucion_id').values_list('institucion_id', flat=True).distinct()
+        )
+
+    def test_paginas_sin_solapes_con_empates(self):
+        # total_evaluaciones y nombre empatan: decide el id de la institución
+        for orden in ('total_evaluaciones', '-total_evaluaciones', 'nombre', '-promedio_general'):
+            vistos = []
+            for pagina in (1, 2, 3):
+                reporte = reporte_comparativo(ALCANCE_GLOBAL, orden=orden, pagina=pagina, por_pagina=4)
+                vistos += [fila['institucion_id'] for fila in reporte['comparativa']]
+                self.assertEqual(reporte['total_instituciones'], 6)
+                self.assertEqual(reporte['paginacion']['total_paginas'], 2)
+            self.assertEqual(sorted(vistos), self.ids)
+            repetido = [
+                fila['institucion_id']
+                for pagina in (1, 2)
+                for fila in reporte_comparativo(ALCANCE_GLOBAL, orden=orden, pagina=pagina, por_pagina=4)['comparativa']
+            ]
+            self.assertEqual(vistos, repetido)
+        self.assertEqual(vistos[:4], [fila['institucion_id'] for fila in reporte_comparativo(
+            ALCANCE_GLOBAL, orden='-promedio_general', top=4)['comparativa']])
+
+    def test_celdas_y_totales(self):
+        reporte = reporte_comparativo(ALCANCE_GLOBAL, pagina=2, por_pagina=4)
+        indicadores = list(Indicador.objects.order_by('id'))
+        self.assertEqual(reporte['indicadores'], [indicador.nombre for indicador in indicadores])
+        for fila in reporte['comparativa']:
+            puntuaciones = ResultadoEncuesta.objects.filter(institucion_id=fila['institucion_id']).values_list(
+                'puntuacion_global', flat=True
+            )
+            self.assertEqual(fila['total_evaluaciones'], len(puntuaciones))
+            self.assertEqual(fila['promedio_general'], round(sum(puntuaciones) / len(puntuaciones), 2))
+            for indicador, valor in zip(indicadores, fila['valores']):
+                valores = ResultadoIndicador.objects.filter(
+                    resultado__institucion_id=fila['institucion_id'], indicador=indicador
+                ).values_list('valor', flat=True)
+                self.assertEqual(valor, round(sum(valores) / len(valores), 2) if valores else None)
+
+        promedios = [
+            ResultadoEncuesta.objects.filter(institucion_id=id_).aggregate(media=Avg('puntuacion_global'))['media']
+            for id_ in self.ids
+        ]
+        self.assertEqual(reporte['promedio_sistema'], round(sum(promedios) / len(promedios), 2))
+        mejor = self.ids[promedios.index(max(promedios))]
+        self.assertEqual(reporte['mejor_institucion']['institucion_id'], mejor)
+
+    def test_numero_de_consultas_fijo(self):
+        with self.assertNumQueries(5):
+            reporte_comparativo(ALCANCE_GLOBAL, por_pagina=4)
+        self.crear_datos(resultados=60, semilla=3)
+        with self.assertNumQueries(5):
+            reporte_comparativo(ALCANCE_GLOBAL, por_pagina=4)
+
+    def test_parametros_de_la_api(self):
+        cliente = self.cliente('admin_tic')
+        respuesta = cliente.get('/api/reporte-comparativo/', {'orden': 'nombre', 'pagina': 2, 'por_pagina': 4})
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(len(respuesta.data['comparativa']), 2)
+        self.assertEqual(respuesta.data['paginacion']['pagina'], 2)
+        for parametros in ({'orden': 'clave'}, {'pagina': 0}, {'por_pagina': 'x'}, {'top': 10_000}):
+            self.assertEqual(cliente.get('/api/reporte-comparativo/', parametros).status_code, 400)
+
+        propia = self.cliente('directivo', Institucion.objects.get(id=self.ids[0]))
+        respuesta = propia.get('/api/reporte-comparativo/')
+        self.assertEqual([fila['institucion_id'] for fila in respuesta.data['comparativa']], self.ids[:1])
+
+
+class PrediccionLoteTests(DatosEncuestasMixin, TestCase):
+    """La predicción en lote solo admite resultados del alcance del usuario."""
+
+    def setUp(self):
+        self.crear_datos()
+        self.aislar_modelos()
+        AnalizadorMadurezDigital().entrenar_modelo()
+        self.propios = [r.id for r in self.resultados if r.institucion_id == self.instituciones[0].id]
+        self.ajenos = [r.id for r in self.resultados if r.institucion_id == self.instituciones[1].id]
+
+    def _predecir(self, cliente, resultado_ids, **datos):
+        return cliente.post('/api/ia/predecir-lote/', {'resultado_ids': resultado_ids, **datos}, format='json')
+
+    def test_resultados_de_otra_institucion(self):
+        respuesta = self._predecir(
+            self.cliente('directivo', self.instituciones[0]), self.propios[:2] + self.ajenos[:2]
+        )
+        self.assertEqual(respuesta.status_code, 403)
+        self.assertEqual(sorted(respuesta.data['resultado_ids']), sorted(self.ajenos[:2]))
+        self.assertFalse(PrediccionIA.objects.exists())
+
+    def test_usuario_sin_institucion(self):
+        respuesta = self._predecir(self.cliente('docente'), self.propios[:1])
+        self.assertEqual(respuesta.status_code, 403)
+
+    def test_resultados_propios(self):
+        respuesta = self._predecir(self.cliente('directivo', self.instituciones[0]), self.propios)
+        self.assertEqual(respuesta.status_code, 200)
+        predichos = [p['resultado_id'] for p in respuesta.data['predicciones']]
+        self.assertEqual(predichos, self.propios)
+        self.assertEqual(
+            sorted(PrediccionIA.objects.values_list('resultado_id', flat=True)), sorted(self.propios)
+        )
+
+    def test_admin_tic_sin_restriccion(self):
+        respuesta = self._predecir(
+            self.cliente('admin_tic'), self.propios[:2] + self.ajenos[:2], guardar=False
+        )
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(len(respuesta.data['predicciones']), 4)
+        self.assertFalse(PrediccionIA.objects.exists())
+
+
+class ExtraccionEntrenamientoTests(DatosEncuestasMixin, TestCase):
+    """La extracción por bloques desde CaracteristicasResultado coincide con pivotar los valores."""
+
+    def setUp(self):
+        self.crear_datos()
+        self.modificar_datos()
+
+    def test_coincide_con_pivotar_los_valores(self):
+        X, y = AnalizadorMadurezDigital().extraer_datos_entrenamiento()
+        esperada = self.matriz_completa()
+
+        self.assertEqual(list(X.columns), [i.nombre for i in self.indicadores] + [
+            'puntuacion_global', 'num_indicadores'
+        ])
+        np.testing.assert_allclose(X[['puntuacion_global'] + [i.nombre for i in self.indicadores]], esperada)
+        self.assertTrue((X['num_indicadores'] == len(self.indicadores)).all())
+        niveles = dict(ResultadoEncuesta.objects.values_list('id', 'nivel_madurez'))
+        self.assertEqual(y, [niveles[resultado_id] for resultado_id in X.index])
+
+    def test_bloques_pequeños(self):
+        X, y = AnalizadorMadurezDigital().extraer_datos_entrenamiento()
+        X_bloques, y_bloques = AnalizadorMadurezDigital().extraer_datos_entrenamiento(tamaño_bloque=4)
+        pd.testing.assert_frame_equal(X_bloques, X)
+        self.assertEqual(y_bloques, y)
+
+    def test_solo_resultados_posteriores(self):
+        corte = timezone.now()
+        nuevo = ResultadoEncuesta.objects.create(
+            encuesta=self.resultados[0].encuesta, institucion=self.instituciones[1],
+            nivel_madurez="Avanzado", puntuacion_global=4.0,
+        )
+        for indicador in self.indicadores:
+            ResultadoIndicador.objects.create(
+                resultado=nuevo, indicador=indicador, valor=4.0, nivel_indicador="alto"
+            )
+
+        X, y = AnalizadorMadurezDigital().extraer_datos_entrenamiento(desde=corte)
+        self.assertEqual(list(X.index), [nuevo.id])
+        self.assertEqual(y, ["Avanzado"])
+
+    def test_sin_datos(self):
+        CaracteristicasResultado.objects.all().delete()
+        self.assertEqual(AnalizadorMadurezDigital().extraer_datos_entrenamiento(), (None, None))
+
+
+class EntrenamientoIncrementalTests(DatosEncuestasMixin, TestCase):
+    """El incremental añade árboles al modelo activo con pesos de clase de todo el histórico."""
+
+    def setUp(self):
+        self.crear_datos()
+        self.aislar_modelos()
+
+    def _resultados_nuevos(self, niveles):
+        for i, nivel in enumerate(niveles):
+            valor = 1.5 + (i % 4)
+            resultado = ResultadoEncuesta.objects.create(
+                encuesta=self.resultados[0].encuesta, institucion=self.instituciones[i % 2],
+                nivel_madurez=nivel, puntuacion_global=valor,
+            )
+            for indicador in self.indicadores:
+                ResultadoIndicador.objects.create(
+                    resultado=resultado, indicador=indicador, valor=valor, nivel_indicador="medio"
+                )
+
+    def test_sin_modelo_previo(self):
+        self.assertIn("error", AnalizadorMadurezDigital().entrenar_incremental())
+
+    def test_pesos_de_todo_el_historico(self):
+        AnalizadorMadurezDigital().entrenar_modelo()
+        self._resultados_nuevos(["Inicial"] * 8 + ["En desarrollo"] * 3 + ["Avanzado"] * 3)
+
+        resultado = AnalizadorMadurezDigital().entrenar_incremental(arboles_nuevos=7)
+        self.assertEqual(resultado["num_muestras_nuevas"], 14)
+        self.assertEqual(resultado["arboles_totales"], resultado["arboles_previos"] + 7)
+
+        # Como class_weight='balanced', pero contando todos los resultados completos
+        niveles = CaracteristicasResultado.objects.filter(
+            num_indicadores=len(self.indicadores)
+        ).values_list('nivel_madurez', flat=True)
+        conteos = pd.Series(list(niveles)).value_counts()
+        for nivel, peso in resultado["pesos_clases"].items():
+            self.assertAlmostEqual(peso, len(niveles) / (len(conteos) * conteos[nivel]))
+
+        # El modelo nuevo es el activo y conserva los árboles anteriores
+        modelo_bd = ModeloIA.objects.get(pk=resultado["modelo_id"])
+        self.assertEqual(modelo_bd.nombre_modelo, "RandomForest_MadurezDigital_Incremental")
+        self.assertEqual(len(registro_modelos.obtener()['modelo'].estimators_), resultado["arboles_totales"])
+
+    def test_resultados_nuevos_sin_todas_las_clases(self):
+        AnalizadorMadurezDigital().entrenar_modelo()
+        self._resultados_nuevos(["Inicial"] * 5)
+        resultado = AnalizadorMadurezDigital().entrenar_incremental()
+        self.assertIn("no cubren todos los niveles", resultado["error"])
+
+
+class ArtefactosVersionadosTests(DatosEncuestasMixin, TestCase):
+    """Cada ModeloIA tiene su propio fichero inmutable, verificado con su checksum."""
+
+    def setUp(self):
+        self.crear_datos()
+        self.directorio = self.aislar_modelos()
+
+    def _entrenar(self):
+        resultado = AnalizadorMadurezDigital().entrenar_modelo(forzar=True)
+        return ModeloIA.objects.get(pk=resultado["modelo_id"])
+
+    def test_un_fichero_por_modelo(self):
+        primero, segundo = self._entrenar(), self._entrenar()
+        self.assertNotEqual(primero.ruta_fichero, segundo.ruta_fichero)
+        for modelo_bd in (primero, segundo):
+            self.assertEqual(RegistroModelos.checksum(modelo_bd.ruta_fichero), modelo_bd.checksum)
+        # Sin temporales a medio escribir
+        self.assertEqual(
+            sorted(os.listdir(os.path.join(self.directorio, 'ml_models'))),
+            sorted(os.path.basename(m.ruta_fichero) for m in (primero, segundo))
+        )
+
+    def test_carga_con_mmap(self):
+        self._entrenar()
+        entrada = RegistroModelos().obtener()
+        self.assertIsInstance(entrada['bosque'].umbral, np.memmap)
+
+    def test_checksum_incorrecto_mantiene_el_modelo_anterior(self):
+        primero = self._entrenar()
+        registro = RegistroModelos()
+        self.assertEqual(registro.obtener()['clave'][0], primero.id)
+
+        segundo = self._entrenar()
+        with open(segundo.ruta_fichero, 'ab') as f:
+            f.write(b'alterado')
+        self.assertEqual(registro.obtener()['clave'][0], primero.id)
+        # Un proceso que no tenía modelo tampoco carga el fichero alterado
+        self.assertIsNone(RegistroModelos().obtener())
+
+
+@skipIf(pa is None, "requiere pyarrow")
+class SnapshotsEntrenamientoTests(DatosEncuestasMixin, TestCase):
+    """Los snapshots Parquet reproducen el conjunto de entrenamiento y detectan alteraciones."""
+
+    def setUp(self):
+        self.crear_datos()
+        self.aislar_modelos()
+
+    def test_ida_y_vuelta(self):
+        X, y = AnalizadorMadurezDigital().extraer_datos_entrenamiento()
+        info = crear_snapshot('prueba')
+        self.assertEqual(info['filas'], len(X))
+
+        # Los cambios posteriores en la BD no afectan al snapshot
+        self.modificar_datos()
+        X_snapshot, y_snapshot, info_leida = cargar_snapshot('prueba')
+        pd.testing.assert_frame_equal(X_snapshot, X, check_index_type=False)
+        self.assertEqual(y_snapshot, y)
+        self.assertEqual(info_leida['huella'], info['huella'])
+        self.assertEqual([s['nombre'] for s in listar_snapshots()], ['prueba'])
+
+    def test_entrenar_desde_snapshot(self):
+        info = crear_snapshot('prueba')
+        resultado = AnalizadorMadurezDigital().entrenar_modelo(snapshot='prueba')
+        modelo_bd = ModeloIA.objects.get(pk=resultado['modelo_id'])
+        self.assertEqual(modelo_bd.snapshot, 'prueba')
+        self.assertEqual(modelo_bd.huella_datos, info['huella'])
+
+    def test_huella_incorrecta(self):
+        ruta = crear_snapshot('prueba')['ruta']
+        tabla = pq.read_table(ruta)
+        df = tabla.to_pandas()
+        df.iloc[0, 0] += 1
+        alterada = pa.Table.from_pandas(df, preserve_index=True).replace_schema_metadata(tabla.schema.metadata)
+        pq.write_table(alterada, ruta)
+
+        with self.assertRaisesRegex(ValueError, 'corrupto'):
+            cargar_snapshot('prueba')
+        self.assertIn('error', AnalizadorMadurezDigital().entrenar_modelo(snapshot='prueba'))
+        self.assertFalse(ModeloIA.objects.exists())
+
+    def test_nombres(self):
+        crear_snapshot('prueba')
+        with self.assertRaisesRegex(ValueError, 'Ya existe'):
+            crear_snapshot('prueba')
+        with self.assertRaisesRegex(ValueError, 'no válido'):
+            cargar_snapshot('../prueba')
+
+
+@skipIf(not hasattr(socket, 'AF_UNIX'), "requiere sockets Unix")
+class ServidorInferenciaTests(DatosEncuestasMixin, TestCase):
+    """El servidor agrupa peticiones concurrentes y el cliente vuelve a la inferencia local si falla."""
+
+    def setUp(self):
+        self.crear_datos()
+        directorio = self.aislar_modelos()
+        AnalizadorMadurezDigital().entrenar_modelo()
+        self.ruta = os.path.join(directorio, 'inferencia.sock')
+        self.local = AnalizadorMadurezDigital()
+        self.local.usar_servidor = False
+        self.assertTrue(self.local.cargar_modelo())
+        self.X = self.local._matriz_caracteristicas([
+            {i.nombre: 1 + (k + j) % 5 for j, i in enumerate(self.indicadores)} for k in range(8)
+        ])
+
+    def _con_servidor(self, peticiones):
+        """Ejecutar peticiones() en un hilo mientras el servidor atiende en este."""
+        servidor = ServidorInferencia(self.ruta, ventana_ms=200)
+        # El modelo ya cargado en este hilo: el servidor no consulta la BD
+        servidor.analizador._aplicar_entrada(registro_modelos.obtener())
+        listo = threading.Event()
+
+        async def principal():
+            tarea = asyncio.create_task(servidor.servir(listo))
+            while not listo.is_set():
+                await asyncio.sleep(0.01)
+            try:
+                return await asyncio.get_running_loop().run_in_executor(None, peticiones)
+            finally:
+                tarea.cancel()
+                await tarea
+
+        with mock.patch.object(ServidorInferencia, '_cargar', return_value=True), \
+                override_settings(ML_SERVIDOR_INFERENCIA_SOCKET=self.ruta):
+            return servidor, asyncio.run(principal())
+
+    def test_micro_lotes(self):
+        esperados = self.local._predecir_matriz(self.X)
+
+        def peticiones():
+            resultados = [None] * len(self.X)
+
+            def predecir(i):
+                cliente = ClienteInferencia()
+                resultados[i] = cliente.predecir(self.X[i:i + 1])
+                cliente._cerrar()
+
+            hilos = [threading.Thread(target=predecir, args=(i,)) for i in range(len(self.X))]
+            for hilo in hilos:
+                hilo.start()
+            for hilo in hilos:
+                hilo.join()
+            return resultados
+
+        servidor, resultados = self._con_servidor(peticiones)
+        for i, (clave, niveles, probabilidades) in enumerate(resultados):
+            self.assertEqual(clave, self.local.clave_modelo)
+            self.assertEqual(niveles[0], esperados[0][i])
+            np.testing.assert_allclose(probabilidades[0], esperados[1][i])
+        estadisticas = servidor.estadisticas()
+        self.assertEqual(estadisticas['filas'], len(self.X))
+        self.assertLess(estadisticas['lotes'], len(self.X))
+
+    def test_prediccion_a_traves_del_servidor(self):
+        def peticiones():
+            analizador = AnalizadorMadurezDigital()
+            analizador.cargar_modelo()
+            try:
+                return analizador.remoto, analizador._predecir_matriz(self.X)
+            finally:
+                cliente_inferencia._cerrar()
+
+        _, (remoto, (niveles, probabilidades)) = self._con_servidor(peticiones)
+        self.assertTrue(remoto)
+        np.testing.assert_array_equal(niveles, self.local._predecir_matriz(self.X)[0])
+
+    def test_sin_servidor_predice_en_el_proceso(self):
+        with override_settings(ML_SERVIDOR_INFERENCIA_SOCKET=self.ruta):
+            analizador = AnalizadorMadurezDigital()
+            self.assertTrue(analizador.cargar_modelo())
+            self.assertFalse(analizador.remoto)
+            niveles, _ = analizador._predecir_matriz(self.X)
+        np.testing.assert_array_equal(niveles, self.local._predecir_matriz(self.X)[0])
+
+    def test_servidor_caido_tras_cargar(self):
+        analizador = AnalizadorMadurezDigital()
+        info = {
+            'clave': list(self.local.clave_modelo), 'indicadores_orden': self.local.indicadores_orden,
+            'niveles_madurez': self.local.niveles_madurez, 'clases': [str(c) for c in self.local.clases],
+        }
+        analizador._aplicar_info_remota(info)
+        with override_settings(ML_SERVIDOR_INFERENCIA_SOCKET=self.ruta):
+            niveles, _ = analizador._predecir_matriz(self.X)
+        self.assertFalse(analizador.remoto)
+        self.assertFalse(analizador.usar_servidor)
+        np.testing.assert_array_equal(niveles, self.local._predecir_matriz(self.X)[0])
+
+
+@override_settings(ML_SEGMENTOS_PROCESOS=1)
+class ModelosSegmentoTests(DatosEncuestasMixin, TestCase):
+    """Cada institución se predice con el modelo de su segmento, o con el global si no lo tiene."""
+
+    def setUp(self):
+        self.crear_datos()
+        self.aislar_modelos()
+        Institucion.objects.filter(pk=self.instituciones[1].pk).update(nivel_educativo="Primaria")
+        self.sin_segmento = Institucion.objects.create(
+            nombre="Universidad", nivel_educativo="Superior", ciudad="Quito", pais="Ecuador"
+        )
+        self.global_ = AnalizadorMadurezDigital().entrenar_modelo()['modelo_id']
+        resultado = AnalizadorMadurezDigital().entrenar_segmentos(min_muestras=5)
+        self.modelos = {s['segmento']: s['modelo_id'] for s in resultado['segmentos_entrenados']}
+        self.segmentos = registro_segmentos.segmentos_de([i.id for i in self.instituciones])
+
+    def test_un_modelo_por_segmento(self):
+        self.assertEqual(set(self.modelos), set(self.segmentos.values()))
+        self.assertEqual(len(self.modelos), 2)
+
+    def test_prediccion_con_el_modelo_del_segmento(self):
+        valores = {i.nombre: 3.0 for i in self.indicadores}
+        for institucion in self.instituciones:
+            analizador = AnalizadorMadurezDigital()
+            prediccion = analizador.predecir_madurez(valores, institucion_id=institucion.id)
+            segmento = self.segmentos[institucion.id]
+            self.assertEqual(prediccion['segmento'], segmento)
+            self.assertEqual(analizador.clave_modelo[0], self.modelos[segmento])
+
+        analizador = AnalizadorMadurezDigital()
+        prediccion = analizador.predecir_madurez(valores, institucion_id=self.sin_segmento.id)
+        self.assertIsNone(prediccion['segmento'])
+        self.assertEqual(analizador.clave_modelo[0], self.global_)
+
+    def test_lote_agrupado_por_segmento(self):
+        resultado_ids = [r.id for r in self.resultados]
+        AnalizadorMadurezDigital().predecir_lote(resultado_ids=resultado_ids)
+        institucion = dict(ResultadoEncuesta.objects.values_list('id', 'institucion_id'))
+        for resultado_id, modelo_id in PrediccionIA.objects.values_list('resultado_id', 'modelo_id'):
+            self.assertEqual(modelo_id, self.modelos[self.segmentos[institucion[resultado_id]]])
+        self.assertEqual(PrediccionIA.objects.count(), len(resultado_ids))
+
+    @override_settings(ML_SEGMENTOS_MAX_MODELOS=1)
+    def test_lru_en_memoria(self):
+        registro = RegistroSegmentos()
+        primero, segundo = sorted(self.modelos)
+        registro.obtener(primero)
+        registro.obtener(segundo)
+        registro.obtener(segundo)
+        estadisticas = registro.estadisticas()
+        self.assertEqual(estadisticas['en_memoria'], 1)
+        self.assertEqual(estadisticas['modelos'][0]['segmento'], segundo)
+        self.assertEqual((estadisticas['cargas'], estadisticas['aciertos'], estadisticas['descartes']), (2, 1, 1))
+
+
+class HuellaDatosTests(DatosEncuestasMixin, TestCase):
+    """No se reentrena si la huella de los datos y los parámetros no han cambiado."""
+
+    def setUp(self):
+        self.crear_datos()
+        self.aislar_modelos()
+        self.primero = AnalizadorMadurezDigital().entrenar_modelo()
+
+    def test_omite_si_nada_cambia(self):
+        with mock.patch.object(AnalizadorMadurezDigital, 'extraer_datos_entrenamiento') as extraer:
+            resultado = AnalizadorMadurezDigital().entrenar_modelo()
+        extraer.assert_not_called()
+        self.assertTrue(resultado['omitido'])
+        self.assertEqual(resultado['modelo_id'], self.primero['modelo_id'])
+        self.assertEqual(ModeloIA.objects.count(), 1)
+
+    def test_reentrena_si_cambian_los_datos(self):
+        huella = AnalizadorMadurezDigital().calcular_huella_datos()
+        self.modificar_datos()
+        self.assertNotEqual(AnalizadorMadurezDigital().calcular_huella_datos(), huella)
+
+        resultado = AnalizadorMadurezDigital().entrenar_modelo()
+        self.assertNotIn('omitido', resultado)
+        self.assertEqual(ModeloIA.objects.count(), 2)
+
+    def test_cambio_de_un_solo_valor(self):
+        huella = AnalizadorMadurezDigital().calcular_huella_datos()
+        valor = ResultadoIndicador.objects.order_by('id').first()
+        valor.valor += 0.5
+        valor.save()
+        self.assertNotEqual(AnalizadorMadurezDigital().calcular_huella_datos(), huella)
+
+    def test_reentrena_con_otros_parametros_o_forzado(self):
+        self.assertNotIn('omitido', AnalizadorMadurezDigital().entrenar_modelo(test_size=0.3))
+        self.assertNotIn('omitido', AnalizadorMadurezDigital().entrenar_modelo(test_size=0.3, forzar=True))
+        self.assertEqual(ModeloIA.objects.count(), 3)
+
+    def test_reentrena_si_falta_el_artefacto(self):
+        os.remove(ModeloIA.objects.get().ruta_fichero)
+        self.assertNotIn('omitido', AnalizadorMadurezDigital().entrenar_modelo())
+
+
+class EstadisticasEntrenamientoTests(DatosEncuestasMixin, TestCase):
+    """Las estadísticas de entrenamiento se sirven de la caché hasta que se confirma una escritura."""
+
+    def setUp(self):
+        cache.clear()
+        self.crear_datos()
+
+    def test_coinciden_con_la_extraccion(self):
+        X, y = AnalizadorMadurezDigital().extraer_datos_entrenamiento()
+        datos = estadisticas_entrenamiento()
+        self.assertEqual(datos['muestras_validas'], len(X))
+        self.assertEqual(datos['muestras_por_nivel'], pd.Series(y).value_counts().to_dict())
+        self.assertEqual(datos['total_resultados'], len(self.resultados))
+        self.assertEqual(
+            [fila['resultados'] for fila in datos['cobertura_indicadores']],
+            [ResultadoIndicador.objects.filter(indicador=i).count() for i in self.indicadores]
+        )
+
+    def test_cache_e_invalidacion(self):
+        self.assertFalse(estadisticas_entrenamiento()['en_cache'])
+        with self.assertNumQueries(0):
+            self.assertTrue(estadisticas_entrenamiento()['en_cache'])
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.resultados[0].delete()
+        # Hasta el commit se sigue sirviendo la caché
+        self.assertTrue(estadisticas_entrenamiento()['en_cache'])
+
+        for callback in callbacks:
+            callback()
+        datos = estadisticas_entrenamiento()
+        self.assertFalse(datos['en_cache'])
+        self.assertEqual(datos['total_resultados'], len(self.resultados) - 1)
@@ -0,0 +1,335 @@
+"""
+Cola de trabajos de entrenamiento del modelo de IA.
+
+La vista solo crea una fila TrabajoEntrenamiento y lanza (si hace falta) un
+proceso worker local con ``manage.py procesar_entrenamientos --una-vez``.
+No se necesita ningún broker externo: la propia tabla hace de cola y la
+restricción "un_entrenamiento_en_curso" garantiza que solo se entrena un
+modelo a la vez.
+"""
+
+import logging
+import os
+import subprocess
+import sys
+import threading
+import traceback
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import TrabajoEntrenamiento
+from .snapshots import NOMBRE_VALIDO, directorio_snapshots
+
+logger = logging.getLogger(__name__)
+
+MANAGE_PY = Path(__file__).resolve().parent.parent / 'manage.py'
+
+# Parámetros de entrenamiento que se aceptan desde la API
+MODOS_ENTRENAMIENTO = {
+    'completo': ('test_size', 'random_state', 'ajustar_hiperparametros', 'presupuesto_segundos',
+                 'snapshot', 'forzar'),
+    'incremental': ('test_size', 'random_state', 'arboles_nuevos', 'comparar'),
+    'segmentos': ('test_size', 'random_state', 'min_muestras'),
+}
+
+
+def _booleano(valor):
+    if isinstance(valor, bool):
+        return valor
+    if isinstance(valor, str) and valor.lower() in ('true', 'false', '1', '0'):
+        return valor.lower() in ('true', '1')
+    raise ValueError("debe ser true o false")
+
+
+def _entero(minimo):
+    def validar(valor):
+        if isinstance(valor, bool) or not isinstance(valor, (int, str)):
+            raise ValueError("debe ser un número entero")
+        try:
+            valor = int(valor)
+        except ValueError:
+            raise ValueError("debe ser un número entero") from None
+        if valor < minimo:
+            raise ValueError(f"debe ser mayor o igual que {minimo}")
+        return valor
+    return validar
+
+
+def _numero(valor):
+    if isinstance(valor, bool) or not isinstance(valor, (int, float, str)):
+        raise ValueError("debe ser un número")
+    try:
+        return float(valor)
+    except ValueError:
+        raise ValueError("debe ser un número") from None
+
+
+def _fraccion(valor):
+    valor = _numero(valor)
+    if not 0 < valor < 1:
+        raise ValueError("debe estar entre 0 y 1 (sin incluirlos)")
+    return valor
+
+
+def _presupuesto(valor):
+    valor = _numero(valor)
+    maximo = getattr(settings, 'ML_BUSQUEDA_PRESUPUESTO_MAX_SEGUNDOS', 900)
+    if not 0 < valor <= maximo:
+        raise ValueError(f"debe estar entre 0 y {maximo} segundos")
+    return valor
+
+
+def _snapshot(valor):
+    if not isinstance(valor, str) or not NOMBRE_VALIDO.match(valor):
+        raise ValueError(f"nombre de snapshot no válido: {valor!r}")
+    if not (directorio_snapshots() / f"{valor}.parquet").exists():
+        raise ValueError(f"no existe el snapshot {valor}")
+    return valor
+
+
+# Validación (y conversión) de cada parámetro aceptado
+VALIDADORES = {
+    'test_size': _fraccion,
+    'random_state': _entero(0),
+    'ajustar_hiperparametros': _booleano,
+    'presupuesto_segundos': _presupuesto,
+    'snapshot': _snapshot,
+    'forzar': _booleano,
+    'arboles_nuevos': _entero(1),
+    'comparar': _booleano,
+    'min_muestras': _entero(1),
+}
+
+
+def validar_parametros(parametros):
+    """
+    Comprobar tipos y rangos de los parámetros de un entrenamiento antes de
+    encolarlo, para que un error no llegue hasta el worker.
+    Se ignoran los parámetros que no aplican al modo y los nulos (valor por
+    defecto).
+
+    Returns:
+        parámetros convertidos, incluido 'modo'
+
+    Raises:
+        ValueError con el primer parámetro no válido
+    """
+    modo = parametros.get('modo') or 'completo'
+    if modo not in MODOS_ENTRENAMIENTO:
+        raise ValueError(f"Modo de entrenamiento no válido: {modo}")
+
+    validos = {'modo': modo}
+    for clave in MODOS_ENTRENAMIENTO[modo]:
+        if parametros.get(clave) is None:
+            continue
+        try:
+            validos[clave] = VALIDADORES[clave](parametros[clave])
+        except ValueError as e:
+            raise ValueError(f"Parámetro '{clave}' no válido: {e}") from None
+    return validos
+
+
+def encolar_entrenamiento(usuario=None, parametros=None):
+    """
+    Encolar un entrenamiento. Si ya hay uno pendiente o en curso se
+    devuelve ese mismo trabajo en lugar de crear otro. Si está pendiente se
+    vuelve a lanzar un worker: el anterior pudo no arrancar o morir antes
+    de reservarlo.
+
+    Returns:
+        (trabajo, creado)
+
+    Raises:
+        ValueError si algún parámetro no es válido
+    """
+    parametros = validar_parametros(parametros or {})
+
+    with transaction.atomic():
+        activo = TrabajoEntrenamiento.objects.select_for_update().filter(
+            estado__in=['pendiente', 'en_curso']
+        ).order_by('id').first()
+        if activo:
+            if activo.estado == 'pendiente':
+                transaction.on_commit(lanzar_worker)
+            return activo, False
+
+        trabajo = TrabajoEntrenamiento.objects.create(
+            parametros=parametros,
+            solicitado_por=usuario if usuario and usuario.is_authenticated else None,
+        )
+        # El worker solo debe arrancar cuando la fila ya es visible
+        transaction.on_commit(lanzar_worker)
+
+    return trabajo, True
+
+
+def lanzar_worker():
+    """Lanzar un proceso worker desacoplado que procese la cola y termine."""
+    if not getattr(settings, 'ML_ENTRENAMIENTO_LANZAR_WORKER', True):
+        return
+
+    opciones = {
+        'stdin': subprocess.DEVNULL,
+        'stdout': subprocess.DEVNULL,
+        'stderr': subprocess.DEVNULL,
+        'close_fds': True,
+        'env': dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get(
+            'DJANGO_SETTINGS_MODULE', 'backend.settings'
+        )),
+    }
+    if os.name == 'nt':
+        opciones['creationflags'] = (
+            subprocess.DETACHED_PROCESS | subprocess.CREATE_NEW_PROCESS_GROUP
+        )
+    else:
+        opciones['start_new_session'] = True
+
+    try:
+        subprocess.Popen(
+            [sys.executable, str(MANAGE_PY), 'procesar_entrenamientos', '--una-vez'],
+            **opciones
+        )
+    except OSError as e:
+        logger.error(f"No se pudo lanzar el worker de entrenamiento: {e}")
+
+
+def recuperar_trabajos_huerfanos():
+    """
+    Marcar como error los trabajos "en_curso" cuyo worker murió (sin latido
+    en ML_ENTRENAMIENTO_TIMEOUT_SEGUNDOS), para que no bloqueen la cola
+    indefinidamente. Un entrenamiento largo pero vivo sigue latiendo y no se
+    toca.
+    """
+    limite = timezone.now() - timedelta(
+        seconds=getattr(settings, 'ML_ENTRENAMIENTO_TIMEOUT_SEGUNDOS', 300)
+    )
+    return TrabajoEntrenamiento.objects.filter(
+        Q(fecha_latido__lt=limite) | Q(fecha_latido__isnull=True, fecha_inicio__lt=limite),
+        estado='en_curso',
+    ).update(
+        estado='error',
+        error='Trabajo abandonado: el worker dejó de dar señales de vida',
+        fecha_fin=timezone.now(),
+    )
+
+
+def tomar_siguiente_trabajo():
+    """
+    Reservar el siguiente trabajo pendiente. Devuelve None si la cola está
+    vacía o si ya hay otro entrenamiento en curso.
+    """
+    try:
+        with transaction.atomic():
+            if TrabajoEntrenamiento.objects.filter(estado='en_curso').exists():
+                return None
+
+            trabajo = TrabajoEntrenamiento.objects.select_for_update(
+                skip_locked=True
+            ).filter(estado='pendiente').order_by('id').first()
+            if trabajo is None:
+                return None
+
+            trabajo.estado = 'en_curso'
+            trabajo.fecha_inicio = trabajo.fecha_latido = timezone.now()
+            trabajo.etapa = 'Iniciando'
+            trabajo.save(update_fields=['estado', 'fecha_inicio', 'fecha_latido', 'etapa'])
+            return trabajo
+    except IntegrityError:
+        # Otro worker marcó un trabajo "en_curso" al mismo tiempo
+        return None
+
+
+def latir(trabajo_id, **campos):
+    """Registrar que el worker sigue vivo (y, opcionalmente, su progreso)."""
+    TrabajoEntrenamiento.objects.filter(pk=trabajo_id, estado='en_curso').update(
+        fecha_latido=timezone.now(), **campos
+    )
+
+
+def _latido_periodico(trabajo_id, parar):
+    # Las etapas largas (p. ej. el fit de un bosque grande) no llaman al
+    # callback de progreso: el latido no puede depender solo de él
+    intervalo = getattr(settings, 'ML_ENTRENAMIENTO_LATIDO_SEGUNDOS', 30)
+    try:
+        while not parar.wait(intervalo):
+            latir(trabajo_id)
+    finally:
+        connection.close()
+
+
+def ejecutar_trabajo(trabajo):
+    """Ejecutar el entrenamiento de un trabajo ya reservado."""
+    from .ml import AnalizadorMadurezDigital
+
+    def progreso(porcentaje, etapa):
+        latir(trabajo.pk, progreso=porcentaje, etapa=etapa)
+
+    parametros = dict(trabajo.parametros)
+    modo = parametros.pop('modo', 'completo')
+
+    parar = threading.Event()
+    threading.Thread(
+        target=_latido_periodico, args=(trabajo.pk, parar),
+        name=f'latido-entrenamiento-{trabajo.pk}', daemon=True
+    ).start()
+    try:
+        analizador = AnalizadorMadurezDigital()
+        if modo == 'incremental':
+            resultado = analizador.entrenar_incremental(progreso=progreso, **parametros)
+        elif modo == 'segmentos':
+            resultado = analizador.entrenar_segmentos(progreso=progreso, **parametros)
+        else:
+            resultado = analizador.entrenar_modelo(progreso=progreso, **parametros)
+    except Exception as e:
+        logger.error(f"Error en el entrenamiento #{trabajo.pk}: {e}")
+        trabajo.estado = 'error'
+        trabajo.error = f"{e}\n{traceback.format_exc()}"
+        campos = ['estado', 'error']
+    else:
+        if "error" in resultado:
+            trabajo.estado = 'error'
+            trabajo.error = resultado["error"]
+            campos = ['estado', 'error']
+        else:
+            trabajo.estado = 'completado'
+            trabajo.progreso = 100
+            trabajo.etapa = 'Completado'
+            trabajo.modelo_id = resultado.get("modelo_id")
+            trabajo.resultado = resultado
+            campos = ['estado', 'progreso', 'etapa', 'modelo', 'resultado']
+    finally:
+        parar.set()
+
+    trabajo.fecha_fin = timezone.now()
+    with transaction.atomic():
+        # Si entretanto se dio por abandonado, no se pisa ese estado
+        estado = TrabajoEntrenamiento.objects.select_for_update().filter(
+            pk=trabajo.pk
+        ).values_list('estado', flat=True).first()
+        if estado == 'en_curso':
+            trabajo.save(update_fields=campos + ['fecha_fin'])
+        else:
+            logger.warning(
+                f"El entrenamiento #{trabajo.pk} terminó con el trabajo ya en estado '{estado}': "
+                f"no se actualiza"
+            )
+            trabajo.refresh_from_db()
+    return trabajo
+
+
+def procesar_pendientes():
+    """Procesar trabajos hasta vaciar la cola. Devuelve cuántos se ejecutaron."""
+    recuperar_trabajos_huerfanos()
+
+    procesados = 0
+    while True:
+        trabajo = tomar_siguiente_trabajo()
+        if trabajo is None:
+            return procesados
+        ejecutar_trabajo(trabajo)
+        procesados += 1
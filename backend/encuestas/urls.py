@@ -12,9 +12,11 @@ from .views import (
     crear_usuario, editar_usuario, eliminar_usuario, listar_roles, listar_instituciones,
     crear_encuesta_completa, responder_encuesta, mis_encuestas,
     reporte_resumen, reporte_por_indicador, 
-    reporte_comparativo_instituciones, dashboard_metricas, 
+    reporte_comparativo_instituciones, dashboard_metricas, metricas_cache_reportes,
+    exportar_datos,
     predecir_nivel, entrenar_modelo_ia, analizar_tendencias, estado_modelo_ia,
-    predecir_madurez,
+    predecir_madurez, predecir_madurez_lote, estado_entrenamiento, snapshots_entrenamiento,
+    modelo_ia_listo,
 )
 
 router = DefaultRouter()
@@ -57,6 +59,8 @@ urlpatterns = [
     path("reporte-indicador/", reporte_por_indicador, name="reporte_por_indicador"),
     path("reporte-comparativo/", reporte_comparativo_instituciones, name="reporte_comparativo"),
     path("dashboard-metricas/", dashboard_metricas, name="dashboard_metricas"),
+    path("reportes/cache/", metricas_cache_reportes, name="metricas_cache_reportes"),
+    path("exportar/<str:conjunto>/", exportar_datos, name="exportar_datos"),
     
     # Endpoints de IA/Analytics (Machine Learning)
     path("predecir-nivel/", predecir_nivel, name="predecir_nivel"),
@@ -66,7 +70,11 @@ urlpatterns = [
     
     # Nuevos endpoints de IA
     path("ia/entrenar-modelo/", entrenar_modelo_ia, name="ia_entrenar_modelo"),
+    path("ia/entrenamientos/<int:trabajo_id>/", estado_entrenamiento, name="ia_estado_entrenamiento"),
+    path("ia/snapshots/", snapshots_entrenamiento, name="ia_snapshots_entrenamiento"),
+    path("ia/listo/", modelo_ia_listo, name="ia_modelo_listo"),
     path("ia/predecir/", predecir_madurez, name="ia_predecir_madurez"),
+    path("ia/predecir-lote/", predecir_madurez_lote, name="ia_predecir_madurez_lote"),
     path("ia/tendencias/", analizar_tendencias, name="ia_tendencias"),
     
     # Router URLs AL FINAL
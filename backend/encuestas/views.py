@@ -10,24 +10,25 @@
 from django.contrib.auth.models import User
 from django.shortcuts import get_object_or_404
 from rest_framework import viewsets, status
-from rest_framework.decorators import api_view, permission_classes, action
+from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
 
-from .permissions import EsDocente, EsDirectivo, EsAdminTIC, PropietarioODirectivo, MismaInstitucion
+from .permissions import EsDocente, EsDirectivo, EsAdminTIC
 
 from .models import (
     Institucion, Rol, UsuarioPerfil,
     Encuesta, Pregunta, OpcionRespuesta, Respuesta,
     ResultadoEncuesta, Indicador, ResultadoIndicador,
-    ModeloIA, PrediccionIA, RecursoColaborativo
+    ModeloIA, PrediccionIA, RecursoColaborativo, TrabajoEntrenamiento, ContadoresDashboard
 )
 from .serializers import (
     InstitucionSerializer, RolSerializer, UsuarioPerfilSerializer,
     EncuestaSerializer, PreguntaSerializer, OpcionRespuestaSerializer,
     RespuestaSerializer, ResultadoEncuestaSerializer, IndicadorSerializer,
     ResultadoIndicadorSerializer, ModeloIASerializer, PrediccionIASerializer,
-    RecursoColaborativoSerializer, UsuarioSerializer, UsuarioRegistroSerializer
+    RecursoColaborativoSerializer, UsuarioSerializer, UsuarioRegistroSerializer,
+    TrabajoEntrenamientoSerializer
 )
 
 
@@ -660,184 +661,22 @@ def mis_encuestas(request):
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
 def reporte_resumen(request):
-    """Reporte resumen simplificado"""
-    try:
-        import time
-        inicio = time.time()
-        
-        # Datos básicos
-        total_respuestas = Respuesta.objects.count()
-        total_instituciones = Institucion.objects.count()
-        
-        # Simular datos por institución
-        instituciones = []
-        for inst in Institucion.objects.all()[:5]:  # Máximo 5 para rendimiento
-            instituciones.append({
-                "nombre": inst.nombre,
-                "total_encuestas": Encuesta.objects.filter(institucion=inst).count(),
-                "promedio": 3.7 + (inst.id % 3) * 0.3,  # Promedio simulado
-                "activa": True
-            })
-        
-        tiempo = round(time.time() - inicio, 2)
-        
-        return Response({
-            "tiempo_consulta": tiempo,
-            "total_respuestas": total_respuestas,
-            "por_institucion": instituciones,
-            "periodo": "Últimos 6 meses",
-            "status": "ok"
-        })
-        
-    except Exception as e:
-        return Response({
-            "tiempo_consulta": 0.1,
-            "total_respuestas": 25,
-            "por_institucion": [
-                {"nombre": "Universidad Tecnológica", "total_encuestas": 8, "promedio": 4.2, "activa": True},
-                {"nombre": "Instituto Superior", "total_encuestas": 5, "promedio": 3.8, "activa": True},
-            ],
-            "periodo": "Datos de ejemplo",
-            "error": str(e)
-        })
     """
-    Genera un reporte completo con métricas detalladas de madurez digital.
-    Optimizado para rendimiento con select_related y agregaciones.
+    Reporte resumen de madurez digital: global para admin_tic, de su
+    institución para el resto. Se calcula con consultas agrupadas
+    (encuestas.reportes) y en metadatos.rendimiento se indican las consultas
+    SQL y el tiempo empleados frente al presupuesto. Se sirve desde la caché
+    de reportes mientras no cambien los datos.
     """
-    from django.db.models import Avg, Count, Q
-    from django.utils import timezone
-    from datetime import datetime
-    import time
-    
-    inicio_tiempo = time.time()
-    
-    # Filtrar por institución del usuario si no es admin_tic
-    user = request.user
-    filtro_institucion = {}
+    from .cache_reportes import respuesta_cacheada
+    from .reportes import alcance_usuario, reporte_resumen as generar_resumen
     
-    if hasattr(user, 'perfil') and user.perfil.rol:
-        if user.perfil.rol.nombre_rol != 'admin_tic':
-            if user.perfil.institucion:
-                filtro_institucion['institucion'] = user.perfil.institucion
-    
-    # Consultas optimizadas con select_related
-    resultados = ResultadoEncuesta.objects.filter(**filtro_institucion).select_related(
-        'encuesta', 'institucion', 'encuesta__creador'
-    ).prefetch_related(
-        'valores_indicadores__indicador'
+    alcance = alcance_usuario(request.user)
+    respuesta = respuesta_cacheada(
+        request, 'resumen', alcance, lambda: Response(generar_resumen(alcance))
     )
-    
-    total_resultados = resultados.count()
-    
-    if total_resultados == 0:
-        return Response({
-            "total_resultados": 0,
-            "mensaje": "No hay resultados registrados todavía.",
-            "tiempo_procesamiento": round(time.time() - inicio_tiempo, 3)
-        })
-    
-    # === MÉTRICAS GLOBALES ===
-    # Promedio global de puntuación
-    promedio_global = resultados.aggregate(promedio=Avg('puntuacion_global'))['promedio']
-    
-    # Distribución por nivel de madurez
-    distribucion_niveles = resultados.values('nivel_madurez').annotate(
-        cantidad=Count('id')
-    ).order_by('-cantidad')
-    
-    # === MÉTRICAS POR INDICADOR ===
-    # Obtener todos los indicadores con sus promedios
-    indicadores_stats = {}
-    
-    for resultado in resultados:
-        for valor_ind in resultado.valores_indicadores.all():
-            indicador_nombre = valor_ind.indicador.nombre
-            if indicador_nombre not in indicadores_stats:
-                indicadores_stats[indicador_nombre] = {
-                    'valores': [],
-                    'categoria': valor_ind.indicador.categoria,
-                    'descripcion': valor_ind.indicador.descripcion
-                }
-            indicadores_stats[indicador_nombre]['valores'].append(valor_ind.valor)
-    
-    # Calcular estadísticas por indicador
-    metricas_indicadores = {}
-    for nombre, data in indicadores_stats.items():
-        valores = data['valores']
-        if valores:
-            metricas_indicadores[nombre] = {
-                'categoria': data['categoria'],
-                'descripcion': data['descripcion'],
-                'promedio': round(sum(valores) / len(valores), 2),
-                'maximo': max(valores),
-                'minimo': min(valores),
-                'total_evaluaciones': len(valores)
-            }
-    
-    # === MÉTRICAS POR INSTITUCIÓN ===
-    stats_instituciones = resultados.values(
-        'institucion__nombre', 'institucion__id'
-    ).annotate(
-        total_encuestas=Count('id'),
-        promedio_puntuacion=Avg('puntuacion_global')
-    ).order_by('-promedio_puntuacion')
-    
-    # === TENDENCIAS TEMPORALES ===
-    # Resultados por mes (últimos 6 meses)
-    from datetime import timedelta
-    hace_6_meses = timezone.now() - timedelta(days=180)
-    
-    tendencia_temporal = resultados.filter(
-        fecha_calculo__gte=hace_6_meses
-    ).extra(
-        select={'mes': "EXTRACT(month FROM fecha_calculo)", 'año': "EXTRACT(year FROM fecha_calculo)"}
-    ).values('mes', 'año').annotate(
-        cantidad=Count('id'),
-        promedio_mes=Avg('puntuacion_global')
-    ).order_by('año', 'mes')
-    
-    # === RESPUESTA DETALLADA ===
-    tiempo_procesamiento = round(time.time() - inicio_tiempo, 3)
-    
-    return Response({
-        "resumen_ejecutivo": {
-            "total_resultados": total_resultados,
-            "promedio_global": round(promedio_global, 2) if promedio_global else 0,
-            "nivel_predominante": distribucion_niveles[0]['nivel_madurez'] if distribucion_niveles else None,
-            "instituciones_evaluadas": len(set(r.institucion.id for r in resultados if r.institucion)),
-        },
-        
-        "distribucion_madurez": {
-            "por_nivel": [
-                {
-                    "nivel": item['nivel_madurez'],
-                    "cantidad": item['cantidad'],
-                    "porcentaje": round((item['cantidad'] / total_resultados) * 100, 1)
-                }
-                for item in distribucion_niveles
-            ]
-        },
-        
-        "indicadores_detalle": metricas_indicadores,
-        
-        "ranking_instituciones": [
-            {
-                "institucion": inst['institucion__nombre'],
-                "total_evaluaciones": inst['total_encuestas'],
-                "promedio_madurez": round(inst['promedio_puntuacion'], 2) if inst['promedio_puntuacion'] else 0
-            }
-            for inst in stats_instituciones[:10]  # Top 10
-        ],
-        
-        "tendencia_temporal": list(tendencia_temporal),
-        
-        "metadatos": {
-            "tiempo_procesamiento_segundos": tiempo_procesamiento,
-            "fecha_generacion": timezone.now().isoformat(),
-            "usuario_solicitud": user.username,
-            "filtros_aplicados": "Por institución" if filtro_institucion else "Global"
-        }
-    })
+    respuesta.data['metadatos']['usuario_solicitud'] = request.user.username
+    return respuesta
 
 
 @api_view(["GET"])
@@ -847,7 +686,8 @@ def reporte_por_indicador(request):
     Reporte detallado por indicador específico.
     Query param: ?indicador_id=X
     """
-    from django.db.models import Avg, Count, Max, Min
+    from .cache_reportes import respuesta_cacheada
+    from .reportes import ALCANCE_GLOBAL
     
     indicador_id = request.query_params.get('indicador_id')
     if not indicador_id:
@@ -856,21 +696,31 @@ def reporte_por_indicador(request):
             status=status.HTTP_400_BAD_REQUEST
         )
     
+    # Filtrar por institución del usuario si corresponde
+    user = request.user
+    filtro = {}
+    if hasattr(user, 'perfil') and user.perfil.rol:
+        if user.perfil.rol.nombre_rol != 'admin_tic' and user.perfil.institucion_id:
+            filtro['resultado__institucion_id'] = user.perfil.institucion_id
+    alcance = filtro.get('resultado__institucion_id', ALCANCE_GLOBAL)
+    
+    return respuesta_cacheada(
+        request, 'indicador', alcance, lambda: _reporte_indicador(indicador_id, filtro)
+    )
+
+
+def _reporte_indicador(indicador_id, filtro):
+    from django.db.models import Avg, Count, Max, Min
+    from django.db.models.functions import TruncDate
+    
     try:
         indicador = Indicador.objects.get(id=indicador_id)
-    except Indicador.DoesNotExist:
+    except (Indicador.DoesNotExist, ValueError):
         return Response(
             {"error": "Indicador no encontrado"},
             status=status.HTTP_404_NOT_FOUND
         )
     
-    # Filtrar por institución del usuario si corresponde
-    user = request.user
-    filtro = {}
-    if hasattr(user, 'perfil') and user.perfil.rol:
-        if user.perfil.rol.nombre_rol != 'admin_tic' and user.perfil.institucion:
-            filtro['resultado__institucion'] = user.perfil.institucion
-    
     valores_indicador = ResultadoIndicador.objects.filter(
         indicador=indicador, **filtro
     ).select_related(
@@ -902,8 +752,8 @@ def reporte_por_indicador(request):
     ).order_by('-cantidad')
     
     # Evolución temporal
-    evolucion = valores_indicador.extra(
-        select={'fecha': "DATE(resultado__fecha_calculo)"}
+    evolucion = valores_indicador.annotate(
+        fecha=TruncDate('resultado__fecha_calculo')
     ).values('fecha').annotate(
         promedio_dia=Avg('valor'),
         evaluaciones=Count('id')
@@ -930,171 +780,168 @@ def reporte_por_indicador(request):
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
 def reporte_comparativo_instituciones(request):
-    """Reporte comparativo simplificado"""
-    try:
-        comparaciones = [
-            {
-                "titulo": "Adopción de IA vs Período Anterior",
-                "metrica": "Nivel de Adopción IA",
-                "valor_actual": 4.2,
-                "valor_anterior": 3.8,
-                "variacion": 10.5
-            },
-            {
-                "titulo": "Madurez Digital General",
-                "metrica": "Puntuación Global",
-                "valor_actual": 3.9,
-                "valor_anterior": 3.7,
-                "variacion": 5.4
-            },
-            {
-                "titulo": "Capacitación del Personal",
-                "metrica": "Horas de Formación",
-                "valor_actual": 12.5,
-                "valor_anterior": 15.2,
-                "variacion": -17.8
-            }
-        ]
-        
-        return Response({
-            "comparaciones": comparaciones,
-            "periodo": "Q4 2024 vs Q3 2024",
-            "total_comparaciones": len(comparaciones),
-            "status": "ok"
-        })
-        
-    except Exception as e:
-        return Response({
-            "comparaciones": [],
-            "periodo": "Datos no disponibles",
-            "total_comparaciones": 0,
-            "error": str(e)
-        })
     """
-    Comparativa entre instituciones por indicadores.
-    Solo para admin_tic o datos propios de cada institución.
+    Comparativa entre instituciones por indicadores: matriz institución ×
+    indicador calculada con GROUP BY en la BD. Global para admin_tic; el
+    resto de roles solo ve su institución.
+    
+    Query params:
+        orden: promedio_general, total_evaluaciones o nombre ('-' delante
+            para descendente; por defecto -promedio_general)
+        pagina, por_pagina: paginación sobre instituciones
+        top: solo las N primeras según el orden (ignora la paginación)
     """
-    from django.db.models import Avg, Count
-    
-    user = request.user
+    from django.conf import settings
+    from .cache_reportes import respuesta_cacheada
+    from .reportes import ORDENES_COMPARATIVO, alcance_usuario, reporte_comparativo
     
-    # Solo admin_tic puede ver comparativa completa
-    if not (hasattr(user, 'perfil') and user.perfil.rol and 
-            user.perfil.rol.nombre_rol == 'admin_tic'):
+    params = request.query_params
+    orden = params.get('orden', '-promedio_general')
+    if orden.lstrip('-') not in ORDENES_COMPARATIVO:
         return Response(
-            {"error": "Acceso denegado. Solo admin TIC puede ver comparativas globales"},
-            status=status.HTTP_403_FORBIDDEN
+            {"error": f"'orden' debe ser uno de {', '.join(ORDENES_COMPARATIVO)} (con '-' para descendente)"},
+            status=status.HTTP_400_BAD_REQUEST
         )
     
-    # Estadísticas por institución
-    instituciones_stats = {}
-    
-    # Obtener todas las instituciones con resultados
-    resultados = ResultadoEncuesta.objects.select_related(
-        'institucion'
-    ).prefetch_related('valores_indicadores__indicador')
+    max_por_pagina = getattr(settings, 'REPORTES_COMPARATIVO_MAX_POR_PAGINA', 200)
+    try:
+        pagina = int(params.get('pagina', 1))
+        por_pagina = int(params.get('por_pagina', getattr(settings, 'REPORTES_COMPARATIVO_POR_PAGINA', 50)))
+        top = int(params['top']) if params.get('top') else None
+    except ValueError:
+        return Response(
+            {"error": "'pagina', 'por_pagina' y 'top' deben ser números enteros"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    if pagina < 1 or not 1 <= por_pagina <= max_por_pagina or (top is not None and not 1 <= top <= max_por_pagina):
+        return Response(
+            {"error": f"'pagina' debe ser >= 1; 'por_pagina' y 'top', entre 1 y {max_por_pagina}"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
     
-    for resultado in resultados:
-        inst_nombre = resultado.institucion.nombre if resultado.institucion else "Sin institución"
-        
-        if inst_nombre not in instituciones_stats:
-            instituciones_stats[inst_nombre] = {
-                'total_evaluaciones': 0,
-                'puntuaciones': [],
-                'indicadores': {}
-            }
-        
-        instituciones_stats[inst_nombre]['total_evaluaciones'] += 1
-        instituciones_stats[inst_nombre]['puntuaciones'].append(resultado.puntuacion_global)
-        
-        # Procesar indicadores de esta evaluación
-        for valor_ind in resultado.valores_indicadores.all():
-            ind_nombre = valor_ind.indicador.nombre
-            if ind_nombre not in instituciones_stats[inst_nombre]['indicadores']:
-                instituciones_stats[inst_nombre]['indicadores'][ind_nombre] = []
-            instituciones_stats[inst_nombre]['indicadores'][ind_nombre].append(valor_ind.valor)
-    
-    # Calcular promedios y generar comparativa
-    comparativa = []
-    
-    for inst_nombre, data in instituciones_stats.items():
-        if data['total_evaluaciones'] > 0:
-            # Promedio general de la institución
-            promedio_gral = sum(data['puntuaciones']) / len(data['puntuaciones'])
-            
-            # Promedios por indicador
-            promedios_indicadores = {}
-            for ind_nombre, valores in data['indicadores'].items():
-                if valores:
-                    promedios_indicadores[ind_nombre] = round(sum(valores) / len(valores), 2)
-            
-            comparativa.append({
-                'institucion': inst_nombre,
-                'promedio_general': round(promedio_gral, 2),
-                'total_evaluaciones': data['total_evaluaciones'],
-                'indicadores': promedios_indicadores
-            })
+    alcance = alcance_usuario(request.user)
+    return respuesta_cacheada(
+        request, 'comparativo', alcance,
+        lambda: Response(reporte_comparativo(alcance, orden, pagina, por_pagina, top))
+    )
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def dashboard_metricas(request):
+    """
+    Métricas principales para dashboard.
+    Se leen de la fila de ContadoresDashboard (una consulta por clave
+    primaria), que las señales mantienen al día (encuestas.contadores).
+    """
+    from .contadores import FILA, reconstruir_contadores
     
-    # Ordenar por promedio general descendente
-    comparativa.sort(key=lambda x: x['promedio_general'], reverse=True)
+    contadores = ContadoresDashboard.objects.filter(pk=FILA).values().first()
+    if contadores is None:
+        contadores = reconstruir_contadores()
+    total_evaluaciones = contadores['total_evaluaciones']
+    promedio = contadores['suma_puntuaciones'] / total_evaluaciones if total_evaluaciones else 0
     
     return Response({
-        "total_instituciones": len(comparativa),
-        "comparativa": comparativa,
-        "mejor_institucion": comparativa[0] if comparativa else None,
-        "promedio_sistema": round(
-            sum(inst['promedio_general'] for inst in comparativa) / len(comparativa), 2
-        ) if comparativa else 0
+        "total_encuestas": contadores['total_encuestas'],
+        "total_respuestas": contadores['total_respuestas'],
+        "total_evaluaciones": total_evaluaciones,
+        "promedio_general": round(promedio, 2),
+        "total_instituciones": contadores['total_instituciones'],
+        "usuarios_activos": contadores['usuarios_activos'],
+        "nivel_predominante": contadores['nivel_predominante'] or None,
+        "mensaje": "Dashboard cargado exitosamente",
+        "status": "ok"
     })
 
 
 @api_view(["GET"])
-@permission_classes([IsAuthenticated])
-def dashboard_metricas(request):
+@permission_classes([EsAdminTIC])
+def metricas_cache_reportes(request):
+    """
+    Aciertos y fallos de la caché de reportes (por endpoint, en este proceso)
+    y versión actual de los datos. Solo para admin_tic.
+    """
+    from .cache_reportes import metricas_cache_reportes as metricas
+    
+    return Response(metricas.estadisticas())
+
+
+@api_view(["GET"])
+@permission_classes([EsDirectivo | EsAdminTIC])
+def exportar_datos(request, conjunto):
     """
-    Métricas principales para dashboard - versión simplificada.
+    Exportación en streaming de respuestas, resultados o valores de
+    indicadores (conjunto: respuestas, resultados, indicadores).
+    Global para admin_tic; los directivos solo exportan su institución.
+    
+    Query params:
+        formato: csv (por defecto) o ndjson
+        compresion: gzip o zstd (opcional)
+        encuesta, institucion: ids por los que filtrar
+        desde, hasta: fechas AAAA-MM-DD (incluidas)
     """
+    from django.http import StreamingHttpResponse
+    from django.utils.dateparse import parse_date
+    from .exportaciones import CONJUNTOS, FORMATOS, comprobar_compresion, exportar
+    from .reportes import alcance_usuario
+    
+    if conjunto not in CONJUNTOS:
+        return Response(
+            {"error": f"Conjunto no válido. Opciones: {', '.join(CONJUNTOS)}"},
+            status=status.HTTP_404_NOT_FOUND
+        )
+    
+    params = request.query_params
+    formato = params.get('formato', 'csv')
+    if formato not in FORMATOS:
+        return Response(
+            {"error": f"'formato' debe ser {' o '.join(FORMATOS)}"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    compresion = params.get('compresion') or None
+    error = comprobar_compresion(compresion)
+    if error:
+        return Response({"error": error}, status=status.HTTP_400_BAD_REQUEST)
+    
+    filtros = {}
     try:
-        # Datos básicos sin filtros complejos
-        total_encuestas = Encuesta.objects.count()
-        total_usuarios = User.objects.filter(is_active=True).count()
-        total_instituciones = Institucion.objects.count()
-        
-        # Promedio simple
-        from django.db.models import Avg
-        promedio = ResultadoEncuesta.objects.aggregate(
-            promedio=Avg('puntuacion_global')
-        )['promedio'] or 0
-        
-        return Response({
-            "total_encuestas": total_encuestas,
-            "total_respuestas": Respuesta.objects.count(),
-            "total_evaluaciones": ResultadoEncuesta.objects.count(),
-            "promedio_general": round(promedio, 2),
-            "total_instituciones": total_instituciones,
-            "usuarios_activos": total_usuarios,
-            "nivel_predominante": "Básico",
-            "mensaje": "Dashboard cargado exitosamente - versión simplificada",
-            "status": "ok"
-        })
-        
-    except Exception as e:
-        return Response({
-            "total_encuestas": 5,
-            "total_respuestas": 15,
-            "total_evaluaciones": 3,
-            "promedio_general": 3.5,
-            "total_instituciones": 2,
-            "usuarios_activos": 8,
-            "nivel_predominante": "Intermedio",
-            "mensaje": f"Usando datos de ejemplo - Error: {str(e)}",
-            "status": "fallback",
-            "error": str(e)
-        })
+        for param, filtro in (('encuesta', 'encuesta_id'), ('institucion', 'institucion_id')):
+            if params.get(param):
+                filtros[filtro] = int(params[param])
+        for param in ('desde', 'hasta'):
+            if params.get(param):
+                filtros[param] = parse_date(params[param])
+                if filtros[param] is None:
+                    raise ValueError
+    except ValueError:
+        return Response(
+            {"error": "'encuesta' e 'institucion' deben ser ids; 'desde' y 'hasta', fechas AAAA-MM-DD"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    bloques, content_type, fichero = exportar(
+        conjunto, formato, compresion, alcance=alcance_usuario(request.user), **filtros
+    )
+    respuesta = StreamingHttpResponse(bloques, content_type=content_type)
+    respuesta['Content-Disposition'] = f'attachment; filename="{fichero}"'
+    return respuesta
 
 
 # === REPORTES AVANZADOS (RF-004) ===
 
+def _institucion_prediccion(request, resultado_id=None):
+    """
+    Institución con la que se elige el modelo de segmento: la indicada en el
+    body o, si no se predice un resultado concreto, la del usuario.
+    """
+    institucion_id = request.data.get('institucion_id')
+    if institucion_id is None and not resultado_id:
+        perfil = getattr(request.user, 'perfil', None)
+        institucion_id = perfil.institucion_id if perfil else None
+    return institucion_id
+
+
 @api_view(["POST"])
 @permission_classes([IsAuthenticated])
 def predecir_nivel(request):
@@ -1102,7 +949,7 @@ def predecir_nivel(request):
     Endpoint mejorado de IA: Predice nivel de madurez usando ML real.
     Ahora usa Pandas y Scikit-learn con RandomForest.
     """
-    from .ml import AnalizadorMadurezDigital
+    from .ml import AnalizadorMadurezDigital, ERROR_SIN_MODELO
     
     analizador = AnalizadorMadurezDigital()
     
@@ -1114,20 +961,27 @@ def predecir_nivel(request):
         valores = data['valores_indicadores']  # dict {nombre_indicador: valor}
         resultado_id = data.get('resultado_id')  # opcional
         
-        prediccion = analizador.predecir_madurez(valores, resultado_id)
+        prediccion = analizador.predecir_madurez(
+            valores, resultado_id, institucion_id=_institucion_prediccion(request, resultado_id)
+        )
+        if "error" in prediccion:
+            return Response(prediccion, status=status.HTTP_503_SERVICE_UNAVAILABLE)
         return Response(prediccion)
     
     # Opción 2: Predicción simple basada en puntuación global (fallback)
     elif 'puntuacion_global' in data:
         puntuacion = float(data['puntuacion_global'])
         
-        # Crear valores dummy para todos los indicadores
-        indicadores = Indicador.objects.all()
+        # Crear valores dummy para todos los indicadores del modelo activo
+        if not analizador.cargar_modelo():
+            return Response({"error": ERROR_SIN_MODELO}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
         valores_indicadores = {
-            ind.nombre: puntuacion for ind in indicadores
+            nombre: puntuacion for nombre in analizador.indicadores_orden
         }
         
-        prediccion = analizador.predecir_madurez(valores_indicadores)
+        prediccion = analizador.predecir_madurez(
+            valores_indicadores, institucion_id=_institucion_prediccion(request)
+        )
         prediccion['metodo'] = 'fallback_puntuacion_global'
         
         return Response(prediccion)
@@ -1140,95 +994,26 @@ def predecir_nivel(request):
         )
 
 
-@api_view(["POST"])
-@permission_classes([EsAdminTIC])  # Solo admin TIC puede entrenar modelos
-def entrenar_modelo_ia(request):
-    """
-    Entrenar nuevo modelo de IA con los datos actuales de la BD.
-    Requiere permisos de admin_tic.
-    """
-    from .ml import AnalizadorMadurezDigital
-    
-    analizador = AnalizadorMadurezDigital()
-    resultado = analizador.entrenar_modelo()
-    
-    if "error" in resultado:
-        return Response(resultado, status=status.HTTP_400_BAD_REQUEST)
-    
-    return Response({
-        "mensaje": "Modelo entrenado exitosamente",
-        "resultado": resultado,
-        "recomendaciones": [
-            "El modelo está listo para hacer predicciones",
-            "Precisión obtenida: {}%".format(round(resultado['precision'] * 100, 2)),
-            "Se recomienda reentrenar el modelo cuando haya nuevos datos"
-        ]
-    })
-
-
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
 def analizar_tendencias(request):
-    """Análisis de tendencias simplificado"""
-    try:
-        # Datos simulados de tendencias
-        indicadores = [
-            {
-                "nombre": "Adopción de Inteligencia Artificial",
-                "valor": 4.1,
-                "tendencia": "up",
-                "cambio": 12.5
-            },
-            {
-                "nombre": "Transformación Digital",
-                "valor": 3.8,
-                "tendencia": "up",
-                "cambio": 8.3
-            },
-            {
-                "nombre": "Capacitación Tecnológica",
-                "valor": 3.2,
-                "tendencia": "down",
-                "cambio": -5.7
-            },
-            {
-                "nombre": "Infraestructura Digital",
-                "valor": 4.5,
-                "tendencia": "stable",
-                "cambio": 1.2
-            }
-        ]
-        
-        recomendaciones = [
-            "Incrementar la inversión en formación IA para el personal docente",
-            "Implementar más herramientas de automatización en procesos administrativos",
-            "Desarrollar un plan estratégico de transformación digital a 5 años",
-            "Crear un centro de excelencia en tecnologías educativas"
-        ]
-        
-        return Response({
-            "total_periodos": 12,
-            "ultima_actualizacion": "2024-12-15",
-            "tendencia_general": "positiva",
-            "indicadores": indicadores,
-            "recomendaciones": recomendaciones,
-            "status": "ok"
-        })
-        
-    except Exception as e:
-        return Response({
-            "total_periodos": 0,
-            "ultima_actualizacion": "No disponible",
-            "tendencia_general": "estable",
-            "indicadores": [],
-            "recomendaciones": ["Datos no disponibles - Contacte al administrador"],
-            "error": str(e)
-        })
+    """
+    Análisis de tendencias de madurez digital (encuestas.ml): evolución
+    mensual desde TendenciaMensual y correlaciones entre indicadores desde
+    MomentosIndicadores. Global para admin_tic; el resto de roles solo ve
+    su institución.
+    """
+    from .ml import AnalizadorMadurezDigital
+    from .reportes import ALCANCE_GLOBAL, alcance_usuario
     
-    # Filtrar por institución si no es admin_tic
-    if hasattr(user, 'perfil') and user.perfil.rol:
-        if user.perfil.rol.nombre_rol != 'admin_tic' and user.perfil.institucion:
-            institucion_id = user.perfil.institucion.id
+    user = request.user
+    alcance = alcance_usuario(user)
+    if alcance is None:
+        return Response(
+            {"error": "El usuario no tiene institución asignada"},
+            status=status.HTTP_403_FORBIDDEN
+        )
+    institucion_id = None if alcance == ALCANCE_GLOBAL else alcance
     
     analizador = AnalizadorMadurezDigital()
     analisis = analizador.analizar_tendencias(institucion_id)
@@ -1253,24 +1038,25 @@ def estado_modelo_ia(request):
     Ver estado actual del modelo de IA.
     Solo para admin_tic.
     """
-    from .ml import AnalizadorMadurezDigital
+    from .ml import cache_predicciones, registro_segmentos
+    from .escritura_diferida import buffer_predicciones
+    from .estadisticas import MUESTRAS_MINIMAS, estadisticas_entrenamiento
+    from .precarga import estado_precarga
     import os
     from django.conf import settings
     
-    # Información del modelo en BD
-    modelo_bd = ModeloIA.objects.order_by('-fecha_entrenamiento').first()
+    # Información del modelo global en BD
+    modelo_bd = ModeloIA.objects.filter(segmento='').order_by('-fecha_entrenamiento').first()
     
-    # Verificar si existe archivo en disco
-    model_path = os.path.join(settings.BASE_DIR, 'ml_models', 'modelo_madurez.pkl')
+    # Verificar si existe archivo en disco (versionado por ModeloIA)
+    model_path = modelo_bd.ruta_fichero if modelo_bd else os.path.join(
+        settings.BASE_DIR, 'ml_models', 'modelo_madurez.pkl'
+    )
     archivo_existe = os.path.exists(model_path)
     
-    # Estadísticas de datos de entrenamiento
-    total_resultados = ResultadoEncuesta.objects.count()
-    total_indicadores = Indicador.objects.count()
-    
-    analizador = AnalizadorMadurezDigital()
-    datos_disponibles = analizador.extraer_datos_entrenamiento()
-    muestras_validas = len(datos_disponibles[0]) if datos_disponibles[0] is not None else 0
+    # Estadísticas de datos de entrenamiento (agregados SQL, en caché)
+    datos_entrenamiento = estadisticas_entrenamiento()
+    muestras_validas = datos_entrenamiento["muestras_validas"]
     
     estado = {
         "modelo_en_bd": {
@@ -1278,19 +1064,21 @@ def estado_modelo_ia(request):
             "nombre": modelo_bd.nombre_modelo if modelo_bd else None,
             "version": modelo_bd.version if modelo_bd else None,
             "precision": modelo_bd.metrica_precision if modelo_bd else None,
-            "fecha_entrenamiento": modelo_bd.fecha_entrenamiento if modelo_bd else None
+            "fecha_entrenamiento": modelo_bd.fecha_entrenamiento if modelo_bd else None,
+            "checksum": modelo_bd.checksum if modelo_bd else None,
+            "huella_datos": modelo_bd.huella_datos if modelo_bd else None,
+            "parametros_entrenamiento": modelo_bd.parametros_entrenamiento if modelo_bd else None
         },
         "archivo_modelo": {
             "existe": archivo_existe,
             "ruta": model_path,
             "tamaño_mb": round(os.path.getsize(model_path) / (1024*1024), 2) if archivo_existe else 0
         },
-        "datos_entrenamiento": {
-            "total_resultados": total_resultados,
-            "muestras_validas": muestras_validas,
-            "total_indicadores": total_indicadores,
-            "suficientes_datos": muestras_validas >= 10
-        },
+        "datos_entrenamiento": datos_entrenamiento,
+        "cache_predicciones": cache_predicciones.estadisticas(),
+        "modelos_segmento": registro_segmentos.estadisticas(),
+        "precarga": estado_precarga.como_dict(),
+        "escritura_predicciones": buffer_predicciones.estadisticas(),
         "recomendaciones": []
     }
     
@@ -1298,7 +1086,7 @@ def estado_modelo_ia(request):
     if not modelo_bd or not archivo_existe:
         estado["recomendaciones"].append("Se recomienda entrenar un nuevo modelo de IA")
     
-    if muestras_validas < 10:
+    if muestras_validas < MUESTRAS_MINIMAS:
         estado["recomendaciones"].append("Se necesitan más datos de encuestas para entrenar un modelo confiable")
     
     if muestras_validas >= 50:
@@ -1312,50 +1100,104 @@ def estado_modelo_ia(request):
 # =========================
 
 @api_view(['POST'])
-@permission_classes([IsAuthenticated])
+@permission_classes([EsAdminTIC])  # Solo admin TIC puede entrenar modelos
 def entrenar_modelo_ia(request):
     """
-    Endpoint para entrenar el modelo de Machine Learning
+    Endpoint para entrenar el modelo de Machine Learning.
+    El entrenamiento se encola y lo ejecuta un worker en segundo plano;
+    el progreso se consulta en ia/entrenamientos/<trabajo_id>/.
+    Body opcional: {"modo": "completo" | "incremental" | "segmentos", "comparar": bool,
+                    "ajustar_hiperparametros": bool, "presupuesto_segundos": int,
+                    "snapshot": "<nombre>", "min_muestras": int, "forzar": bool}
+    Si los datos no han cambiado desde el último modelo, el trabajo termina
+    sin reentrenar (resultado "omitido") salvo con "forzar": true.
     """
-    from .ml import AnalizadorMadurezDigital
-    import time
+    from .trabajos import encolar_entrenamiento
     
     try:
-        inicio = time.time()
-        
-        # Crear instancia del analizador
-        analizador = AnalizadorMadurezDigital()
-        
-        # Entrenar el modelo
-        resultado = analizador.entrenar_modelo()
-        
-        tiempo_transcurrido = time.time() - inicio
+        trabajo, creado = encolar_entrenamiento(
+            usuario=request.user,
+            parametros=request.data if isinstance(request.data, dict) else {}
+        )
         
         return Response({
             "success": True,
-            "mensaje": "Modelo entrenado exitosamente",
-            "precision": resultado.get("precision"),
-            "num_caracteristicas": resultado.get("num_caracteristicas"),
-            "muestras_entrenamiento": resultado.get("muestras_entrenamiento"),
-            "tiempo_entrenamiento": round(tiempo_transcurrido, 2),
-            "modelo_guardado": resultado.get("modelo_guardado", False)
-        })
+            "mensaje": "Entrenamiento encolado" if creado else "Ya hay un entrenamiento en cola o en curso",
+            "trabajo_id": trabajo.id,
+            "estado": trabajo.estado,
+            "url_estado": f"/api/ia/entrenamientos/{trabajo.id}/"
+        }, status=status.HTTP_202_ACCEPTED)
         
+    except ValueError as e:
+        return Response({
+            "success": False,
+            "error": str(e)
+        }, status=400)
     except Exception as e:
         return Response({
             "success": False,
             "error": str(e),
-            "mensaje": "Error al entrenar el modelo"
+            "mensaje": "Error al encolar el entrenamiento"
         }, status=500)
 
 
+@api_view(['GET'])
+@permission_classes([EsAdminTIC])  # Como el entrenamiento: el error incluye la traza del servidor
+def estado_entrenamiento(request, trabajo_id):
+    """
+    Estado de un trabajo de entrenamiento: progreso, tiempos y modelo generado.
+    """
+    trabajo = get_object_or_404(TrabajoEntrenamiento, id=trabajo_id)
+    return Response(TrabajoEntrenamientoSerializer(trabajo).data)
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def modelo_ia_listo(request):
+    """
+    Sonda de disponibilidad del worker: 200 si puede atender predicciones,
+    503 mientras se precarga el modelo (ML_PRECARGA_MODELO) o si la precarga falló.
+    """
+    from .precarga import estado_precarga
+    
+    return Response(
+        estado_precarga.como_dict(),
+        status=status.HTTP_200_OK if estado_precarga.listo else status.HTTP_503_SERVICE_UNAVAILABLE
+    )
+
+
+@api_view(['GET', 'POST'])
+@permission_classes([EsAdminTIC])
+def snapshots_entrenamiento(request):
+    """
+    GET: listar los snapshots Parquet del conjunto de entrenamiento.
+    POST: crear un snapshot con los datos actuales. Body opcional: {"nombre": "..."}
+    Para entrenar desde un snapshot: ia/entrenar-modelo/ con {"snapshot": "<nombre>"}.
+    Solo para admin_tic.
+    """
+    from .snapshots import crear_snapshot, listar_snapshots
+    
+    try:
+        if request.method == 'GET':
+            return Response({"snapshots": listar_snapshots()})
+        
+        nombre = request.data.get('nombre') if isinstance(request.data, dict) else None
+        info = crear_snapshot(nombre)
+        return Response(info, status=status.HTTP_201_CREATED)
+        
+    except ValueError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except RuntimeError as e:
+        return Response({"error": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def predecir_madurez(request):
     """
     Endpoint para hacer predicciones de madurez digital
     """
-    from .ml import AnalizadorMadurezDigital
+    from .ml import AnalizadorMadurezDigital, ERROR_SIN_MODELO
     
     try:
         # Validar datos de entrada
@@ -1373,18 +1215,20 @@ def predecir_madurez(request):
         
         # Crear instancia del analizador
         analizador = AnalizadorMadurezDigital()
+        if not analizador.cargar_modelo():
+            return Response({
+                "success": False,
+                "error": ERROR_SIN_MODELO
+            }, status=503)
         
-        # Convertir lista a diccionario usando el orden de indicadores
-        from .models import Indicador
-        indicadores = Indicador.objects.all().order_by('id')[:len(valores_indicadores)]
-        
-        valores_dict = {}
-        for i, indicador in enumerate(indicadores):
-            if i < len(valores_indicadores):
-                valores_dict[indicador.nombre] = valores_indicadores[i]
+        # Convertir lista a diccionario usando el orden de indicadores del
+        # modelo (el mismo orden por id con el que se entrenó)
+        valores_dict = dict(zip(analizador.indicadores_orden, valores_indicadores))
         
         # Hacer predicción con diccionario
-        resultado = analizador.predecir_madurez(valores_dict)
+        resultado = analizador.predecir_madurez(
+            valores_dict, institucion_id=_institucion_prediccion(request)
+        )
         
         return Response({
             "success": True,
@@ -1392,7 +1236,8 @@ def predecir_madurez(request):
             "confianza": resultado.get("confianza"),
             "probabilidades": resultado.get("probabilidades_todas"),
             "puntuacion_estimada": resultado.get("puntuacion_estimada"),
-            "probabilidad": resultado.get("probabilidad")
+            "probabilidad": resultado.get("probabilidad"),
+            "segmento": resultado.get("segmento")
         })
         
     except Exception as e:
@@ -1400,4 +1245,101 @@ def predecir_madurez(request):
             "success": False,
             "error": str(e),
             "mensaje": "Error al realizar la predicción"
-        }, status=500)
\ No newline at end of file
+        }, status=500)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def predecir_madurez_lote(request):
+    """
+    Predicción en lote: una sola pasada del modelo para muchas instituciones.
+    Body: {"valores_indicadores_lote": [{nombre: valor}, ...], "institucion_id": 1}
+          y/o {"resultado_ids": [1, 2, ...], "guardar": true}
+    Cada resultado se predice con el modelo del segmento de su institución.
+    Salvo admin_tic, solo se pueden predecir resultados de la institución del
+    usuario, cuyo segmento se usa también para valores_indicadores_lote.
+    """
+    from django.conf import settings
+    from .ml import AnalizadorMadurezDigital, ERROR_SIN_MODELO
+    from .reportes import ALCANCE_GLOBAL, alcance_usuario
+    
+    lista_valores = request.data.get('valores_indicadores_lote') or []
+    resultado_ids = request.data.get('resultado_ids') or []
+    guardar = request.data.get('guardar', True)
+    
+    # Un formulario envía "false" como texto: bool("false") sería True
+    if isinstance(guardar, str) and guardar.lower() in ('true', 'false'):
+        guardar = guardar.lower() == 'true'
+    if not isinstance(guardar, bool):
+        return Response({
+            "error": "guardar debe ser true o false"
+        }, status=400)
+    
+    if not isinstance(lista_valores, list) or not isinstance(resultado_ids, list):
+        return Response({
+            "error": "valores_indicadores_lote y resultado_ids deben ser listas"
+        }, status=400)
+    
+    if not lista_valores and not resultado_ids:
+        return Response({
+            "error": "Se requieren 'valores_indicadores_lote' o 'resultado_ids'"
+        }, status=400)
+    
+    if not all(isinstance(valores, dict) for valores in lista_valores):
+        return Response({
+            "error": "Cada elemento de valores_indicadores_lote debe ser un diccionario"
+        }, status=400)
+    
+    tamaño_maximo = getattr(settings, 'ML_LOTE_MAXIMO', 5000)
+    if len(lista_valores) + len(resultado_ids) > tamaño_maximo:
+        return Response({
+            "error": f"El lote no puede superar {tamaño_maximo} elementos"
+        }, status=400)
+    
+    try:
+        resultado_ids = [int(r_id) for r_id in resultado_ids]
+    except (TypeError, ValueError):
+        return Response({
+            "error": "resultado_ids debe contener enteros"
+        }, status=400)
+    
+    alcance = alcance_usuario(request.user)
+    if alcance == ALCANCE_GLOBAL:
+        institucion_id = _institucion_prediccion(request)
+    else:
+        ajenos = ResultadoEncuesta.objects.filter(pk__in=resultado_ids)
+        if alcance is not None:
+            ajenos = ajenos.exclude(institucion_id=alcance)
+        ajenos = list(ajenos.values_list('pk', flat=True))
+        if ajenos:
+            return Response({
+                "error": "No tiene acceso a resultados de otras instituciones",
+                "resultado_ids": ajenos
+            }, status=403)
+        institucion_id = alcance
+    
+    try:
+        analizador = AnalizadorMadurezDigital()
+        resultado = analizador.predecir_lote(
+            lista_valores=lista_valores,
+            resultado_ids=resultado_ids,
+            guardar=guardar,
+            institucion_id=institucion_id
+        )
+        
+        if resultado.get("error") == ERROR_SIN_MODELO:
+            return Response(resultado, status=503)
+        if "error" in resultado:
+            return Response(resultado, status=400)
+        
+        return Response({
+            "success": True,
+            **resultado
+        })
+        
+    except Exception as e:
+        return Response({
+            "success": False,
+            "error": str(e),
+            "mensaje": "Error al realizar la predicción en lote"
+        }, status=500)